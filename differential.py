@@ -0,0 +1,527 @@
+#!/usr/bin/python
+"""
+Differential testing of the parser. TopGenerator writes random but valid top output, covering the formats that
+the parser accepts, and DifferentialChecker parses it with the reference path (the general regexes, in this
+process) and with each of the faster paths, and reports any entry that they parse differently. A fast path can
+only be made the default once it agrees with the reference on a large number of generated files.
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import random
+import sys
+import tempfile
+
+from top_entry import TopEntry
+from top_parser import TopParser
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class TopGenerator(object):
+    """
+    Generates random top output in batch mode. Each file has one format for its date, cpu, memory and job lines,
+    picked at random, as a file written by one version of top does. Within a file the uptime crosses from minutes
+    to hours to days, so every uptime variant is seen, and the job layout may change between entries, as it does
+    when top is reconfigured.
+
+    Jobs have negative nice values, rt priorities, scaled memory values and commands with spaces, as well as the
+    plain values seen in most lines.
+    """
+
+    # The Cpu line formats: old top, procps-ng, and procps-ng run with -1 (one or two cpus per line)
+    CPU_OLD = 'old'
+    CPU_SUMMARY = 'summary'
+    CPU_PER_CPU = 'perCpu'
+    CPU_PAIRS = 'pairs'
+    CPU_FORMATS = (CPU_OLD, CPU_SUMMARY, CPU_PER_CPU, CPU_PAIRS)
+    CPU_LABELS = ('us', 'sy', 'ni', 'id', 'wa', 'hi', 'si', 'st')
+
+    # The Mem and Swap line formats: values with a k suffix, KiB with buffers, and procps-ng 3.3.10+ with
+    # buff/cache and avail Mem in KiB, MiB or GiB
+    MEM_OLD = 'old'
+    MEM_KIB = 'KiB'
+    MEM_NG_KIB = 'ngKiB'
+    MEM_NG_MIB = 'ngMiB'
+    MEM_NG_GIB = 'ngGiB'
+    MEM_FORMATS = (MEM_OLD, MEM_KIB, MEM_NG_KIB, MEM_NG_MIB, MEM_NG_GIB)
+
+    # Job layouts: top's default columns, and two configured with extra columns (see JobLayout)
+    LAYOUTS = (('PID', 'USER', 'PR', 'NI', 'VIRT', 'RES', 'SHR', 'S', '%CPU', '%MEM', 'TIME+', 'COMMAND'),
+               ('PID', 'PPID', 'USER', 'PR', 'NI', 'VIRT', 'RES', 'SHR', 'S', '%CPU', '%MEM', 'TIME+', 'nTH', 'P',
+                'COMMAND'),
+               ('PID', 'TGID', 'USER', 'PR', 'NI', 'VIRT', 'RES', 'SHR', 'SWAP', 'S', '%CPU', '%MEM', 'TIME+',
+                'COMMAND'))
+
+    # Column header -> width, values are right aligned except for USER and COMMAND
+    WIDTHS = {'PID': 5, 'PPID': 6, 'TGID': 6, 'USER': 9, 'PR': 3, 'NI': 3, 'VIRT': 7, 'RES': 6, 'SHR': 6,
+              'SWAP': 6, 'S': 1, '%CPU': 5, '%MEM': 4, 'TIME+': 9, 'nTH': 3, 'P': 2, 'COMMAND': 0}
+
+    USERS = ('root', 'dpinkney', 'postgres', 'systemd+', 'www-data', '_apt', 'user1000')
+    COMMANDS = ('Xorg', 'firefox', 'cinnamon', 'java', 'kworker/0:1', 'postgres: writer process',
+                'python top_parser.py query', '(sd-pam)', 'sshd: dpinkney@pts/0', 'Web Content',
+                'chrome --type=renderer --lang=en-US', 'migration/3', 'rcu_sched')
+    STATUSES = ('S', 'S', 'S', 'R', 'D', 'I', 'Z', 'T')
+    # Each memory value is scaled to a larger unit if it doesn't fit its column, as top does
+    MEM_SUFFIXES = (('m', 1024), ('g', 1024 ** 2), ('t', 1024 ** 3))
+
+    def __init__(self, seed=None, numJobs=20):
+        """
+        : seed - int - The seed for the random choices, for a repeatable file
+        : numJobs - int - The mean number of jobs in each entry
+        """
+        self.random = random.Random(seed)
+        self.numJobs = numJobs
+
+        rand = self.random
+        self.hasDate = rand.random() < 0.5
+        self.memFormat = rand.choice(self.MEM_FORMATS)
+        if self.memFormat in (self.MEM_OLD, self.MEM_KIB):
+            # Older versions of top can't show the cpus on one line, or the other layouts' columns
+            self.cpuFormat = rand.choice((self.CPU_OLD, self.CPU_SUMMARY, self.CPU_PER_CPU))
+            self.layouts = self.LAYOUTS[:1]
+        else:
+            self.cpuFormat = rand.choice((self.CPU_SUMMARY, self.CPU_PER_CPU, self.CPU_PAIRS))
+            self.layouts = self.LAYOUTS
+        self.numCpus = rand.choice((1, 2, 4, 8))
+        self.layout = rand.choice(self.layouts)
+        # pid -> job line, in the last entry
+        self.jobLines = {}
+
+        # Start near a change of uptime variant, so the file crosses it
+        self.uptimeMinutes = rand.choice((rand.randint(0, 59), rand.randint(1380, 1439),
+                                          rand.randint(1440, 1500), rand.randint(2000, 700000)))
+        self.time = datetime.datetime(TopEntry.YEAR, 1, 1) + datetime.timedelta(seconds=rand.randint(0, 364 * 86400))
+        self.memTotal = rand.choice((2048, 8192, 16384, 131072, 1048576)) * 1024
+        self.swapTotal = rand.choice((0, 1024 * 1024, 4095996))
+
+    def write(self, f, numEntries):
+        """Write numEntries entries of top output to the file f"""
+        for index in range(numEntries):
+            if index:
+                f.write("\n")
+                # Top doesn't write the blank line between entries in some versions
+                if self.random.random() < 0.9:
+                    f.write("\n")
+            f.write(self.getEntry())
+
+    def writeFile(self, fileName, numEntries):
+        """Write numEntries entries of top output to fileName"""
+        with open(fileName, 'w') as f:
+            self.write(f, numEntries)
+
+    def getEntry(self):
+        """:return: string - the lines of the next entry, ending with its last job line"""
+        rand = self.random
+        elapsed = rand.choice((1, 3, 30, 60, 300, 3600))
+        self.time += datetime.timedelta(seconds=elapsed)
+        self.uptimeMinutes += elapsed // 60
+        if rand.random() < 0.05:
+            self.layout = rand.choice(self.layouts)
+            self.jobLines = {}
+
+        lines = []
+        if self.hasDate:
+            lines.append(self.time.strftime('%m/%d %H:%M:%S'))
+        lines.append(self.getUptimeLine())
+        lines.extend(self.getTasksAndCpuLines())
+        lines.extend(self.getMemLines())
+        lines.append('')
+        lines.append(self.getJobHeader())
+        lines.extend(self.getJobLines())
+        return '\n'.join(lines) + '\n'
+
+    def getJobLines(self):
+        """
+        :return: list of string - the job lines. Most processes carry over from the last entry, and most of those
+                                  are idle, so their lines are the same as last time.
+        """
+        rand = self.random
+        numJobs = max(1, int(rand.gauss(self.numJobs, self.numJobs / 4.0)))
+        jobLines = {}
+        for pid, line in self.jobLines.items():
+            if len(jobLines) < numJobs and rand.random() < 0.9:
+                jobLines[pid] = line if rand.random() < 0.8 else self.getJobLine(pid)
+        while len(jobLines) < numJobs:
+            pid = rand.randint(1, 99999)
+            if pid not in jobLines:
+                jobLines[pid] = self.getJobLine(pid)
+        self.jobLines = jobLines
+        pids = sorted(jobLines)
+        rand.shuffle(pids)
+        return [jobLines[pid] for pid in pids]
+
+    def getUptimeLine(self):
+        """:return: string - the uptime line, in whichever of its variants the uptime is shown in"""
+        rand = self.random
+        days, minutes = divmod(self.uptimeMinutes, 1440)
+        hours, minutes = divmod(minutes, 60)
+        uptime = ''
+        if days:
+            uptime = "{0} day{1}, ".format(days, 's' if days > 1 else '')
+        if hours:
+            uptime += "{0:2d}:{1:02d}".format(hours, minutes)
+        else:
+            uptime += "{0} min".format(minutes)
+        users = rand.choice((0, 1, 1, 2, 17))
+        return "top - {0} up {1}, {2:2d} user{3},  load average: {4:.2f}, {5:.2f}, {6:.2f}".format(
+            self.time.strftime('%H:%M:%S'), uptime, users, '' if users == 1 else 's',
+            rand.uniform(0, 40), rand.uniform(0, 40), rand.uniform(0, 40))
+
+    def getTasksAndCpuLines(self):
+        """:return: list of string - the Tasks (or Threads) line and the Cpu lines"""
+        rand = self.random
+        counts = [rand.randint(0, 300), rand.randint(0, 3), rand.randint(0, 2), rand.randint(0, 1)]
+        lines = ["{0}: {1:3d} total, {2:3d} running, {3:3d} sleeping, {4:3d} stopped, {5:3d} zombie".format(
+            rand.choice(('Tasks', 'Threads')), sum(counts), *counts)]
+
+        if self.cpuFormat in (self.CPU_OLD, self.CPU_SUMMARY):
+            names = ['(s)']
+        else:
+            names = [str(cpu) for cpu in range(self.numCpus)]
+        cpus = []
+        for name in names:
+            values = [rand.choice((0.0, 100.0, round(rand.uniform(0, 100), 1))) for i in range(8)]
+            if self.cpuFormat == self.CPU_OLD:
+                cpus.append("Cpu{0}: {1}".format(name, ', '.join(
+                    "{0:5.1f}%{1}".format(value, label) for value, label in zip(values, self.CPU_LABELS))))
+            else:
+                cpus.append("%Cpu{0:<3}: {1}".format(name, ', '.join(
+                    "{0:5.1f} {1}".format(value, label) for value, label in zip(values, self.CPU_LABELS))))
+        if self.cpuFormat == self.CPU_PAIRS:
+            lines.extend(' '.join(cpus[i:i + 2]) for i in range(0, len(cpus), 2))
+        else:
+            lines.extend(cpus)
+        return lines
+
+    def getMemLines(self):
+        """:return: list of string - the Mem and Swap lines"""
+        rand = self.random
+        free = rand.randint(0, self.memTotal // 4)
+        cache = rand.randint(0, self.memTotal // 2)
+        used = self.memTotal - free - cache
+        swapFree = rand.randint(0, self.swapTotal)
+        swapUsed = self.swapTotal - swapFree
+        available = free + cache // 2
+
+        if self.memFormat == self.MEM_OLD:
+            return ["Mem:  {0:8d}k total, {1:8d}k used, {2:8d}k free, {3:8d}k buffers".format(
+                        self.memTotal, used, free, cache),
+                    "Swap: {0:8d}k total, {1:8d}k used, {2:8d}k free, {3:8d}k cached".format(
+                        self.swapTotal, swapUsed, swapFree, cache)]
+        if self.memFormat == self.MEM_KIB:
+            return ["KiB Mem:  {0:8d} total, {1:8d} used, {2:8d} free, {3:8d} buffers".format(
+                        self.memTotal, used, free, cache),
+                    "KiB Swap: {0:8d} total, {1:8d} used, {2:8d} free, {3:8d} cached".format(
+                        self.swapTotal, swapUsed, swapFree, cache)]
+
+        unit, scale = {self.MEM_NG_KIB: ('K', 1), self.MEM_NG_MIB: ('M', 1024),
+                       self.MEM_NG_GIB: ('G', 1024 ** 2)}[self.memFormat]
+        values = [self.formatMemValue(value, scale)
+                  for value in (self.memTotal, free, used, cache, self.swapTotal, swapFree, swapUsed, available)]
+        return ["{0}iB Mem : {1:>8} total, {2:>8} free, {3:>8} used, {4:>8} buff/cache".format(unit, *values[:4]),
+                "{0}iB Swap: {1:>8} total, {2:>8} free, {3:>8} used. {4:>8} avail Mem ".format(unit, *values[4:])]
+
+    def formatMemValue(self, value, scale):
+        """:return: string - value in KiB, shown in the unit that scale converts from"""
+        if scale == 1:
+            return str(value)
+        return "{0:.1f}".format(value / float(scale))
+
+    def getJobHeader(self):
+        """:return: string - the header line of the jobs section, for the current layout"""
+        return ' '.join(column.rjust(self.WIDTHS[column]) if column not in ('USER', 'COMMAND') else
+                        column.ljust(self.WIDTHS[column]) for column in self.layout).rstrip()
+
+    def getJobLine(self, pid):
+        """:return: string - a job line with pid, for the current layout"""
+        rand = self.random
+        values = []
+        for column in self.layout:
+            value = self.getJobValue(column, pid)
+            if column == 'COMMAND':
+                values.append(value)
+            elif column == 'USER':
+                values.append(value.ljust(self.WIDTHS[column]))
+            else:
+                values.append(value.rjust(self.WIDTHS[column]))
+        line = ' '.join(values)
+        if rand.random() < 0.1:
+            line += ' ' * rand.randint(1, 3)
+        return line
+
+    def getJobValue(self, column, pid):
+        """:return: string - a random value for column of a job with pid"""
+        rand = self.random
+        if column == 'PID':
+            return str(pid)
+        if column in ('PPID', 'TGID'):
+            return str(rand.choice((1, 2, pid, rand.randint(1, 99999))))
+        if column == 'USER':
+            return rand.choice(self.USERS)
+        if column == 'PR':
+            return rand.choice(('20', '20', '0', '10', '-2', '-51', 'rt'))
+        if column == 'NI':
+            return str(rand.choice((0, 0, 0, -20, -10, -5, 5, 19)))
+        if column in ('VIRT', 'RES', 'SHR', 'SWAP'):
+            return self.getJobMem(column)
+        if column == 'S':
+            return rand.choice(self.STATUSES)
+        if column == '%CPU':
+            return "{0:.1f}".format(rand.choice((0.0, 0.0, 100.0, 799.9, rand.uniform(0, 100))))
+        if column == '%MEM':
+            return "{0:.1f}".format(rand.uniform(0, 50))
+        if column == 'TIME+':
+            hundredths = rand.choice((0, rand.randint(0, 600000), rand.randint(0, 10 ** 9)))
+            minutes, hundredths = divmod(hundredths, 6000)
+            if minutes >= 10000:
+                # Top drops the hundredths when the minutes are too wide for the column
+                return "{0}:{1:02d}".format(minutes, hundredths // 100)
+            return "{0}:{1:02d}.{2:02d}".format(minutes, hundredths // 100, hundredths % 100)
+        if column == 'nTH':
+            return str(rand.choice((1, 1, 4, 117, 1024)))
+        if column == 'P':
+            return str(rand.randint(0, self.numCpus - 1))
+        return rand.choice(self.COMMANDS)
+
+    def getJobMem(self, column):
+        """:return: string - a memory value in KiB, scaled to a larger unit if it is too wide for column"""
+        rand = self.random
+        value = rand.choice((0, rand.randint(0, 99999), rand.randint(0, 10 ** 8), rand.randint(0, 10 ** 10)))
+        text = str(value)
+        width = self.WIDTHS[column]
+        for suffix, scale in self.MEM_SUFFIXES:
+            if len(text) <= width:
+                break
+            scaled = value / float(scale)
+            # Top shows as many decimals as fit, e.g. 2.403g, 436.2m or 9m
+            for decimals in (3, 1, 0):
+                text = "{0:.{1}f}{2}".format(scaled, decimals, suffix)
+                if len(text) <= width:
+                    break
+        return text
+
+
+class DifferentialChecker(object):
+    """
+    Parses files with the reference path and each of the faster paths, and compares the entries.
+    Each path is a function that takes a file name and returns its entries, as a list of TopEntry. Paths can
+    be added with addPath, e.g. to check a new optimization before it is enabled.
+    """
+
+    REFERENCE = 'reference'
+
+    def __init__(self, processes=2):
+        """
+        : processes - int - The number of worker processes for the parallel path, or 0 to not check it
+        """
+        self.processes = processes
+        self.pool = None
+        # Name -> function, the reference first
+        self.paths = [(self.REFERENCE, self.parseReference),
+                      ('specialized', self.parseSpecialized),
+                      ('bulk', self.parseBulk),
+                      ('spilled', self.parseSpilled),
+                      ('cached', self.parseCached),
+                      ('sampled', self.parseSampled)]
+        if processes:
+            self.paths.append(('parallel', self.parseParallel))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        """Stop the worker processes of the parallel path, if they were started"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def addPath(self, name, parse):
+        """
+        : name - string - The name to report mismatches of the path with
+        : parse - function - Takes a file name, and returns a list of TopEntry
+        """
+        self.paths.append((name, parse))
+
+    def parseReference(self, fileName):
+        """The general regexes, matched to one line at a time, which are the simplest and most thoroughly tested"""
+        return list(TopParser(fileName, specialize=False, bulk=False).iterEntries())
+
+    def parseSpecialized(self, fileName):
+        """Regexes specialized to the file's format, with the jobs' strings interned"""
+        return list(TopParser(fileName, bulk=False).iterEntries())
+
+    def parseBulk(self, fileName):
+        """The job lines of each entry parsed together, reusing unchanged lines' info (the default)"""
+        return list(TopParser(fileName).iterEntries())
+
+    def parseSpilled(self, fileName):
+        """Entries spilled to disk by a SegmentStore with a small memory budget, and read back"""
+        topParser = TopParser(fileName, memoryBudget=1)
+        try:
+            topParser.parse()
+            return list(topParser.entries)
+        finally:
+            topParser.close()
+
+    def parseCached(self, fileName):
+        """Entries from a ParseCache, parsed once and then returned from the cache"""
+        from parse_service import ParseCache
+        cache = ParseCache()
+        cache.getEntries(fileName)
+        return cache.getEntries(fileName)
+
+    def parseParallel(self, fileName):
+        """Entries parsed in a worker process, as the parse service does, and pickled back"""
+        import multiprocessing
+        from parse_service import ParseCache
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes)
+        return ParseCache(pool=self.pool).getEntries(fileName)
+
+    def parseSampled(self, fileName):
+        """
+        The entries found by seeking into the file, as the preview subcommand does. These are a sample, so
+        entries that were skipped are filled in from the reference, and only the sampled ones are compared.
+        """
+        from preview import SnapshotSampler
+        entries = self.parseReference(fileName)
+        starts = self.getEntryStarts(fileName)
+        for start, end, topEntry in SnapshotSampler(fileName, len(entries), seed=len(starts)).iterSnapshots():
+            if start not in starts:
+                raise Exception("Sampled an entry at {0}, which is not the start of an entry".format(start))
+            entries[starts.index(start)] = topEntry
+        return entries
+
+    def getEntryStarts(self, fileName):
+        """:return: list of int - the byte offset of each entry in fileName, including its date line"""
+        starts = []
+        position = 0
+        previousLine = b''
+        with open(fileName, 'rb') as f:
+            for line in f:
+                if line.startswith(b'top - '):
+                    if TopEntry.RE_DATE.match(previousLine.decode('utf-8')):
+                        starts.append(position - len(previousLine))
+                    else:
+                        starts.append(position)
+                position += len(line)
+                previousLine = line
+        return starts
+
+    def getEntryState(self, topEntry):
+        """:return: tuple - the parsed values of topEntry, which the paths must agree on"""
+        return (topEntry.header, topEntry.cpus,
+                dict((pid, job.info) for pid, job in topEntry.jobs.items()))
+
+    def check(self, fileName):
+        """
+        Parse fileName with each path, and compare the entries to the reference's
+        :return: list of string - a description of each path's first mismatch, empty if they all agree
+        """
+        mismatches = []
+        reference = [self.getEntryState(topEntry) for topEntry in self.parseReference(fileName)]
+        for name, parse in self.paths[1:]:
+            try:
+                entries = [self.getEntryState(topEntry) for topEntry in parse(fileName)]
+            except Exception as e:
+                mismatches.append("{0}: {1} failed: {2}".format(fileName, name, e))
+                continue
+            mismatch = self.compare(reference, entries)
+            if mismatch:
+                mismatches.append("{0}: {1} {2}".format(fileName, name, mismatch))
+        return mismatches
+
+    def compare(self, expected, actual):
+        """:return: string - a description of the first difference between two lists of entry states, or None"""
+        if len(expected) != len(actual):
+            return "parsed {0} entries, expected {1}".format(len(actual), len(expected))
+        for index, (expectedState, actualState) in enumerate(zip(expected, actual)):
+            for name, expectedValues, actualValues in zip(('header', 'cpus', 'jobs'), expectedState, actualState):
+                if expectedValues == actualValues:
+                    continue
+                for key in sorted(set(expectedValues) | set(actualValues), key=str):
+                    if expectedValues.get(key) != actualValues.get(key):
+                        return "entry {0} {1} {2}: {3!r}, expected {4!r}".format(
+                            index, name, key, actualValues.get(key), expectedValues.get(key))
+        return None
+
+    def checkGenerated(self, seed, numEntries=10, numJobs=20, directory=None):
+        """
+        Generate a file with seed, and check it
+        : directory - string - Where to write the file, which is kept if it has a mismatch. Defaults to a
+                               temporary directory.
+        :return: list of string - as for check
+        """
+        fileName = os.path.join(directory or tempfile.gettempdir(), 'top_differential_{0}.log'.format(seed))
+        TopGenerator(seed, numJobs).writeFile(fileName, numEntries)
+        mismatches = self.check(fileName)
+        if not mismatches:
+            os.remove(fileName)
+        return mismatches
+
+
+def main(argv):
+    examples = """
+    Examples:
+    # Check the parser's fast paths against the reference on 100 generated files:
+        %prog
+
+    # Check more, larger files, starting from another seed, and keep any that fail in failures/:
+        %prog --files 1000 --entries 50 --jobs 200 --seed 5000 --directory failures
+
+    # Check existing captures:
+        %prog --check capture1.log capture2.log
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool checks that the fast paths of the parser agree with the reference path""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--files", type=int, default=100, help="Number of files to generate")
+    parser.add_argument("--entries", type=int, default=10, help="Number of entries in each file")
+    parser.add_argument("--jobs", type=int, default=20, help="Mean number of jobs in each entry")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first file, the others follow it")
+    parser.add_argument("--directory", type=str, default=None, help="Directory to keep files with mismatches in")
+    parser.add_argument("--processes", type=int, default=2,
+                        help="Number of worker processes for the parallel path, 0 to skip it")
+    parser.add_argument("--check", type=str, nargs='+', default=None, help="Files to check, rather than generating them")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    options = parser.parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.WARNING
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    if options.directory and not os.path.isdir(options.directory):
+        os.makedirs(options.directory)
+
+    mismatches = []
+    with DifferentialChecker(options.processes) as checker:
+        if options.check:
+            for fileName in options.check:
+                mismatches.extend(checker.check(fileName))
+        else:
+            for seed in range(options.seed, options.seed + options.files):
+                mismatches.extend(checker.checkGenerated(seed, options.entries, options.jobs, options.directory))
+
+    for mismatch in mismatches:
+        sys.stdout.write("{0}\n".format(mismatch))
+    numFiles = len(options.check) if options.check else options.files
+    sys.stdout.write("{0} files checked, {1} mismatches\n".format(numFiles, len(mismatches)))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
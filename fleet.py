@@ -0,0 +1,336 @@
+#!/usr/bin/python
+"""
+This module compares the top captures of a fleet of hosts. Each host's capture is parsed in a worker process
+and reduced to the mean of each header field in each step of a common time grid, so memory grows with the
+number of hosts times the number of steps rather than with the size of the captures. Percentiles across the
+hosts are then computed at each step, with numpy if it is installed, and hosts that stray from the rest of the
+fleet are reported as outliers.
+"""
+
+import argparse
+import calendar
+import csv
+import datetime
+import logging
+import math
+import multiprocessing
+import os
+import sys
+import warnings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from output_sink import OutputSink
+from top_entry import TopEntry
+from top_parser import TopParser
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+def summarizeHost(task):
+    """
+    Parse one host's capture into the mean of each field at each step of the grid. Entries without a date line
+    are skipped, since their dates are made up from the host's uptime and don't line up with other hosts. This
+    runs in a worker process, so it is a module level function.
+    : task - tuple - (host, fileName, fields, step)
+    :return: (host, {step number: [mean of each field, or None if it wasn't reported]})
+    """
+    host, fileName, fields, step = task
+    # step number -> [sum, count] for each field
+    sums = {}
+    numUndated = 0
+    for topEntry in TopParser(fileName).iterEntries():
+        if topEntry.hasDate is False:
+            numUndated += 1
+            continue
+        header = topEntry.header
+        stepNumber = calendar.timegm(topEntry.getDateTime().timetuple()) // step
+        stepSums = sums.get(stepNumber)
+        if stepSums is None:
+            stepSums = sums[stepNumber] = [[0.0, 0] for field in fields]
+        for fieldSums, field in zip(stepSums, fields):
+            value = header.get(field)
+            if value is not None:
+                fieldSums[0] += value
+                fieldSums[1] += 1
+    if numUndated:
+        logger.warning("Skipped {0} entries of {1} without a date line, which can't be put on the fleet's time "
+                       "grid".format(numUndated, host))
+
+    means = {}
+    for stepNumber, stepSums in sums.items():
+        means[stepNumber] = [total / count if count else None for total, count in stepSums]
+    return host, means
+
+
+def getHostName(fileName):
+    """
+    :return: string - the host of a capture, given either as host=fileName or by the file name without its
+                      extension, e.g. web1 for /data/web1.log
+    """
+    if '=' in fileName:
+        return fileName.split('=', 1)[0]
+    return os.path.splitext(os.path.basename(fileName))[0]
+
+
+def percentile(sortedValues, percent):
+    """:return: float - the percentile of a sorted list of values, interpolated as numpy.percentile does"""
+    rank = percent / 100.0 * (len(sortedValues) - 1)
+    lower = int(math.floor(rank))
+    upper = min(lower + 1, len(sortedValues) - 1)
+    return sortedValues[lower] + (sortedValues[upper] - sortedValues[lower]) * (rank - lower)
+
+
+class Fleet(object):
+    """
+    The header fields of a fleet of hosts, on a common time grid:
+
+        fleet = Fleet([TopEntry.CPU_IDLE, TopEntry.MEM_USED], step=60)
+        fleet.addCaptures([('web1', 'web1.log'), ('web2', 'web2.log')])
+        for timestamp, numHosts, values in fleet.getPercentiles(TopEntry.CPU_IDLE):
+            ...
+    """
+
+    DEFAULT_FIELDS = (TopEntry.CPU_IDLE, TopEntry.MEM_USED, TopEntry.LOAD_1_MINUTE)
+
+    # The header fields that can be compared, which are those with numeric values other than the date
+    FIELDS = tuple(field for field in TopEntry.HEADER_FIELDS if field not in (TopEntry.DATE, TopEntry.TIME_OF_DAY))
+    DEFAULT_PERCENTILES = (50, 95, 99)
+
+    # Seconds between the steps of the grid
+    STEP = 60
+
+    # Steps are numbered from the epoch, treating the captures' local times as UTC so that they are left as is
+    EPOCH = datetime.datetime(1970, 1, 1)
+
+    # The smallest spread of a field across hosts that outliers are measured against, so that a field which
+    # is nearly the same on every host doesn't make every small difference an outlier
+    MIN_SPREAD = {TopEntry.CPU_IDLE: 1.0, TopEntry.CPU_UNNICED: 1.0, TopEntry.CPU_SYSTEM: 1.0,
+                  TopEntry.CPU_WAIT: 1.0, TopEntry.LOAD_1_MINUTE: 0.1, TopEntry.LOAD_5_MINUTES: 0.1,
+                  TopEntry.LOAD_15_MINUTES: 0.1, TopEntry.MEM_USED: 64 * 1024, TopEntry.MEM_FREE: 64 * 1024,
+                  TopEntry.SWAP_USED: 64 * 1024}
+    DEFAULT_MIN_SPREAD = 1e-6
+
+    # Scales the median absolute deviation to the standard deviation of normally distributed values
+    MAD_SCALE = 1.4826
+
+    def __init__(self, fields=DEFAULT_FIELDS, step=STEP, processes=None):
+        """
+        : fields - list of string - The TopEntry header fields to compare
+        : step - int - Seconds between the steps of the grid
+        : processes - int - The number of worker processes to parse captures with, defaults to the number of cpus
+        :throws: Exception if a field is not one of FIELDS
+        """
+        for field in fields:
+            if field not in self.FIELDS:
+                raise Exception("Can't compare {0}, expected one of {1}".format(field, ', '.join(self.FIELDS)))
+        self.fields = list(fields)
+        self.step = step
+        self.processes = processes
+        self.hosts = []
+        # host number -> {step number: [mean of each field]}
+        self.series = []
+
+    def addCaptures(self, captures):
+        """
+        Parse the captures of some hosts, in parallel if there is more than one
+        : captures - list of (host, fileName)
+        """
+        tasks = [(host, fileName, self.fields, self.step) for host, fileName in captures]
+        if len(tasks) <= 1 or self.processes == 1:
+            results = map(summarizeHost, tasks)
+            self.addResults(results)
+            return
+
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            self.addResults(pool.imap_unordered(summarizeHost, tasks))
+        finally:
+            pool.close()
+            pool.join()
+
+    def addResults(self, results):
+        for host, means in results:
+            logger.info("Parsed {0} steps for {1}".format(len(means), host))
+            self.addHost(host, means)
+
+    def addHost(self, host, means):
+        """
+        : means - dict - step number -> list of the mean of each field at that step, as returned by summarizeHost
+        """
+        self.hosts.append(host)
+        self.series.append(means)
+
+    def getSteps(self):
+        """:return: list of int - the numbers of the steps that any host has data for, in order"""
+        stepNumbers = set()
+        for means in self.series:
+            stepNumbers.update(means)
+        return sorted(stepNumbers)
+
+    def getTimestamp(self, stepNumber):
+        """:return: datetime.datetime - the time at the start of a step"""
+        return self.EPOCH + datetime.timedelta(seconds=stepNumber * self.step)
+
+    def getValues(self, field, steps):
+        """
+        :return: a hosts x steps grid of the field's values, as a numpy array with NaN for missing values if numpy
+                 is installed, otherwise a list of lists with None for missing values
+        """
+        index = self.fields.index(field)
+        rows = []
+        for means in self.series:
+            row = []
+            for stepNumber in steps:
+                values = means.get(stepNumber)
+                row.append(values[index] if values is not None else None)
+            rows.append(row)
+        if numpy is not None:
+            return numpy.array(rows, dtype=float)
+        return rows
+
+    def getPercentiles(self, field, percentiles=DEFAULT_PERCENTILES):
+        """
+        :return: list of (timestamp, number of hosts with a value, list of the percentiles of the values),
+                 for each step of the grid. The percentiles are None if no host has a value.
+        """
+        steps = self.getSteps()
+        if not steps:
+            return []
+        values = self.getValues(field, steps)
+
+        if numpy is not None:
+            counts = numpy.sum(~numpy.isnan(values), axis=0)
+            with warnings.catch_warnings():
+                # Steps where no host has a value give NaN, with a warning
+                warnings.simplefilter('ignore', RuntimeWarning)
+                results = numpy.nanpercentile(values, percentiles, axis=0)
+            return [(self.getTimestamp(stepNumber), int(counts[i]),
+                     [None if numpy.isnan(result) else float(result) for result in results[:, i]])
+                    for i, stepNumber in enumerate(steps)]
+
+        rows = []
+        for i, stepNumber in enumerate(steps):
+            column = sorted(row[i] for row in values if row[i] is not None)
+            if column:
+                rows.append((self.getTimestamp(stepNumber), len(column),
+                             [percentile(column, percent) for percent in percentiles]))
+            else:
+                rows.append((self.getTimestamp(stepNumber), 0, [None] * len(percentiles)))
+        return rows
+
+    def getOutliers(self, threshold=3.0):
+        """
+        Score each host by how far its fields are from the fleet's median, in robust standard deviations
+        (the scaled median absolute deviation across hosts), averaged over the steps where the host has a value.
+        :return: list of (host, field, score), for each host and field whose score is at least threshold,
+                 highest score first. Scores are positive for values above the median.
+        """
+        steps = self.getSteps()
+        outliers = []
+        if not steps or len(self.hosts) < 3:
+            return outliers
+
+        for field in self.fields:
+            minSpread = self.MIN_SPREAD.get(field, self.DEFAULT_MIN_SPREAD)
+            values = self.getValues(field, steps)
+            if numpy is not None:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', RuntimeWarning)
+                    median = numpy.nanmedian(values, axis=0)
+                    spread = numpy.maximum(self.MAD_SCALE * numpy.nanmedian(numpy.abs(values - median), axis=0),
+                                           minSpread)
+                    scores = numpy.nanmean((values - median) / spread, axis=1)
+                scores = [None if numpy.isnan(score) else float(score) for score in scores]
+            else:
+                scores = self.getScores(values, minSpread)
+
+            for host, score in zip(self.hosts, scores):
+                if score is not None and abs(score) >= threshold:
+                    outliers.append((host, field, score))
+
+        outliers.sort(key=lambda outlier: -abs(outlier[2]))
+        return outliers
+
+    def getScores(self, values, minSpread):
+        """:return: list of float - the mean robust score of each host, without numpy"""
+        totals = [0.0] * len(values)
+        counts = [0] * len(values)
+        for i in range(len(values[0])):
+            column = sorted(row[i] for row in values if row[i] is not None)
+            if not column:
+                continue
+            median = percentile(column, 50)
+            spread = max(self.MAD_SCALE * percentile(sorted(abs(value - median) for value in column), 50),
+                         minSpread)
+            for host, row in enumerate(values):
+                if row[i] is not None:
+                    totals[host] += (row[i] - median) / spread
+                    counts[host] += 1
+        return [total / count if count else None for total, count in zip(totals, counts)]
+
+
+def main(argv):
+    examples = """
+    Examples:
+    # The 50th, 95th and 99th percentiles of cpu idle, memory used and load across hosts, each minute:
+        %prog fleet captures/*.log
+
+    # The percentiles of cpu wait every 5 minutes, naming the hosts, and report hosts more than 2 robust
+    # standard deviations from the median:
+        %prog fleet web1=a.log web2=b.log web3=c.log --fields cpuIoWait --step 300 --threshold 2 -o fleet.csv
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to compare output from the top command across hosts""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("fileNames", type=str, nargs='+',
+                        help="Files to parse, one per host, as host=fileName or named after the host")
+    parser.add_argument("--fields", type=str, nargs='+', default=list(Fleet.DEFAULT_FIELDS),
+                        choices=Fleet.FIELDS, help="Header fields to compare")
+    parser.add_argument("--percentiles", type=float, nargs='+', default=list(Fleet.DEFAULT_PERCENTILES),
+                        help="Percentiles to compute across hosts")
+    parser.add_argument("--step", type=int, default=Fleet.STEP, help="Seconds between the steps of the time grid")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Number of worker processes, defaults to the number of cpus")
+    parser.add_argument("--threshold", type=float, default=3.0,
+                        help="Robust standard deviations from the median that make a host an outlier")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="CSV file to write the percentiles to, defaults to stdout")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    options = parser.parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.INFO
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    captures = [(getHostName(fileName), fileName.split('=', 1)[-1]) for fileName in options.fileNames]
+    fleet = Fleet(options.fields, options.step, options.processes)
+    fleet.addCaptures(captures)
+
+    output = open(options.output, 'w') if options.output else sys.stdout
+    try:
+        writer = csv.writer(output)
+        writer.writerow(['timestamp', 'field', 'hosts'] + ['p{0:g}'.format(percent) for percent in options.percentiles])
+        for field in options.fields:
+            for timestamp, numHosts, values in fleet.getPercentiles(field, options.percentiles):
+                writer.writerow([timestamp.strftime(OutputSink.TIMESTAMP_FORMAT), field, numHosts] + values)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    for host, field, score in fleet.getOutliers(options.threshold):
+        sys.stderr.write("Outlier: {0} {1} {2:+.1f} sd from the fleet median\n".format(host, field, score))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
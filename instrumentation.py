@@ -0,0 +1,241 @@
+"""
+Instrumentation for measuring where parse time goes.
+ParseProfile times the stages of parsing and counts what was parsed. It works by temporarily wrapping the
+parsing methods, so it costs nothing unless it is active.
+"""
+
+import cProfile
+import logging
+import pstats
+import sys
+import time
+
+from job import Job
+from job_layout import JobLayout
+from top_entry import TopEntry
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class StageTimer(object):
+    """
+    Accumulates the time spent in nested stages. Time is charged to the innermost active stage only, so the
+    stage times add up to the total time.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.stack = []
+        self.mark = None
+
+    def enter(self, stage):
+        now = time.time()
+        if self.stack:
+            self.charge(now)
+        self.stack.append(stage)
+        self.mark = now
+
+    def exit(self):
+        self.charge(time.time())
+        self.stack.pop()
+
+    def charge(self, now):
+        stage = self.stack[-1]
+        self.times[stage] = self.times.get(stage, 0.0) + now - self.mark
+        self.mark = now
+
+
+class TimedFile(object):
+    """
+    Wraps a file, timing reads as the 'read' stage and counting the lines and bytes read.
+    """
+
+    def __init__(self, f, profile):
+        self.f = f
+        self.profile = profile
+
+    def readline(self):
+        timer = self.profile.timer
+        timer.enter(ParseProfile.STAGE_READ)
+        try:
+            line = self.f.readline()
+        finally:
+            timer.exit()
+        if line:
+            self.profile.counters[ParseProfile.COUNT_LINES] += 1
+            self.profile.counters[ParseProfile.COUNT_BYTES] += len(line)
+        return line
+
+    def read(self, size=-1):
+        timer = self.profile.timer
+        timer.enter(ParseProfile.STAGE_READ)
+        try:
+            data = self.f.read(size)
+        finally:
+            timer.exit()
+        self.profile.counters[ParseProfile.COUNT_BYTES] += len(data)
+        return data
+
+    def close(self):
+        if self.f is not sys.stdin:
+            self.f.close()
+
+
+class TimedRegex(object):
+    """
+    Wraps a compiled regex, timing its matches as a stage.
+    """
+
+    def __init__(self, regex, timer, stage):
+        self.regex = regex
+        self.timer = timer
+        self.stage = stage
+
+    def match(self, string):
+        self.timer.enter(self.stage)
+        try:
+            return self.regex.match(string)
+        finally:
+            self.timer.exit()
+
+
+class ParseProfile(object):
+    """
+    Times the stages of parsing, and counts the lines, bytes, snapshots and jobs parsed, while active:
+
+        topParser = TopParser(fileName)
+        with ParseProfile(topParser) as profile:
+            topParser.parse()
+        sys.stderr.write(profile.report())
+    """
+
+    STAGE_READ = 'read'
+    STAGE_HEADER = 'header regexes'
+    STAGE_JOB_REGEX = 'job regex'
+    STAGE_JOB_FIELDS = 'job fields'
+    STAGE_JOB_BULK = 'bulk job lines'
+    STAGE_MEM_SCALING = 'memory scaling'
+    STAGE_CONSTRUCTION = 'object construction'
+    STAGE_OTHER = 'other'
+    STAGES = (STAGE_READ, STAGE_HEADER, STAGE_JOB_REGEX, STAGE_JOB_FIELDS, STAGE_JOB_BULK, STAGE_MEM_SCALING,
+              STAGE_CONSTRUCTION, STAGE_OTHER)
+
+    COUNT_LINES = 'lines'
+    COUNT_BYTES = 'bytes'
+    COUNT_SNAPSHOTS = 'snapshots'
+    COUNT_JOBS = 'jobs'
+    COUNTERS = (COUNT_LINES, COUNT_BYTES, COUNT_SNAPSHOTS, COUNT_JOBS)
+
+    # The methods wrapped while profiling: (class, method name, stage, counter)
+    # Job.parse covers converting the fields, since the regex and memory scaling are timed separately.
+    # TopEntry.parseBody covers creating and storing the Job objects.
+    WRAPPED_METHODS = (
+        (TopEntry, 'parseHeader', STAGE_HEADER, COUNT_SNAPSHOTS),
+        (TopEntry, 'parseBody', STAGE_CONSTRUCTION, None),
+        (Job, 'parse', STAGE_JOB_FIELDS, COUNT_JOBS),
+        (Job, 'parseScaledMem', STAGE_MEM_SCALING, None),
+        (JobLayout, 'parse', STAGE_JOB_REGEX, None),
+    )
+    # Methods that parse many jobs at once, whose counter is incremented by the number of jobs they return
+    WRAPPED_BULK_METHODS = (
+        (JobLayout, 'parseLines', STAGE_JOB_BULK, COUNT_JOBS),
+    )
+
+    def __init__(self, *topParsers):
+        """
+        : topParsers - TopParser - The parsers whose file reads should be timed
+        """
+        self.topParsers = topParsers
+        self.timer = StageTimer()
+        self.counters = dict((counter, 0) for counter in self.COUNTERS)
+        self.originals = []
+        self.started = None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+    def start(self):
+        """Wrap the parsing methods and start timing"""
+        for methods, countResult in ((self.WRAPPED_METHODS, False), (self.WRAPPED_BULK_METHODS, True)):
+            for klass, name, stage, counter in methods:
+                original = klass.__dict__[name]
+                self.originals.append((klass, name, original))
+                setattr(klass, name, self.wrap(original, stage, counter, countResult))
+
+        self.originals.append((Job, 'RE_JOB', Job.RE_JOB))
+        Job.RE_JOB = TimedRegex(Job.RE_JOB, self.timer, self.STAGE_JOB_REGEX)
+
+        for topParser in self.topParsers:
+            topParser.openFile = self.wrapOpenFile(topParser.openFile)
+
+        self.timer.enter(self.STAGE_OTHER)
+        self.started = time.time()
+
+    def stop(self):
+        """Stop timing and restore the parsing methods"""
+        self.timer.exit()
+        self.elapsed += time.time() - self.started
+        for klass, name, original in reversed(self.originals):
+            setattr(klass, name, original)
+        self.originals = []
+        for topParser in self.topParsers:
+            del topParser.openFile
+
+    def wrapOpenFile(self, openFile):
+        """:return: function wrapping openFile, so that reads from the file it opens are timed"""
+        return lambda: TimedFile(openFile(), self)
+
+    def wrap(self, function, stage, counter, countResult=False):
+        """
+        :return: function wrapped to be timed as stage, and to increment counter if it's not None, by one for each
+                 call, or if countResult is True, by the length of each result that isn't None
+        """
+        timer = self.timer
+        counters = self.counters
+
+        def wrapper(*args, **kwargs):
+            if counter is not None and not countResult:
+                counters[counter] += 1
+            timer.enter(stage)
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                timer.exit()
+            if countResult and result is not None:
+                counters[counter] += len(result)
+            return result
+        return wrapper
+
+    def report(self):
+        """:return: string - the time spent in each stage, and the counters"""
+        lines = ["Parse profile: {0:.3f}s total (timing adds overhead to each stage)".format(self.elapsed)]
+        total = sum(self.timer.times.values()) or 1.0
+        for stage in self.STAGES:
+            seconds = self.timer.times.get(stage, 0.0)
+            lines.append("  {0:<20} {1:9.3f}s {2:6.1f}%".format(stage, seconds, 100 * seconds / total))
+        for counter in self.COUNTERS:
+            lines.append("  {0:<20} {1:10d}".format(counter, self.counters[counter]))
+        if self.elapsed:
+            lines.append("  {0:<20} {1:12.1f}".format('jobs/s', self.counters[self.COUNT_JOBS] / self.elapsed))
+            lines.append("  {0:<20} {1:12.1f}".format('MB/s', self.counters[self.COUNT_BYTES] / self.elapsed / 1e6))
+        return '\n'.join(lines) + '\n'
+
+
+def runWithCProfile(function, statsFileName, *args):
+    """
+    Run function(*args) under cProfile, and dump the stats to statsFileName for use with pstats.
+    :return: the result of function
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        profiler.dump_stats(statsFileName)
+        logger.info("Wrote profile stats to {0}, e.g. python -m pstats {0}".format(statsFileName))
+        pstats.Stats(statsFileName, stream=sys.stderr).sort_stats('cumulative').print_stats(15)
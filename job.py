@@ -1,12 +1,17 @@
 import logging
 import re
 
+from lazy_regex import LazyRegex
+
 __author__ = 'Dave Pinkney'
 
 logger = logging.getLogger(__name__)
 
 class Job(object):
 
+    # A job only holds its info, and there is one for each job line, so it has no __dict__
+    __slots__ = ('info',)
+
     JOB_PID = 'pid'                  # string
     JOB_USER = 'user'                # string
     JOB_PR = 'priority'              # string
@@ -20,27 +25,49 @@ class Job(object):
     JOB_TIME = 'cpuTotalTime'        # string
     JOB_COMMAND = 'command'          # string
 
-    RE_JOB = re.compile("""^\s*(\d+)                 # PID
-                            \s+(\w+)                 # user
-                            \s+([-\w]+)              # priority
-                            \s+([-\d]+)              # nice
-                            \s+(\d+|\d+[.\d]*\w?)    # memVirtual
-                            \s+(\d+|\d+[.\d]*\w?)    # memResident
-                            \s+(\d+|\d+[.\d]*\w?)    # memShared
-                            \s+(\w+)                 # status
-                            \s+([\d.]+)              # cpuPercent
-                            \s+([\d.]+)              # memPercent
-                            \s+(\d+:\d+[.\d]*)       # cpuTotalTime
-                            \s+(.+)                  # command
-                            $""", re.VERBOSE)
-
-    RE_JOB_RES = re.compile('^(\d+)$')
-    RE_JOB_RES_SCALED = re.compile('^(\d+[.\d]*)([a-z])$')
-
-    def __init__(self):
+    # Optional fields, only present when top was configured to display them (see JobLayout)
+    JOB_PPID = 'ppid'                # string
+    JOB_TGID = 'tgid'                # string
+    JOB_UID = 'uid'                  # int
+    JOB_GROUP = 'group'              # string
+    JOB_TTY = 'tty'                  # string
+    JOB_LAST_CPU = 'lastCpu'         # int
+    JOB_THREADS = 'numThreads'       # int
+    JOB_SWAP = 'memSwap'             # int   in KiB
+    JOB_CODE = 'memCode'             # int   in KiB
+    JOB_DATA = 'memData'             # int   in KiB
+    JOB_USED = 'jobMemUsed'          # int   in KiB
+
+    # All of the known fields, default columns first
+    JOB_FIELDS = (JOB_PID, JOB_USER, JOB_PR, JOB_NI, JOB_VIRT, JOB_RES, JOB_SHR, JOB_STATUS, JOB_CPU, JOB_MEM,
+                  JOB_TIME, JOB_COMMAND, JOB_PPID, JOB_TGID, JOB_UID, JOB_GROUP, JOB_TTY, JOB_LAST_CPU,
+                  JOB_THREADS, JOB_SWAP, JOB_CODE, JOB_DATA, JOB_USED)
+
+    RE_JOB = LazyRegex(r"""^\s*(\d+)                 # PID
+                           \s+(\S+)                 # user
+                           \s+([-\w]+)              # priority
+                           \s+([-\d]+)              # nice
+                           \s+(\d+|\d+[.\d]*\w?)    # memVirtual
+                           \s+(\d+|\d+[.\d]*\w?)    # memResident
+                           \s+(\d+|\d+[.\d]*\w?)    # memShared
+                           \s+(\w+)                 # status
+                           \s+([\d.]+)              # cpuPercent
+                           \s+([\d.]+)              # memPercent
+                           \s+(\d+:\d+[.\d]*)       # cpuTotalTime
+                           \s+(.+)                  # command
+                           $""", re.VERBOSE)
+
+    RE_JOB_RES = LazyRegex(r'^(\d+)$')
+    RE_JOB_RES_SCALED = LazyRegex(r'^(\d+[.\d]*)([a-z])$')
+
+    # Multipliers to convert a scaled memory value to KiB
+    MEM_SCALE = {'k': 1, 'm': 1024, 'g': 1024 ** 2, 't': 1024 ** 3, 'p': 1024 ** 4, 'e': 1024 ** 5}
+
+    def __init__(self, info=None):
         """
+        : info - dict - The job's fields, if they have already been parsed (see JobLayout.parseLines)
         """
-        self.info = {}
+        self.info = info if info is not None else {}
 
     def __str__(self):
         """Convert to string, for str()."""
@@ -50,18 +77,24 @@ class Job(object):
         """Returns the pid for this job"""
         return self.info[self.JOB_PID]
 
-    def parse(self, line):
+    def parse(self, line, layout=None):
         """
-        Parse this job's state from a line of top output
+        Parse this job's state from a line of top output.
+        This is called for every job line, so it doesn't log - TopEntry.parseBody logs the parsed jobs instead.
         Sample input:
         '  662 root      20   0  273524  86820  17340 S   6.2  0.5 338:15.30 Xorg'
         '32469 dpinkney  20   0 3920412 2.403g  72804 S   6.2 15.4   2709:11 firefox'
         ' 5199 postgres  10 -10  436m   9m 7904 S  0.0  0.1   0:00.05 postmaster   '
+        : layout - JobLayout - The column layout of line, or None for top's default columns
         """
-        logger.debug("Parsing job '{0}'".format(line))
+        if layout is not None and not layout.isDefault:
+            layout.parse(line, self)
+            return
+
         match = self.RE_JOB.match(line)
+        if not match:
+            raise Exception("Could not parse job: '{0}'".format(line))
         groups = match.groups()
-        logger.debug("Got groups: {0}".format(groups))
 
         self.info[self.JOB_PID] = groups[0]
         self.info[self.JOB_USER] = groups[1]
@@ -79,11 +112,9 @@ class Job(object):
 
     def parseScaledMem(self, resStr):
         """
-        The memory values may contain a postfix, in which case we should convert it from mb or gb to kb
+        The memory values may contain a postfix, in which case we should convert it from kb, mb, gb, tb, pb or eb to kb
         :return: The memory value in KiB
         """
-        logger.debug("Parsing res from {0}".format(resStr))
-
         match = self.RE_JOB_RES.match(resStr)
         if match:
             return int(match.groups()[0])
@@ -93,10 +124,9 @@ class Job(object):
                 groups = match.groups()
                 value = float(groups[0])
 
-                if groups[1] == 'm':
-                    return int(value * 1024)
-                elif groups[1] == 'g':
-                    return int(value * 1024 * 1024)
+                scale = self.MEM_SCALE.get(groups[1])
+                if scale:
+                    return int(value * scale)
                 else:
                     raise Exception ("Unknown value in {0}".format(resStr))
             else:
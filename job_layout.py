@@ -0,0 +1,293 @@
+import logging
+import operator
+import re
+import string
+
+from job import Job
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class JobLayout(object):
+    """
+    Describes the column layout of the jobs section of top output, as given by its header line.
+    Top can be configured to display a different set of fields (via the 'f' command or a toprc file),
+    so the header line is read once per file and used to build a regex and a list of converters
+    that parse the job lines which follow it.
+    """
+
+    # Regex fragments for the job column values
+    RE_INT = r'(\d+)'
+    RE_SIGNED = r'([-\d]+)'
+    RE_WORD = r'(\w+)'
+    RE_TOKEN = r'(\S+)'
+    RE_PRIORITY = r'([-\w]+)'
+    RE_MEM = r'(\d+|\d+[.\d]*\w?)'
+    RE_FLOAT = r'([\d.]+)'
+    RE_TIME = r'(\d+:\d+[.\d]*)'
+    RE_COMMAND = '(.+)'
+
+    # For parseLines: the characters that make up the values of the fragments that are one character class. A memory
+    # value of other than digits is checked by parseScaledMem.
+    DIGITS = '0123456789'
+    WORD_CHARS = DIGITS + string.ascii_letters + '_'
+    FRAGMENT_CHARS = {
+        RE_INT: DIGITS,
+        RE_SIGNED: '-' + DIGITS,
+        RE_WORD: WORD_CHARS,
+        RE_PRIORITY: '-' + WORD_CHARS,
+        RE_MEM: '.' + DIGITS + string.ascii_letters,
+        RE_FLOAT: '.' + DIGITS,
+    }
+
+    # The conversion applied to a column value before it is stored in Job.info
+    CONVERT_STRING = 'string'
+    CONVERT_INT = 'int'
+    CONVERT_FLOAT = 'float'
+    CONVERT_MEM = 'mem'
+    CONVERT_COMMAND = 'command'
+
+    # Column header -> (Job field name, value regex, conversion)
+    COLUMNS = {
+        'PID': (Job.JOB_PID, RE_INT, CONVERT_STRING),
+        'USER': (Job.JOB_USER, RE_TOKEN, CONVERT_STRING),
+        'PR': (Job.JOB_PR, RE_PRIORITY, CONVERT_STRING),
+        'NI': (Job.JOB_NI, RE_SIGNED, CONVERT_INT),
+        'VIRT': (Job.JOB_VIRT, RE_MEM, CONVERT_MEM),
+        'RES': (Job.JOB_RES, RE_MEM, CONVERT_MEM),
+        'SHR': (Job.JOB_SHR, RE_MEM, CONVERT_MEM),
+        'S': (Job.JOB_STATUS, RE_WORD, CONVERT_STRING),
+        '%CPU': (Job.JOB_CPU, RE_FLOAT, CONVERT_FLOAT),
+        '%MEM': (Job.JOB_MEM, RE_FLOAT, CONVERT_FLOAT),
+        'TIME+': (Job.JOB_TIME, RE_TIME, CONVERT_STRING),
+        'TIME': (Job.JOB_TIME, RE_TIME, CONVERT_STRING),
+        'COMMAND': (Job.JOB_COMMAND, RE_COMMAND, CONVERT_COMMAND),
+        'PPID': (Job.JOB_PPID, RE_INT, CONVERT_STRING),
+        'TGID': (Job.JOB_TGID, RE_INT, CONVERT_STRING),
+        'UID': (Job.JOB_UID, RE_INT, CONVERT_INT),
+        'RUID': (Job.JOB_UID, RE_INT, CONVERT_INT),
+        'GROUP': (Job.JOB_GROUP, RE_TOKEN, CONVERT_STRING),
+        'TTY': (Job.JOB_TTY, RE_TOKEN, CONVERT_STRING),
+        'P': (Job.JOB_LAST_CPU, RE_INT, CONVERT_INT),
+        'nTH': (Job.JOB_THREADS, RE_INT, CONVERT_INT),
+        'SWAP': (Job.JOB_SWAP, RE_MEM, CONVERT_MEM),
+        'CODE': (Job.JOB_CODE, RE_MEM, CONVERT_MEM),
+        'DATA': (Job.JOB_DATA, RE_MEM, CONVERT_MEM),
+        'USED': (Job.JOB_USED, RE_MEM, CONVERT_MEM),
+    }
+
+    # The columns displayed by top when it has not been configured otherwise
+    DEFAULT_COLUMNS = ('PID', 'USER', 'PR', 'NI', 'VIRT', 'RES', 'SHR', 'S', '%CPU', '%MEM', 'TIME+', 'COMMAND')
+
+    # Cache of layouts by header line, shared by all files parsed in this process
+    layouts = {}
+
+    # Returns the pid from a job's info
+    getPid = staticmethod(operator.itemgetter(Job.JOB_PID))
+
+    def __init__(self, headerLine):
+        """
+        : headerLine - string - The header line of the jobs section, e.g.
+                                '  PID USER      PR  NI    VIRT    RES    SHR S  %CPU %MEM     TIME+ COMMAND'
+        """
+        self.headerLine = headerLine
+        self.columns = tuple(headerLine.split())
+        if Job.JOB_PID not in [self.COLUMNS.get(column, (None,))[0] for column in self.columns]:
+            raise Exception("Did not parse header correctly: '{0}'".format(headerLine))
+
+        self.isDefault = self.columns == self.DEFAULT_COLUMNS
+        if self.isDefault:
+            self.regex = Job.RE_JOB
+        else:
+            self.regex = self.buildRegex()
+
+        # (field name, conversion) for each regex group, in order
+        self.fields = [self.getColumn(column)[0::2] for column in self.columns]
+
+        # For parseLines: the number of splits that leaves a command in the last column intact, the check of
+        # each column's values, and the function that makes the jobs' info
+        self.maxSplit = len(self.columns) - 1 if self.fields[-1][1] == self.CONVERT_COMMAND else -1
+        self.columnChecks = self.buildColumnChecks()
+        self.makeInfos = self.buildInfoMaker()
+
+    def __str__(self):
+        """Convert to string, for str()."""
+        return "JobLayout({0})".format(' '.join(self.columns))
+
+    @classmethod
+    def fromHeader(cls, headerLine):
+        """
+        Return the layout for headerLine, building it if this header has not been seen before.
+        : headerLine - string - The header line of the jobs section
+        :throws: Exception if headerLine is not a jobs header
+        """
+        layout = cls.layouts.get(headerLine)
+        if layout is None:
+            layout = cls(headerLine)
+            logger.debug("Built layout for header '{0}': {1}".format(headerLine.rstrip(), layout))
+            cls.layouts[headerLine] = layout
+        return layout
+
+    def getColumn(self, column):
+        """
+        :return: (field name, regex, conversion) for a column header. Columns that we don't know about
+                 are stored under their header name, as strings.
+        """
+        return self.COLUMNS.get(column, (column, self.RE_TOKEN, self.CONVERT_STRING))
+
+    def buildRegex(self):
+        """
+        Build the regex that matches a job line for this layout.
+        The command may contain spaces, so it can only be matched greedily if it is the last column.
+        """
+        parts = []
+        for index, column in enumerate(self.columns):
+            regex = self.getColumn(column)[1]
+            if regex == self.RE_COMMAND and index != len(self.columns) - 1:
+                regex = self.RE_TOKEN
+            parts.append(regex)
+
+        return re.compile(r'^\s*' + r'\s+'.join(parts) + r'\s*$')
+
+    def buildColumnChecks(self):
+        """
+        Build the check of each column's values for parseColumns, so that it accepts the same lines as parse. A column
+        of a fragment in FRAGMENT_CHARS is checked by the set of its characters, and any other by a regex that matches
+        all of its values, each followed by a newline. Columns whose values always match once the line has been
+        split, the command and other tokens, have no check.
+        :return: list - a (frozenset or None, compiled regex or None) tuple for each column
+        """
+        checks = []
+        for column in self.columns:
+            regex = self.getColumn(column)[1]
+            if regex in self.FRAGMENT_CHARS:
+                checks.append((frozenset(self.FRAGMENT_CHARS[regex]), None))
+            elif regex in (self.RE_COMMAND, self.RE_TOKEN):
+                checks.append((None, None))
+            else:
+                checks.append((None, re.compile(r'(?:{0}\n)*\Z'.format(regex.replace('(', '(?:')))))
+        return checks
+
+    def buildInfoMaker(self):
+        """
+        Build the function that parseLines makes the jobs' info with. It takes an iterable of tuples of column
+        values, and returns a list of dicts. The dicts are built with a dict display, which is several times
+        quicker than calling dict(zip(names, values)) for each job.
+        """
+        names = ['v{0}'.format(index) for index in range(len(self.fields))]
+        source = 'lambda rows: [{{{0}}} for ({1},) in rows]'.format(
+            ', '.join('{0!r}: {1}'.format(field, name) for (field, conversion), name in zip(self.fields, names)),
+            ', '.join(names))
+        return eval(source)
+
+    def parseLines(self, lines, symbols=None, previousLines=None):
+        """
+        Parse all of the job lines of an entry at once (see parseColumns), which is about one and a half to two
+        times quicker than calling parse for each line, and several times quicker when most lines are unchanged
+        from the previous entry (see previousLines).
+        : lines - list of string - The job lines
+        : symbols - SymbolTable - The table to intern the jobs' strings in, or None to not intern them
+        : previousLines - dict - Line -> info, for the job lines of the previous entry of the file with this layout,
+                                 or None. Most of the processes in a capture are idle, so their lines don't change
+                                 between entries, and a copy of their info is used rather than parsing them again.
+                                 It is updated with these lines, for the next entry.
+        :return: dict - pid -> Job, or None if a line doesn't split into this layout's columns or two lines have
+                        the same pid, in which case the lines should be parsed one at a time to report it
+        """
+        if previousLines:
+            infos = list(map(previousLines.get, lines))
+            newInfos = self.parseColumns([line for line, info in zip(lines, infos) if info is None], symbols)
+            if newInfos is None:
+                return None
+            if newInfos:
+                newInfos = iter(newInfos)
+                infos = [info if info is not None else next(newInfos) for info in infos]
+        else:
+            infos = self.parseColumns(lines, symbols)
+            if infos is None:
+                return None
+
+        if previousLines is not None:
+            # Keep the infos as parsed, since the jobs' infos may be changed once they're returned
+            previousLines.clear()
+            previousLines.update(zip(lines, infos))
+            infos = list(map(dict.copy, infos))
+
+        jobs = dict(zip(map(self.getPid, infos), map(Job, infos)))
+        if len(jobs) != len(lines):
+            return None
+        return jobs
+
+    def parseColumns(self, lines, symbols=None):
+        """
+        Parse job lines a column at a time. The lines are split on whitespace rather than matched with the
+        layout's regex, and each column is converted with one call to map, so little is done for each line.
+        :return: list of dict - the info of each line, or None if a line doesn't split into this layout's columns
+        """
+        if not lines:
+            return []
+        maxSplit = self.maxSplit
+        rows = [line.split(None, maxSplit) for line in lines]
+        if len(set(map(len, rows))) != 1 or len(rows[0]) != len(self.fields):
+            return None
+
+        columns = list(zip(*rows))
+        internFields = symbols.FIELDS if symbols is not None else ()
+        try:
+            for index, (field, conversion) in enumerate(self.fields):
+                values = columns[index]
+                chars, check = self.columnChecks[index]
+                if chars is not None and not chars.issuperset(''.join(values)):
+                    return None
+                if check is not None and not check.match('\n'.join(values) + '\n'):
+                    return None
+                if conversion == self.CONVERT_MEM:
+                    values = self.parseMemColumn(values)
+                elif conversion == self.CONVERT_FLOAT:
+                    values = list(map(float, values))
+                elif conversion == self.CONVERT_INT:
+                    values = list(map(int, values))
+                elif conversion == self.CONVERT_COMMAND:
+                    values = list(map(str.strip, values))
+                if field in internFields:
+                    values = symbols.internAll(values)
+                columns[index] = values
+        except ValueError:
+            return None
+        return self.makeInfos(zip(*columns))
+
+    def parseMemColumn(self, values):
+        """:return: list of int - a column of memory values in KiB, which may be scaled, e.g. '2.403g'"""
+        try:
+            return list(map(int, values))
+        except ValueError:
+            # Convert the few scaled values, leaving the rest to map, since int returns an int unchanged
+            values = list(values)
+            parseScaledMem = Job().parseScaledMem
+            for index in [index for index, isDigit in enumerate(map(str.isdigit, values)) if not isDigit]:
+                values[index] = parseScaledMem(values[index])
+            return list(map(int, values))
+
+    def parse(self, line, job):
+        """
+        Parse a job line for this layout into job.info
+        :return: job
+        """
+        match = self.regex.match(line)
+        if not match:
+            raise Exception("Could not parse job: '{0}'".format(line))
+
+        info = job.info
+        for (field, conversion), value in zip(self.fields, match.groups()):
+            if conversion == self.CONVERT_STRING:
+                info[field] = value
+            elif conversion == self.CONVERT_MEM:
+                info[field] = job.parseScaledMem(value)
+            elif conversion == self.CONVERT_FLOAT:
+                info[field] = float(value)
+            elif conversion == self.CONVERT_INT:
+                info[field] = int(value)
+            else:
+                info[field] = value.strip()
+        return job
@@ -0,0 +1,35 @@
+"""
+Regexes that are compiled when they are first used, rather than when their module is imported.
+"""
+
+import re
+
+__author__ = 'Dave Pinkney'
+
+class LazyRegex(object):
+    """
+    A class attribute holding a regex, which is compiled the first time it is read. The compiled regex then
+    replaces this descriptor in the class that defined it, so later reads cost the same as for a regex that
+    was compiled at import time, and are the same object.
+
+    Compiling all of the class level regexes at import time costs more than parsing a one entry file, and
+    most runs only use some of them, e.g. the general uptime regexes are only needed when a line doesn't
+    match the ones specialized to the file (see TopFormat).
+    """
+
+    def __init__(self, pattern, flags=0):
+        """
+        : pattern - string - The regex
+        : flags - int - The flags to compile it with, e.g. re.VERBOSE
+        """
+        self.pattern = pattern
+        self.flags = flags
+
+    def __get__(self, instance, owner):
+        regex = re.compile(self.pattern, self.flags)
+        for cls in owner.__mro__:
+            names = [name for name, value in vars(cls).items() if value is self]
+            if names:
+                setattr(cls, names[0], regex)
+                break
+        return regex
@@ -0,0 +1,314 @@
+#!/usr/bin/python
+"""
+This module finds slow memory leaks in a stream of top entries. It fits a least squares line to each process's
+memory over time, updating the fit as each entry is read, so it costs the same for each entry however long the
+capture is, and keeps no history. Processes whose memory grows steadily are reported with their growth rate,
+and the time until they would use up the host's free memory and swap at that rate.
+"""
+
+import argparse
+import collections
+import datetime
+import logging
+import sys
+
+from job import Job
+from top_entry import TopEntry
+from top_parser import TopParser
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class RegressionStat(object):
+    """
+    An online least squares fit of y against x. The means and co-moments are updated with each point, as in
+    Welford's algorithm, which avoids the cancellation that summing squares would suffer over long series.
+    """
+    __slots__ = ('count', 'meanX', 'meanY', 'sxx', 'syy', 'sxy', 'firstX', 'lastX', 'lastY')
+
+    def __init__(self):
+        self.count = 0
+        self.meanX = 0.0
+        self.meanY = 0.0
+        self.sxx = 0.0
+        self.syy = 0.0
+        self.sxy = 0.0
+        self.firstX = None
+        self.lastX = None
+        self.lastY = None
+
+    def update(self, x, y):
+        """Add the point (x, y) to the fit"""
+        self.count += 1
+        dx = x - self.meanX
+        dy = y - self.meanY
+        self.meanX += dx / self.count
+        self.meanY += dy / self.count
+        self.sxx += dx * (x - self.meanX)
+        self.syy += dy * (y - self.meanY)
+        self.sxy += dx * (y - self.meanY)
+        if self.firstX is None:
+            self.firstX = x
+        self.lastX = x
+        self.lastY = y
+
+    def getSlope(self):
+        """:return: float - the slope of the fitted line, or 0 if x hasn't changed"""
+        if self.sxx <= 0:
+            return 0.0
+        return self.sxy / self.sxx
+
+    def getRSquared(self):
+        """:return: float - the fraction of the variance of y that the line explains, or 0 if y hasn't changed"""
+        if self.sxx <= 0 or self.syy <= 0:
+            return 0.0
+        return self.sxy * self.sxy / (self.sxx * self.syy)
+
+    def getSpan(self):
+        """:return: float - the range of x that the fit covers"""
+        if self.firstX is None:
+            return 0.0
+        return self.lastX - self.firstX
+
+
+class Leak(object):
+    """
+    Steady growth in one memory field of a job, or steady loss of the host's memory headroom.
+    """
+
+    def __init__(self, field, stat, hoursToExhaustion=None, job=None):
+        """
+        : field - string - The Job field that grows, or the name of the host's headroom
+        : stat - RegressionStat - The fit of the field, in KiB against hours
+        : hoursToExhaustion - float - The hours until the host's free memory and swap are used up at this rate,
+                                      or None if it isn't projected
+        : job - Job - The last sample of the job that leaks, or None for the host
+        """
+        self.field = field
+        self.growth = stat.getSlope()
+        self.rSquared = stat.getRSquared()
+        self.hours = stat.getSpan()
+        self.count = stat.count
+        self.value = stat.lastY
+        self.hoursToExhaustion = hoursToExhaustion
+        self.job = job
+
+    def __str__(self):
+        """Convert to string, for str()."""
+        if self.job is not None:
+            subject = "pid {0} ({1}) {2}".format(self.job.getPid(), self.job.info[Job.JOB_COMMAND], self.field)
+        else:
+            subject = "host {0}".format(self.field)
+        text = "{0} {1:+.1f} MiB/hour over {2:.1f} hours (R^2 {3:.2f}, {4} samples), now {5:.1f} MiB".format(
+            subject, self.growth / 1024.0, self.hours, self.rSquared, self.count, self.value / 1024.0)
+        if self.hoursToExhaustion is not None:
+            text += ", memory and swap used up in {0:.1f} hours".format(self.hoursToExhaustion)
+        return text
+
+
+class LeakDetector(object):
+    """
+    Fits a line to the memory fields of each job, keyed by pid and command so that a reused pid starts a new
+    fit, and to the host's memory headroom. Call update with each TopEntry, in order, then getLeaks.
+
+    The headroom is the memory that can still be allocated: the available memory (or, from versions of top that
+    don't report it, free memory plus buffers and cache) plus free swap. A leak's time to exhaustion is the
+    latest headroom divided by its growth, which is only projected for resident memory, since that is what
+    uses up memory and swap.
+    """
+
+    FIELDS = (Job.JOB_RES, Job.JOB_VIRT, Job.JOB_SHR)
+    HEADROOM = 'memory headroom'
+
+    # Thresholds for reporting steady growth
+    MIN_SAMPLES = 10
+    MIN_HOURS = 1.0
+    MIN_R_SQUARED = 0.8
+    MIN_GROWTH = 1024.0                  # KiB per hour
+
+    SECONDS_PER_HOUR = 3600.0
+    EPOCH = datetime.datetime(1970, 1, 1)
+
+    def __init__(self, fields=FIELDS, minSamples=MIN_SAMPLES, minHours=MIN_HOURS, minRSquared=MIN_R_SQUARED,
+                 minGrowth=MIN_GROWTH, maxJobs=100000, maxIdle=10):
+        """
+        : fields - list of string - The Job memory fields to fit
+        : minSamples - int - The number of samples a fit needs before it is reported
+        : minHours - float - The number of hours a fit must cover before it is reported
+        : minRSquared - float - How well the line must fit, so that noisy memory use isn't reported
+        : minGrowth - float - The growth in KiB per hour that is reported
+        : maxJobs - int - The maximum number of jobs to keep fits for
+        : maxIdle - int - The fits of a job are dropped once it has been missing for this many entries
+        """
+        self.fields = list(fields)
+        self.minSamples = minSamples
+        self.minHours = minHours
+        self.minRSquared = minRSquared
+        self.minGrowth = minGrowth
+        self.maxJobs = maxJobs
+        self.maxIdle = maxIdle
+
+        self.headroomStat = RegressionStat()
+        self.headroom = None
+        # (pid, command) -> [last entry number seen, last Job, [RegressionStat for each field]],
+        # least recently seen first
+        self.jobStats = collections.OrderedDict()
+        self.numEntries = 0
+        # For entries without a date: the uptime of the last one, and the hours added to uptimes since the
+        # host last rebooted, or since a capture from another boot was read
+        self.lastUptimeHours = None
+        self.uptimeOffset = 0.0
+
+    def getHeadroom(self, header):
+        """:return: int - the KiB of memory and swap that can still be used, or None if they aren't known"""
+        available = header.get(TopEntry.MEM_AVAILABLE)
+        if available is None:
+            free = header.get(TopEntry.MEM_FREE)
+            if free is None:
+                return None
+            available = free + (header.get(TopEntry.MEM_BUFFERS) or 0) + (header.get(TopEntry.MEM_BUFF_CACHE) or 0)
+            # Before procps-ng 3.3.10, the page cache was reported as cached on the swap line
+            available += header.get(TopEntry.SWAP_CACHED) or 0
+        return available + (header.get(TopEntry.SWAP_FREE) or 0)
+
+    def update(self, topEntry):
+        """Add an entry to the fits"""
+        self.numEntries += 1
+        hours = self.getHours(topEntry)
+
+        headroom = self.getHeadroom(topEntry.header)
+        if headroom is not None:
+            self.headroom = headroom
+            self.headroomStat.update(hours, headroom)
+
+        fields = self.fields
+        jobStats = self.jobStats
+        for job in topEntry.jobs.values():
+            info = job.info
+            key = (info[Job.JOB_PID], info[Job.JOB_COMMAND])
+            state = jobStats.pop(key, None)
+            if state is None:
+                state = [self.numEntries, job, [RegressionStat() for field in fields]]
+            state[0] = self.numEntries
+            state[1] = job
+            jobStats[key] = state
+            for field, stat in zip(fields, state[2]):
+                value = info.get(field)
+                if value is not None:
+                    stat.update(hours, value)
+        self.evictJobs()
+
+    def getHours(self, topEntry):
+        """
+        :return: float - the time of topEntry in hours, from its date and time if it has a date line. Otherwise its
+                         date is made up from its uptime (see TopEntry.getDateFromUptimeMinutes), which jumps back
+                         a day at midnight, so its uptime is used instead. Uptime starts again when the host
+                         reboots, so the time carries on from the previous entry rather than going back.
+        """
+        if topEntry.hasDate is not False:
+            return (topEntry.getDateTime() - self.EPOCH).total_seconds() / self.SECONDS_PER_HOUR
+
+        uptimeHours = topEntry.header[TopEntry.UPTIME_MINUTES] / 60.0
+        if self.lastUptimeHours is not None and uptimeHours < self.lastUptimeHours:
+            self.uptimeOffset += self.lastUptimeHours - uptimeHours
+        self.lastUptimeHours = uptimeHours
+        return uptimeHours + self.uptimeOffset
+
+    def evictJobs(self):
+        """Drop the fits of jobs that have not been seen recently, or that exceed maxJobs"""
+        jobStats = self.jobStats
+        while jobStats:
+            key, state = next(iter(jobStats.items()))
+            if len(jobStats) <= self.maxJobs and self.numEntries - state[0] < self.maxIdle:
+                break
+            del jobStats[key]
+
+    def isSteady(self, stat):
+        """:return: boolean - True if stat has enough samples over enough time, and they fit the line well"""
+        return (stat.count >= self.minSamples and stat.getSpan() >= self.minHours and
+                stat.getRSquared() >= self.minRSquared)
+
+    def getLeaks(self):
+        """
+        :return: list of Leak - the job memory fields that have grown steadily, fastest first, and the host's
+                                headroom if it has shrunk steadily
+        """
+        leaks = []
+        for lastSeen, job, stats in self.jobStats.values():
+            for field, stat in zip(self.fields, stats):
+                if stat.getSlope() >= self.minGrowth and self.isSteady(stat):
+                    hoursToExhaustion = None
+                    if field == Job.JOB_RES and self.headroom is not None:
+                        hoursToExhaustion = self.headroom / stat.getSlope()
+                    leaks.append(Leak(field, stat, hoursToExhaustion, job))
+        leaks.sort(key=lambda leak: -leak.growth)
+
+        stat = self.headroomStat
+        if -stat.getSlope() >= self.minGrowth and self.isSteady(stat):
+            leaks.append(Leak(self.HEADROOM, stat, stat.lastY / -stat.getSlope()))
+        return leaks
+
+    def detect(self, entries):
+        """
+        Run the detector over an iterable of entries
+        :return: list of Leak - as for getLeaks, at the end of entries
+        """
+        for topEntry in entries:
+            self.update(topEntry)
+        return self.getLeaks()
+
+
+def main(argv):
+    examples = """
+    Examples:
+    # Report processes whose resident, virtual or shared memory grew steadily, and when memory would run out:
+        %prog leaks topWithDate.log
+
+    # Several days of captures, in order, only reporting resident memory that grew by at least 10 MiB an hour
+    # over at least 12 hours:
+        %prog leaks day1.log day2.log day3.log --fields memResident --min-growth 10240 --min-hours 12
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to find memory leaks in output from the top command""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("fileNames", type=str, nargs='+', help="Files to read, in time order, or - to read from stdin")
+    parser.add_argument("--fields", type=str, nargs='+', default=list(LeakDetector.FIELDS),
+                        choices=LeakDetector.FIELDS, help="Job memory fields to fit")
+    parser.add_argument("--min-samples", type=int, default=LeakDetector.MIN_SAMPLES,
+                        help="Number of samples a process needs before it is reported")
+    parser.add_argument("--min-hours", type=float, default=LeakDetector.MIN_HOURS,
+                        help="Number of hours a process must be seen over before it is reported")
+    parser.add_argument("--min-r-squared", type=float, default=LeakDetector.MIN_R_SQUARED,
+                        help="How well the growth must fit a straight line, from 0 to 1")
+    parser.add_argument("--min-growth", type=float, default=LeakDetector.MIN_GROWTH,
+                        help="KiB per hour of growth to report")
+    parser.add_argument("--max-jobs", type=int, default=100000, help="Maximum number of jobs to track")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    options = parser.parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.INFO
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    detector = LeakDetector(options.fields, options.min_samples, options.min_hours, options.min_r_squared,
+                            options.min_growth, options.max_jobs)
+    for fileName in options.fileNames:
+        for topEntry in TopParser(fileName).iterEntries():
+            detector.update(topEntry)
+
+    leaks = detector.getLeaks()
+    for leak in leaks:
+        sys.stdout.write("{0}\n".format(leak))
+    if not leaks:
+        logger.info("No steady memory growth found in {0} entries".format(detector.numEntries))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,315 @@
+#!/usr/bin/python
+"""
+This module exports parsed top output as Prometheus metrics over HTTP. The metrics payload is rendered once as
+each entry is read, from a file or a live feed, and every scrape is served the same pre-rendered bytes, so
+scrapes cost the same however many jobs there are. Per-process and per-user metrics are limited to the busiest
+few, with the rest summed into an "other" series, so the number of series stays bounded as processes come and go.
+"""
+
+import argparse
+import collections
+import heapq
+import logging
+import os
+import stat
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from job import Job
+from top_entry import TopEntry
+from top_parser import TopParser
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class MetricsExporter(object):
+    """
+    Holds the rendered metrics of the latest entry from each source. A source is one feed of top output, usually
+    one host, and is given as the value of a host label when there are several.
+    """
+
+    PREFIX = 'top_'
+    TOP_N = 10
+    OTHER = 'other'
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    # Label values for the header fields
+    LOAD_PERIODS = ((TopEntry.LOAD_1_MINUTE, '1m'), (TopEntry.LOAD_5_MINUTES, '5m'),
+                    (TopEntry.LOAD_15_MINUTES, '15m'))
+    TASK_STATES = ((TopEntry.TASKS_RUNNING, 'running'), (TopEntry.TASKS_SLEEPING, 'sleeping'),
+                   (TopEntry.TASKS_STOPPED, 'stopped'), (TopEntry.TASKS_ZOMBIE, 'zombie'))
+    CPU_MODES = ((TopEntry.CPU_UNNICED, 'user'), (TopEntry.CPU_SYSTEM, 'system'), (TopEntry.CPU_NICED, 'nice'),
+                 (TopEntry.CPU_IDLE, 'idle'), (TopEntry.CPU_WAIT, 'iowait'), (TopEntry.CPU_HI, 'irq'),
+                 (TopEntry.CPU_SI, 'softirq'), (TopEntry.CPU_ST, 'steal'))
+    MEM_STATES = ((TopEntry.MEM_TOTAL, 'total'), (TopEntry.MEM_USED, 'used'), (TopEntry.MEM_FREE, 'free'),
+                  (TopEntry.MEM_BUFFERS, 'buffers'), (TopEntry.MEM_BUFF_CACHE, 'buff_cache'),
+                  (TopEntry.MEM_AVAILABLE, 'available'))
+    SWAP_STATES = ((TopEntry.SWAP_TOTAL, 'total'), (TopEntry.SWAP_USED, 'used'), (TopEntry.SWAP_FREE, 'free'),
+                   (TopEntry.SWAP_CACHED, 'cached'))
+
+    # (name, type, help) of each metric, in the order they are rendered
+    METRICS = (
+        ('snapshot_timestamp_seconds', 'gauge', 'Time the latest snapshot was captured'),
+        ('snapshots_total', 'counter', 'Number of snapshots read'),
+        ('uptime_minutes', 'gauge', 'Uptime of the host'),
+        ('users', 'gauge', 'Number of logged in users'),
+        ('load_average', 'gauge', 'Load average over the period'),
+        ('tasks', 'gauge', 'Number of tasks in each state'),
+        ('cpu_percent', 'gauge', 'Percentage of cpu time in each mode'),
+        ('memory_kib', 'gauge', 'Physical memory in KiB'),
+        ('swap_kib', 'gauge', 'Swap in KiB'),
+        ('jobs', 'gauge', 'Number of jobs in the snapshot'),
+        ('user_cpu_percent', 'gauge', 'Cpu percentage of the jobs of the busiest users'),
+        ('user_resident_kib', 'gauge', 'Resident memory in KiB of the jobs of the largest users'),
+        ('process_cpu_percent', 'gauge', 'Cpu percentage of the busiest processes'),
+        ('process_resident_kib', 'gauge', 'Resident memory in KiB of the largest processes'),
+    )
+
+    def __init__(self, topN=TOP_N, prefix=PREFIX):
+        """
+        : topN - int - The number of processes and users to give their own series, for each of their metrics
+        : prefix - string - The prefix of the metric names
+        """
+        self.topN = topN
+        self.prefix = prefix
+        # source -> metric name -> rendered samples of the source's latest entry
+        self.samples = collections.OrderedDict()
+        self.numEntries = collections.defaultdict(int)
+        self.lock = threading.Lock()
+        self.payload = self.render()
+
+    def getPayload(self):
+        """:return: bytes - the metrics of the latest entry from each source, in the Prometheus text format"""
+        return self.payload
+
+    def update(self, topEntry, source=None):
+        """
+        Render the metrics of topEntry, replacing those of the previous entry from its source.
+        : source - string - The host label of the entry's metrics, or None to not label them
+        """
+        with self.lock:
+            self.numEntries[source] += 1
+            self.samples[source] = self.getSamples(topEntry, source)
+            self.payload = self.render()
+
+    def render(self):
+        """:return: bytes - the payload, from the rendered samples of each source"""
+        lines = []
+        for name, metricType, description in self.METRICS:
+            name = self.prefix + name
+            lines.append('# HELP {0} {1}\n# TYPE {0} {2}\n'.format(name, description, metricType))
+            lines.extend(samples[name] for samples in self.samples.values() if samples.get(name))
+        return ''.join(lines).encode('utf-8')
+
+    def getSamples(self, topEntry, source=None):
+        """:return: dict - metric name -> the rendered samples of topEntry"""
+        header = topEntry.header
+        baseLabels = (('host', source),) if source is not None else ()
+        samples = {}
+
+        def add(name, labels, value):
+            if value is not None:
+                name = self.prefix + name
+                samples[name] = samples.get(name, '') + self.formatSample(name, baseLabels + labels, value)
+
+        def addHeader(name, labelName, fields):
+            for field, labelValue in fields:
+                add(name, ((labelName, labelValue),), header.get(field))
+
+        if topEntry.hasDate is not False:
+            # An undated entry's date is made up from its uptime, so it isn't exported
+            add('snapshot_timestamp_seconds', (), time.mktime(topEntry.getDateTime().timetuple()))
+        add('snapshots_total', (), self.numEntries[source])
+        add('uptime_minutes', (), header.get(TopEntry.UPTIME_MINUTES))
+        add('users', (), header.get(TopEntry.NUM_USERS))
+        addHeader('load_average', 'period', self.LOAD_PERIODS)
+        addHeader('tasks', 'state', self.TASK_STATES)
+        addHeader('cpu_percent', 'mode', self.CPU_MODES)
+        addHeader('memory_kib', 'state', self.MEM_STATES)
+        addHeader('swap_kib', 'state', self.SWAP_STATES)
+        add('jobs', (), len(topEntry.jobs))
+
+        infos = [job.info for job in topEntry.jobs.values()]
+        for name, field in (('user_cpu_percent', Job.JOB_CPU), ('user_resident_kib', Job.JOB_RES)):
+            totals = collections.defaultdict(int)
+            for info in infos:
+                totals[info.get(Job.JOB_USER)] += info.get(field, 0)
+            for user, value in self.getTop(list(totals.items()), lambda item: item[1]):
+                add(name, (('user', user),), value)
+
+        for name, field in (('process_cpu_percent', Job.JOB_CPU), ('process_resident_kib', Job.JOB_RES)):
+            for info, value in self.getTop([(info, info.get(field, 0)) for info in infos], lambda item: item[1]):
+                if info is self.OTHER:
+                    add(name, (('pid', self.OTHER), ('command', self.OTHER)), value)
+                else:
+                    add(name, (('pid', info[Job.JOB_PID]), ('command', info.get(Job.JOB_COMMAND, ''))), value)
+        return samples
+
+    def getTop(self, items, key):
+        """
+        :return: list of (item, value) - the topN items with the largest values, and (OTHER, the sum of the
+                                         values of the rest) if there are more
+        """
+        if len(items) <= self.topN:
+            return sorted(items, key=key, reverse=True)
+        top = heapq.nlargest(self.topN, items, key=key)
+        return top + [(self.OTHER, sum(map(key, items)) - sum(map(key, top)))]
+
+    def formatSample(self, name, labels, value):
+        """:return: string - one sample line"""
+        if labels:
+            name = '{0}{{{1}}}'.format(name, ','.join('{0}="{1}"'.format(label, self.escape(labelValue))
+                                                       for label, labelValue in labels))
+        return '{0} {1}\n'.format(name, value)
+
+    def escape(self, value):
+        """:return: string - value escaped for use as a label value"""
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the exporter's payload at /metrics.
+    """
+
+    PATHS = ('/metrics', '/')
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in self.PATHS:
+            self.send_error(404)
+            return
+        payload = self.server.exporter.getPayload()
+        self.send_response(200)
+        self.send_header('Content-Type', MetricsExporter.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class MetricsServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    Serves each scrape in its own thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, exporter):
+        """
+        : address - (string, int) - The address and port to listen on
+        : exporter - MetricsExporter - The exporter whose payload is served
+        """
+        HTTPServer.__init__(self, address, MetricsHandler)
+        self.exporter = exporter
+
+
+def isLiveFeed(fileName):
+    """:return: True if fileName is stdin or a fifo, which are read for as long as they are written to"""
+    if fileName == '-':
+        return True
+    try:
+        return stat.S_ISFIFO(os.stat(fileName).st_mode)
+    except OSError:
+        return False
+
+
+def main(argv):
+    examples = """
+    Examples:
+    # Serve the metrics of a live feed on http://localhost:9105/metrics:
+        top -b -d 15 | %prog export -
+
+    # Serve the metrics of several hosts' feeds, labelled with their hosts, giving 20 processes their own series:
+        %prog export web1=web1.fifo web2=web2.fifo --top-n 20 --port 9200
+
+    # Print the metrics of the last entry of a capture, e.g. for node_exporter's textfile collector:
+        %prog export topOutput.log --print > top.prom
+
+    # Print the metrics of a live feed after each of its entries:
+        top -b -d 15 | %prog export - --print
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to export output from the top command as Prometheus metrics""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("fileNames", type=str, nargs='+',
+                        help="Files to read, one per host, or - to read from stdin. A host can be given as "
+                             "host=fileName, and otherwise is the file name without its extension")
+    parser.add_argument("--address", type=str, default='127.0.0.1', help="The address to listen on")
+    parser.add_argument("--port", type=int, default=9105, help="The port to listen on")
+    parser.add_argument("--top-n", type=int, default=MetricsExporter.TOP_N,
+                        help="Number of processes and users to give their own series, the rest are summed")
+    parser.add_argument("--print", dest='printPayload', action='store_true',
+                        help="Print the metrics once the files have been read, rather than serving them. If a "
+                             "file is stdin or a fifo, they are printed after each entry instead")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    options = parser.parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.INFO
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    from fleet import getHostName
+    exporter = MetricsExporter(options.top_n)
+    labelHosts = len(options.fileNames) > 1 or any('=' in fileName for fileName in options.fileNames)
+    # A live feed is only read to its end once its writer stops, so its metrics are printed as they change
+    printEach = options.printPayload and any(isLiveFeed(fileName.split('=', 1)[-1]) for fileName in options.fileNames)
+    printLock = threading.Lock()
+
+    def printPayload():
+        with printLock:
+            sys.stdout.write(exporter.getPayload().decode('utf-8'))
+            sys.stdout.flush()
+
+    def export(fileName):
+        source = getHostName(fileName) if labelHosts else None
+        for topEntry in TopParser(fileName.split('=', 1)[-1]).iterEntries():
+            exporter.update(topEntry, source)
+            if printEach:
+                printPayload()
+        logger.info("Finished reading {0}, its last entry is still exported".format(fileName))
+
+    # Read each feed in its own thread, so a live feed that is waiting for input doesn't hold up the others
+    threads = [threading.Thread(target=export, args=(fileName,)) for fileName in options.fileNames]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    if options.printPayload:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+        if not printEach:
+            printPayload()
+        return
+
+    server = MetricsServer((options.address, options.port), exporter)
+    logger.info("Serving metrics on http://{0}:{1}/metrics".format(options.address, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
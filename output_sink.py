@@ -0,0 +1,365 @@
+"""
+Output sinks that write parsed top entries to files, for use by other tools.
+Sinks are fed one TopEntry at a time and buffer their output, writing it in batches.
+Given a SymbolTable, sinks write ids in place of the users, commands and statuses of jobs, along with the
+symbols for those ids.
+"""
+
+import io
+import logging
+import os
+import sys
+
+# csv, json and sqlite3 are imported by the sinks that use them, so runs that don't write those formats don't
+# load them
+
+from job import Job
+from symbol_table import SymbolTable
+from top_entry import TopEntry
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class OutputSink(object):
+    """
+    Base class for output sinks. Subclasses implement writeEntry and flush.
+    Sinks can be used as context managers, which close them on exit.
+    """
+
+    FORMAT_CSV = 'csv'
+    FORMAT_JSON_LINES = 'jsonl'
+    FORMAT_SQLITE = 'sqlite'
+    FORMATS = (FORMAT_CSV, FORMAT_JSON_LINES, FORMAT_SQLITE)
+
+    # The file extensions used to pick a format when one is not given
+    EXTENSIONS = {'.csv': FORMAT_CSV, '.jsonl': FORMAT_JSON_LINES, '.json': FORMAT_JSON_LINES,
+                  '.db': FORMAT_SQLITE, '.sqlite': FORMAT_SQLITE, '.sqlite3': FORMAT_SQLITE}
+
+    # The column holding the time each entry was captured
+    TIMESTAMP = 'timestamp'
+    TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+    # Number of job rows to buffer before writing them out
+    BATCH_SIZE = 5000
+
+    # Size of the write buffer for the text formats
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, fileName, batchSize=None, symbols=None):
+        """
+        : fileName - string - The file to write to
+        : batchSize - int - The number of job rows to buffer before writing, defaults to BATCH_SIZE
+        : symbols - SymbolTable - If given, the interned job fields are written as ids from this table
+        """
+        self.fileName = fileName
+        self.batchSize = batchSize or self.BATCH_SIZE
+        self.symbols = symbols
+        self.numSymbolsWritten = 0
+        self.pendingRows = 0
+        self.numEntries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    @classmethod
+    def create(cls, fileName, format=None, batchSize=None, symbols=None):
+        """
+        Create a sink for fileName.
+        : format - string - One of FORMATS, or None to pick one from the file extension
+        : symbols - SymbolTable - If given, the interned job fields are written as ids from this table
+        :throws: Exception if no format was given and the extension is not recognized
+        """
+        if format is None:
+            format = cls.EXTENSIONS.get(os.path.splitext(fileName)[1].lower())
+            if format is None:
+                raise Exception("Can't determine the output format of {0}, one of {1} is required"
+                                .format(fileName, ', '.join(cls.FORMATS)))
+
+        sinks = {cls.FORMAT_CSV: CsvSink, cls.FORMAT_JSON_LINES: JsonLinesSink, cls.FORMAT_SQLITE: SqliteSink}
+        return sinks[format](fileName, batchSize, symbols)
+
+    def write(self, topEntry):
+        """
+        Write a TopEntry to this sink. The output may be buffered until the batch size is reached.
+        """
+        self.writeEntry(topEntry, topEntry.getDateTime().strftime(self.TIMESTAMP_FORMAT))
+        self.numEntries += 1
+        self.pendingRows += len(topEntry.jobs) + 1
+        if self.pendingRows >= self.batchSize:
+            self.flush()
+            self.pendingRows = 0
+
+    def writeAll(self, entries):
+        """
+        Write each TopEntry from an iterable of entries, e.g. TopParser.iterEntries()
+        :return: the number of entries written
+        """
+        for topEntry in entries:
+            self.write(topEntry)
+        return self.numEntries
+
+    def getJobInfos(self, topEntry):
+        """:return: list of dict - the info of each job in topEntry, encoded with the symbol table if there is one"""
+        if self.symbols is None:
+            return [job.info for job in topEntry.jobs.values()]
+        encodeJob = self.symbols.encodeJob
+        return [encodeJob(job.info) for job in topEntry.jobs.values()]
+
+    def getNewSymbols(self):
+        """:return: list of string - the symbols that have been assigned ids since this was last called"""
+        symbols = self.symbols.symbols[self.numSymbolsWritten:]
+        self.numSymbolsWritten += len(symbols)
+        return symbols
+
+    def writeEntry(self, topEntry, timestamp):
+        """
+        Buffer the output for one TopEntry
+        : timestamp - string - The time the entry was captured, in TIMESTAMP_FORMAT
+        """
+        raise NotImplementedError()
+
+    def flush(self):
+        """Write out any buffered output."""
+        raise NotImplementedError()
+
+    def close(self):
+        """Flush any buffered output and release the file."""
+        self.flush()
+        logger.info("Wrote {0} entries to {1}".format(self.numEntries, self.fileName))
+
+
+class CsvSink(OutputSink):
+    """
+    Writes one row per entry, holding the header fields, to fileName, and one row per job to a
+    second file named after it, e.g. top.csv and top.jobs.csv. Job rows are linked to their entry by
+    the timestamp column. With a symbol table, its id and symbol columns are written to a third file,
+    e.g. top.symbols.csv, when the sink is closed.
+    """
+
+    def __init__(self, fileName, batchSize=None, symbols=None):
+        OutputSink.__init__(self, fileName, batchSize, symbols)
+        root, extension = os.path.splitext(fileName)
+        self.jobsFileName = root + '.jobs' + (extension or '.csv')
+        self.symbolsFileName = root + '.symbols' + (extension or '.csv')
+
+        import csv
+        self.headerFile = self.openCsv(fileName)
+        self.jobsFile = self.openCsv(self.jobsFileName)
+        self.headerWriter = csv.writer(self.headerFile)
+        self.jobsWriter = csv.writer(self.jobsFile)
+        self.headerWriter.writerow((self.TIMESTAMP,) + TopEntry.HEADER_FIELDS)
+        self.jobsWriter.writerow((self.TIMESTAMP,) + Job.JOB_FIELDS)
+
+        self.headerRows = []
+        self.jobRows = []
+
+    def openCsv(self, fileName):
+        """Open a file for the csv module, which wants bytes in python 2 and text in python 3."""
+        if sys.version_info[0] < 3:
+            return open(fileName, 'wb', self.BUFFER_SIZE)
+        return io.open(fileName, 'w', self.BUFFER_SIZE, newline='')
+
+    def writeEntry(self, topEntry, timestamp):
+        header = topEntry.header
+        self.headerRows.append([timestamp] + [header.get(field) for field in TopEntry.HEADER_FIELDS])
+        for info in self.getJobInfos(topEntry):
+            self.jobRows.append([timestamp] + [info.get(field) for field in Job.JOB_FIELDS])
+
+    def flush(self):
+        self.headerWriter.writerows(self.headerRows)
+        self.jobsWriter.writerows(self.jobRows)
+        self.headerRows = []
+        self.jobRows = []
+
+    def close(self):
+        OutputSink.close(self)
+        self.headerFile.close()
+        self.jobsFile.close()
+        if self.symbols is not None:
+            import csv
+            symbolsFile = self.openCsv(self.symbolsFileName)
+            writer = csv.writer(symbolsFile)
+            writer.writerow(('id', 'symbol'))
+            writer.writerows(enumerate(self.symbols.symbols))
+            symbolsFile.close()
+
+
+class JsonLinesSink(OutputSink):
+    """
+    Writes one JSON object per entry and line, e.g.
+    {"timestamp": "2015-05-26 18:05:02", "header": {...}, "cpus": {"0": {...}}, "jobs": [{...}, ...]}
+    With a symbol table, the symbols first used by an entry are written on a line before it, e.g.
+    {"symbols": ["root", "S", "init", ...]}
+    and their ids are the number of symbols on the lines before them.
+    """
+
+    SYMBOLS = 'symbols'
+
+    def __init__(self, fileName, batchSize=None, symbols=None):
+        OutputSink.__init__(self, fileName, batchSize, symbols)
+        self.file = open(fileName, 'w', self.BUFFER_SIZE)
+        self.lines = []
+
+    @classmethod
+    def readEntries(cls, fileName, headerFilter=None):
+        """
+        Read back the entries written by a JsonLinesSink, yielding a TopEntry for each line.
+        : headerFilter - function(header) - If given, entries whose header it rejects are skipped
+                                            without building their jobs
+        """
+        import json
+        symbols = None
+        with open(fileName, 'r', cls.BUFFER_SIZE) as f:
+            for line in f:
+                record = json.loads(line)
+                if cls.SYMBOLS in record:
+                    if symbols is None:
+                        symbols = SymbolTable()
+                    for symbol in record[cls.SYMBOLS]:
+                        symbols.getId(symbol)
+                    continue
+
+                topEntry = TopEntry(True)
+                topEntry.header = record['header']
+                if headerFilter is not None and not headerFilter(topEntry.header):
+                    continue
+
+                for info in record['jobs']:
+                    if symbols is not None:
+                        symbols.decodeJob(info)
+                    job = Job()
+                    job.info = info
+                    topEntry.jobs[job.getPid()] = job
+                for cpu, values in record.get('cpus', {}).items():
+                    topEntry.cpus[int(cpu)] = values
+                yield topEntry
+
+    def writeEntry(self, topEntry, timestamp):
+        import json
+        record = {self.TIMESTAMP: timestamp,
+                  'header': topEntry.header,
+                  'jobs': self.getJobInfos(topEntry)}
+        if self.symbols is not None:
+            newSymbols = self.getNewSymbols()
+            if newSymbols:
+                self.lines.append(json.dumps({self.SYMBOLS: newSymbols}, separators=(',', ':')))
+        if topEntry.cpus:
+            record['cpus'] = topEntry.cpus
+        self.lines.append(json.dumps(record, separators=(',', ':')))
+
+    def flush(self):
+        if self.lines:
+            self.lines.append('')
+            self.file.write('\n'.join(self.lines))
+            self.lines = []
+
+    def close(self):
+        OutputSink.close(self)
+        self.file.close()
+
+
+class SqliteSink(OutputSink):
+    """
+    Writes entries to the 'entries' table and jobs to the 'jobs' table of an SQLite database, which
+    are created if needed. Jobs are linked to their entry by entry_id, and both tables are indexed by
+    timestamp, with jobs also indexed by pid.
+    With a symbol table, the user, command and status columns of jobs hold ids from the 'symbols'
+    table. Symbols already in the database are merged into the symbol table, so ids stay consistent
+    when appending to it.
+    """
+
+    ENTRIES_TABLE = 'entries'
+    JOBS_TABLE = 'jobs'
+    SYMBOLS_TABLE = 'symbols'
+    ENTRY_ID = 'entry_id'
+
+    # Column types, anything not listed is TEXT
+    COLUMN_TYPES = dict.fromkeys(TopEntry.CPU_FIELDS + (TopEntry.LOAD_1_MINUTE, TopEntry.LOAD_5_MINUTES,
+                                                        TopEntry.LOAD_15_MINUTES, Job.JOB_CPU, Job.JOB_MEM), 'REAL')
+    COLUMN_TYPES.update(dict.fromkeys((
+        TopEntry.DATE, TopEntry.UPTIME_MINUTES, TopEntry.NUM_USERS, TopEntry.TASKS_TOTAL, TopEntry.TASKS_RUNNING,
+        TopEntry.TASKS_SLEEPING, TopEntry.TASKS_STOPPED, TopEntry.TASKS_ZOMBIE,
+        TopEntry.MEM_TOTAL, TopEntry.MEM_USED, TopEntry.MEM_FREE, TopEntry.MEM_BUFFERS, TopEntry.MEM_BUFF_CACHE,
+        TopEntry.MEM_AVAILABLE, TopEntry.SWAP_TOTAL, TopEntry.SWAP_USED, TopEntry.SWAP_FREE, TopEntry.SWAP_CACHED,
+        Job.JOB_PID, Job.JOB_PPID, Job.JOB_TGID, Job.JOB_NI, Job.JOB_UID, Job.JOB_LAST_CPU, Job.JOB_THREADS,
+        Job.JOB_VIRT, Job.JOB_RES, Job.JOB_SHR, Job.JOB_SWAP, Job.JOB_CODE, Job.JOB_DATA, Job.JOB_USED), 'INTEGER'))
+    # The interned fields hold either strings or symbol ids, so they have no type, which stores each as given
+    COLUMN_TYPES.update(dict.fromkeys(SymbolTable.FIELDS, ''))
+
+    def __init__(self, fileName, batchSize=None, symbols=None):
+        OutputSink.__init__(self, fileName, batchSize, symbols)
+        import sqlite3
+        self.connection = sqlite3.connect(fileName)
+        # The database can be regenerated from the top output, so favor load speed over durability
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute('PRAGMA journal_mode = MEMORY')
+        self.createTables()
+        if symbols is not None:
+            storedSymbols = self.connection.execute(
+                'SELECT symbol FROM {0} ORDER BY id'.format(self.SYMBOLS_TABLE)).fetchall()
+            symbols.merge([row[0] for row in storedSymbols])
+            self.numSymbolsWritten = len(storedSymbols)
+
+        self.nextEntryId = self.connection.execute(
+            'SELECT COALESCE(MAX(id), 0) + 1 FROM {0}'.format(self.ENTRIES_TABLE)).fetchone()[0]
+        self.entryRows = []
+        self.jobRows = []
+
+        columns = ', '.join(['?'] * (len(TopEntry.HEADER_FIELDS) + 2))
+        self.insertEntry = 'INSERT INTO {0} VALUES ({1})'.format(self.ENTRIES_TABLE, columns)
+        columns = ', '.join(['?'] * (len(Job.JOB_FIELDS) + 2))
+        self.insertJob = 'INSERT INTO {0} VALUES ({1})'.format(self.JOBS_TABLE, columns)
+
+    def columnDefinitions(self, fields):
+        """:return: the column definitions for fields, quoted since some field names contain spaces"""
+        return ', '.join('"{0}" {1}'.format(field, self.COLUMN_TYPES.get(field, 'TEXT')).rstrip() for field in fields)
+
+    def createTables(self):
+        self.connection.execute('CREATE TABLE IF NOT EXISTS {0} (id INTEGER PRIMARY KEY, {1} TEXT, {2})'.format(
+            self.ENTRIES_TABLE, self.TIMESTAMP, self.columnDefinitions(TopEntry.HEADER_FIELDS)))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS {0} ({1} INTEGER, {2} TEXT, {3})'.format(
+            self.JOBS_TABLE, self.ENTRY_ID, self.TIMESTAMP, self.columnDefinitions(Job.JOB_FIELDS)))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS {0} (id INTEGER PRIMARY KEY, symbol TEXT)'.format(
+            self.SYMBOLS_TABLE))
+        self.connection.commit()
+
+    def createIndexes(self):
+        """Create the indexes once the data is loaded, which is quicker than updating them on every insert."""
+        self.connection.execute('CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'.format(
+            self.ENTRIES_TABLE, self.TIMESTAMP))
+        self.connection.execute('CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'.format(
+            self.JOBS_TABLE, self.TIMESTAMP))
+        self.connection.execute('CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'.format(
+            self.JOBS_TABLE, Job.JOB_PID))
+        self.connection.execute('CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'.format(
+            self.JOBS_TABLE, self.ENTRY_ID))
+        self.connection.commit()
+
+    def writeEntry(self, topEntry, timestamp):
+        entryId = self.nextEntryId
+        self.nextEntryId += 1
+
+        header = topEntry.header
+        self.entryRows.append([entryId, timestamp] + [header.get(field) for field in TopEntry.HEADER_FIELDS])
+        for info in self.getJobInfos(topEntry):
+            self.jobRows.append([entryId, timestamp] + [info.get(field) for field in Job.JOB_FIELDS])
+
+    def flush(self):
+        with self.connection:
+            if self.symbols is not None:
+                firstId = self.numSymbolsWritten
+                self.connection.executemany('INSERT INTO {0} VALUES (?, ?)'.format(self.SYMBOLS_TABLE),
+                                            enumerate(self.getNewSymbols(), firstId))
+            self.connection.executemany(self.insertEntry, self.entryRows)
+            self.connection.executemany(self.insertJob, self.jobRows)
+        self.entryRows = []
+        self.jobRows = []
+
+    def close(self):
+        OutputSink.close(self)
+        self.createIndexes()
+        self.connection.close()
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+"""
+The client of the parse service (see parse_service), which scripts and the other subcommands use to get
+parsed top output from the service while it is running.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+__author__ = 'Dave Pinkney'
+
+# The socket used when none is given, which can be overridden with the TOP_PARSER_SOCKET environment variable
+DEFAULT_SOCKET = os.environ.get('TOP_PARSER_SOCKET', '/tmp/top_parser-{0}.sock'.format(os.getuid()))
+
+# The commands the service answers, see ParseService
+COMMANDS = ('ping', 'summary', 'header', 'jobs', 'query', 'stats')
+
+class ParseClient(object):
+    """
+    A connection to a running ParseService:
+
+        client = ParseClient.connect()
+        if client is not None:
+            series = client.request('header', file='/data/top.log', fields=['1 minute load'])
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile('rb')
+
+    @classmethod
+    def connect(cls, socketPath=DEFAULT_SOCKET):
+        """:return: ParseClient - a connection to the service, or None if it isn't running"""
+        if not os.path.exists(socketPath):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socketPath)
+        except socket.error:
+            sock.close()
+            return None
+        return cls(sock)
+
+    def request(self, command, **arguments):
+        """
+        :return: the result of the command
+        :throws: Exception if the service could not answer it
+        """
+        arguments['command'] = command
+        self.sock.sendall((json.dumps(arguments) + '\n').encode('utf-8'))
+        line = self.file.readline()
+        if not line:
+            raise Exception("The parse service closed the connection")
+        response = json.loads(line.decode('utf-8'))
+        if not response['ok']:
+            raise Exception(response['error'])
+        return response['result']
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def main(argv):
+    """
+    Answer one request, from the service if it's running, otherwise by parsing the file in this process
+    """
+    examples = """
+    Examples:
+    # The header series of a file, or the samples of one pid:
+        %prog ask header topOutput.log --fields "1 minute load" memUsed
+        %prog ask jobs topOutput.log --pid 4408
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to ask for parsed output from the top command""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", type=str, choices=COMMANDS, help="What to ask for")
+    parser.add_argument("fileName", type=str, nargs='?', default=None, help="File to ask about")
+    parser.add_argument("--fields", type=str, nargs='+', default=None, help="Fields to return, defaults to all")
+    parser.add_argument("--pid", type=str, default=None, help="Pid to return the samples of, for jobs")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET, help="The Unix socket of the service")
+    options = parser.parse_args(argv)
+
+    request = {'fields': options.fields, 'pid': options.pid}
+    if options.fileName:
+        request['file'] = os.path.abspath(options.fileName)
+
+    client = ParseClient.connect(options.socket)
+    if client is not None:
+        try:
+            result = client.request(options.command, **request)
+        finally:
+            client.close()
+    else:
+        from parse_service import ParseCache, ParseService
+        request['command'] = options.command
+        result = ParseService(ParseCache()).handle(request)
+
+    json.dump(result, sys.stdout, indent=1, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
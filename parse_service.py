@@ -0,0 +1,326 @@
+#!/usr/bin/python
+"""
+A long running local service that keeps parsed top output in memory, so that repeated analysis of the same
+files from scripts doesn't pay for starting up and re-parsing each time. Files are parsed by a warm pool of
+worker processes, and the most recently used are cached, keyed by their path, size and modification time so
+that a file which changes is parsed again. The cache is bounded by the estimated memory use of the parsed
+entries as well as by the number of files.
+
+The query and ask subcommands use the service when it is running. Parsing files to an output with the main
+command does not, since it reads each file once.
+
+Clients send one JSON request per line over a Unix socket, and get one JSON response per line, e.g.
+    {"command": "header", "file": "/data/top.log", "fields": ["1 minute load"]}
+    {"ok": true, "result": [{"timestamp": "2015-05-26 18:05:02", "1 minute load": 0.81}, ...]}
+"""
+
+import argparse
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from output_sink import JsonLinesSink, OutputSink
+from parse_client import COMMANDS, DEFAULT_SOCKET
+from segment_store import SegmentStore
+from top_parser import TopParser
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+def parseFile(fileName):
+    """
+    :return: list of TopEntry - the entries of fileName, which is top output or JSON Lines written by a
+                                JsonLinesSink. This runs in the worker processes, so it is a module level function.
+    """
+    if fileName.endswith('.jsonl') or fileName.endswith('.json'):
+        return list(JsonLinesSink.readEntries(fileName))
+    return list(TopParser(fileName).iterEntries())
+
+
+class ParseCache(object):
+    """
+    An LRU cache of parsed files, keyed by path, size and modification time. Files are parsed in a pool of
+    worker processes if one is given, and concurrent requests for a file that is being parsed wait for the
+    same parse.
+    """
+
+    CACHE_SIZE = 8
+    CACHE_BYTES = 1024 ** 3
+
+    def __init__(self, cacheSize=CACHE_SIZE, pool=None, cacheBytes=CACHE_BYTES):
+        """
+        : cacheSize - int - The number of parsed files to keep
+        : pool - multiprocessing.Pool - The workers to parse files with, or None to parse them in this process
+        : cacheBytes - int - The estimated size of the parsed entries to keep, see getSize. The most recently
+                             used file is kept even if it is larger.
+        """
+        self.cacheSize = cacheSize
+        self.cacheBytes = cacheBytes
+        self.pool = pool
+        # key -> list of TopEntry, least recently used first
+        self.entries = collections.OrderedDict()
+        # key -> the estimated size of its entries, and their total
+        self.sizes = {}
+        self.numBytes = 0
+        # key -> multiprocessing.pool.AsyncResult, for files being parsed
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def getKey(self, fileName):
+        """:return: tuple - the cache key of fileName, which changes if the file is modified"""
+        path = os.path.realpath(fileName)
+        stat = os.stat(path)
+        return path, stat.st_size, stat.st_mtime
+
+    def getEntries(self, fileName):
+        """:return: list of TopEntry - the parsed entries of fileName, from the cache if it is up to date"""
+        key = self.getKey(fileName)
+        with self.lock:
+            entries = self.entries.pop(key, None)
+            if entries is not None:
+                self.hits += 1
+                self.entries[key] = entries
+                return entries
+
+            self.misses += 1
+            result = self.pending.get(key)
+            if result is None and self.pool is not None:
+                result = self.pending[key] = self.pool.apply_async(parseFile, (key[0],))
+
+        try:
+            if result is not None:
+                entries = result.get()
+            else:
+                entries = parseFile(key[0])
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+        with self.lock:
+            # Drop older versions of the file along with the least recently used files
+            for cachedKey in [cachedKey for cachedKey in self.entries if cachedKey[0] == key[0]]:
+                self.remove(cachedKey)
+            self.entries[key] = entries
+            self.sizes[key] = self.getSize(entries)
+            self.numBytes += self.sizes[key]
+            while len(self.entries) > self.cacheSize or (self.numBytes > self.cacheBytes and len(self.entries) > 1):
+                self.remove(next(iter(self.entries)))
+        return entries
+
+    def remove(self, key):
+        """Drop a file from the cache, which the caller must hold the lock for"""
+        del self.entries[key]
+        self.numBytes -= self.sizes.pop(key)
+
+    def getSize(self, entries):
+        """:return: int - the estimated memory use of entries in bytes, estimated as SegmentStore does"""
+        return sum(SegmentStore.ENTRY_BYTES + SegmentStore.JOB_BYTES * len(topEntry.jobs) for topEntry in entries)
+
+
+class ParseService(object):
+    """
+    Answers requests about parsed files. Each request is a dict with a 'command' and its arguments.
+    """
+
+    COMMAND_PING = 'ping'
+    COMMAND_SUMMARY = 'summary'
+    COMMAND_HEADER = 'header'
+    COMMAND_JOBS = 'jobs'
+    COMMAND_QUERY = 'query'
+    COMMAND_STATS = 'stats'
+    COMMANDS = COMMANDS
+
+    def __init__(self, cache):
+        """
+        : cache - ParseCache - The cache of parsed files
+        """
+        self.cache = cache
+
+    def handle(self, request):
+        """
+        :return: the result of request, which can be converted to JSON
+        :throws: Exception if the request is not valid
+        """
+        command = request.get('command')
+        if command not in self.COMMANDS:
+            raise Exception("Unknown command {0}, expected one of {1}".format(command, ', '.join(self.COMMANDS)))
+        if command == self.COMMAND_PING:
+            return 'pong'
+        if command == self.COMMAND_STATS:
+            return {'hits': self.cache.hits, 'misses': self.cache.misses, 'files': len(self.cache.entries),
+                    'bytes': self.cache.numBytes}
+
+        if 'file' not in request:
+            raise Exception("The {0} command needs a file".format(command))
+        entries = self.cache.getEntries(request['file'])
+
+        if command == self.COMMAND_SUMMARY:
+            return self.getSummary(entries)
+        elif command == self.COMMAND_HEADER:
+            return self.getHeaderSeries(entries, request.get('fields'))
+        elif command == self.COMMAND_JOBS:
+            if request.get('pid') is None:
+                raise Exception("The jobs command needs a pid")
+            return self.getJobSeries(entries, str(request['pid']), request.get('fields'))
+        else:
+            return self.runQuery(entries, request.get('args', []))
+
+    def getSummary(self, entries):
+        """:return: dict - the number of entries and jobs, and the time range of entries"""
+        summary = {'entries': len(entries), 'jobs': sum(len(topEntry.jobs) for topEntry in entries)}
+        if entries:
+            summary['start'] = self.getTimestamp(entries[0])
+            summary['end'] = self.getTimestamp(entries[-1])
+        return summary
+
+    def getHeaderSeries(self, entries, fields=None):
+        """:return: list of dict - the timestamp and header fields of each entry, or just the given fields"""
+        series = []
+        for topEntry in entries:
+            header = topEntry.header
+            values = dict((field, header.get(field)) for field in fields) if fields else dict(header)
+            values[OutputSink.TIMESTAMP] = self.getTimestamp(topEntry)
+            series.append(values)
+        return series
+
+    def getJobSeries(self, entries, pid, fields=None):
+        """:return: list of dict - the timestamp and fields of the job with pid, in each entry that it's in"""
+        series = []
+        for topEntry in entries:
+            job = topEntry.jobs.get(pid)
+            if job is not None:
+                info = job.info
+                values = dict((field, info.get(field)) for field in fields) if fields else dict(info)
+                values[OutputSink.TIMESTAMP] = self.getTimestamp(topEntry)
+                series.append(values)
+        return series
+
+    def runQuery(self, entries, args):
+        """
+        : args - list of string - The arguments of the query subcommand. Its file name is ignored, since the
+                                  entries are given.
+        :return: dict - the columns and rows of the result of the query
+        """
+        import top_query
+        parser = top_query.getArgumentParser()
+
+        def error(message):
+            raise Exception("Invalid query: {0}".format(message))
+
+        # argparse exits on bad arguments, which would drop the connection rather than report the error
+        parser.error = error
+        options = parser.parse_args(args)
+        query = top_query.buildQuery(options)
+        rows = query.run(entries)
+        return {'columns': query.getColumns(),
+                'rows': [[value if isinstance(value, (int, float)) or value is None else str(value)
+                          for value in row] for row in rows]}
+
+    def getTimestamp(self, topEntry):
+        return topEntry.getDateTime().strftime(OutputSink.TIMESTAMP_FORMAT)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles the requests of one client connection, one JSON request per line.
+    """
+
+    def handle(self):
+        service = self.server.service
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            try:
+                response = {'ok': True, 'result': service.handle(json.loads(line.decode('utf-8')))}
+            except Exception as e:
+                logger.debug("Request failed: %s", e)
+                response = {'ok': False, 'error': str(e)}
+            except SystemExit as e:
+                # e.g. from a query's --help, which should fail the request rather than end the connection
+                response = {'ok': False, 'error': "The request exited with status {0}".format(e.code)}
+            self.wfile.write((json.dumps(response, separators=(',', ':')) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class ServiceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves each connection in its own thread, so a request for a file that is being parsed doesn't
+    hold up requests for files that are cached.
+    """
+    daemon_threads = True
+
+    def __init__(self, socketPath, service):
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+        socketserver.UnixStreamServer.__init__(self, socketPath, RequestHandler)
+        self.service = service
+
+
+def serve(socketPath=DEFAULT_SOCKET, cacheSize=ParseCache.CACHE_SIZE, processes=None,
+          cacheBytes=ParseCache.CACHE_BYTES):
+    """Run the service until interrupted"""
+    pool = multiprocessing.Pool(processes)
+    server = ServiceServer(socketPath, ParseService(ParseCache(cacheSize, pool, cacheBytes)))
+    logger.info("Serving parsed top output on {0}".format(socketPath))
+    # Exit through the finally block on kill too, so the socket is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        os.remove(socketPath)
+        pool.terminate()
+
+
+def main(argv):
+    examples = """
+    Examples:
+    # Run the service, which other commands use while it is running:
+        %prog serve &
+
+    # Ask it for the header series of a file, or the samples of one pid, see "%prog ask --help":
+        %prog ask header topOutput.log --fields "1 minute load" memUsed
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to serve parsed output from the top command""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET, help="The Unix socket to listen on")
+    parser.add_argument("--cache-size", type=int, default=ParseCache.CACHE_SIZE, help="Number of parsed files to keep")
+    parser.add_argument("--cache-memory", type=int, default=ParseCache.CACHE_BYTES // (1024 * 1024),
+                        help="Megabytes of parsed entries to keep, estimated from their number of jobs")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Number of worker processes, defaults to the number of cpus")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    options = parser.parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.INFO
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    serve(options.socket, options.cache_size, options.processes, options.cache_memory * 1024 * 1024)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
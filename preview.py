@@ -0,0 +1,363 @@
+#!/usr/bin/python
+"""
+This module previews an enormous top capture by parsing a sample of its snapshots, rather than all of them.
+It seeks to evenly spaced or random byte offsets, skips to the start of the next snapshot from each, and parses
+only that snapshot, so the time a preview takes grows with the number of samples rather than the size of the
+file. The header fields and the busiest commands are then estimated from the sample, with standard errors.
+"""
+
+import argparse
+import datetime
+import logging
+import math
+import os
+import random
+import sys
+
+from job import Job
+from output_sink import OutputSink
+from top_entry import TopEntry
+from top_format import TopFormat
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+def estimate(values, populationSize=None):
+    """
+    : values - list of float - A random sample of a population
+    : populationSize - float - The (estimated) size of the population, to correct the standard error of samples
+                               that are a large part of it. None if unknown.
+    :return: (float, float) - the mean of values, and the standard error of the mean as an estimate of the
+                              population's mean
+    """
+    n = len(values)
+    if n == 0:
+        return None, None
+    mean = sum(values) / float(n)
+    if n == 1:
+        return mean, None
+    variance = sum((value - mean) ** 2 for value in values) / (n - 1)
+    correction = max(0.0, 1.0 - n / float(populationSize)) if populationSize else 1.0
+    return mean, math.sqrt(variance / n * correction)
+
+
+class LineReader(object):
+    """
+    Reads the lines of a file opened in binary mode as text, keeping track of the byte offset of the next line,
+    so that snapshots can be found at any byte offset without the cost of tell on a text file.
+    """
+
+    # Lines are only decoded in python 3
+    DECODE = str is not bytes
+
+    def __init__(self, f):
+        self.f = f
+        self.position = 0
+
+    def seek(self, offset):
+        self.f.seek(offset)
+        self.position = offset
+
+    def readline(self):
+        line = self.f.readline()
+        self.position += len(line)
+        if self.DECODE:
+            line = line.decode('utf-8', 'replace')
+        return line
+
+
+class SnapshotSampler(object):
+    """
+    Picks a sample of the snapshots in a capture, splitting the file into numSamples equal byte ranges and
+    parsing the first snapshot that starts after the start of each (METHOD_EVEN), or after a random offset in
+    each (METHOD_RANDOM, a stratified random sample). A snapshot is picked when an offset lands in the snapshot
+    before it, so snapshots are picked in proportion to the size of the one before them, which is nearly
+    uniform since a capture's snapshots are of similar sizes.
+
+    Evenly spaced snapshots can all land on the same phase of a periodic pattern, e.g. an hourly job in a capture
+    taken every minute, so the random method is the default.
+    """
+
+    METHOD_EVEN = 'even'
+    METHOD_RANDOM = 'random'
+    METHODS = (METHOD_EVEN, METHOD_RANDOM)
+
+    SAMPLES = 100
+
+    # The first line of a snapshot, possibly after a date line
+    SNAPSHOT_START = 'top - '
+
+    def __init__(self, fileName, numSamples=SAMPLES, method=METHOD_RANDOM, seed=None):
+        """
+        : fileName - string - The capture to sample, which must be a file rather than a stream
+        : numSamples - int - The number of offsets to sample from. Fewer snapshots are returned if the file
+                             has fewer, or if several offsets land in the same one.
+        : method - string - One of METHODS
+        : seed - int - The seed for METHOD_RANDOM, for a repeatable sample
+        """
+        if method not in self.METHODS:
+            raise Exception("Unknown method {0}, expected one of {1}".format(method, ', '.join(self.METHODS)))
+        self.fileName = fileName
+        self.numSamples = numSamples
+        self.method = method
+        self.random = random.Random(seed)
+        self.fileSize = os.path.getsize(fileName)
+
+    def getOffsets(self):
+        """:return: list of int - the byte offsets to find a snapshot after, in increasing order"""
+        stratum = self.fileSize / float(self.numSamples)
+        if self.method == self.METHOD_EVEN:
+            return [int(i * stratum) for i in range(self.numSamples)]
+        return [int((i + self.random.random()) * stratum) for i in range(self.numSamples)]
+
+    def iterSnapshots(self):
+        """
+        Yield the sampled snapshots in file order
+        :return: generator of (int, int, TopEntry) - the byte offsets of the start and end of each snapshot, and
+                                                     the snapshot
+        """
+        topFormat = TopFormat()
+        lastStart = None
+        with open(self.fileName, 'rb') as f:
+            reader = LineReader(f)
+            for offset in self.getOffsets():
+                start, firstLine = self.findSnapshot(reader, offset)
+                if firstLine is None:
+                    break
+                if start == lastStart:
+                    # Several offsets landed in the same snapshot
+                    continue
+                lastStart = start
+                try:
+                    topEntry = TopEntry(None, None, None, topFormat).parse(firstLine, reader)
+                except Exception as e:
+                    # Most likely the last snapshot of a capture that is still being written
+                    logger.debug("Could not parse the snapshot at {0}: {1}".format(start, e))
+                    continue
+                yield start, reader.position, topEntry
+
+    def findSnapshot(self, reader, offset):
+        """
+        Find the first snapshot that starts after offset, leaving reader positioned after its first line.
+        :return: (int, string) - the offset of the snapshot, and its first line, which is its date if it has one.
+                                 The line is None if there is no snapshot after offset.
+        """
+        if offset > 0:
+            # Skip to the start of the next line, which is the line at offset if it starts there
+            reader.seek(offset - 1)
+            reader.readline()
+        else:
+            reader.seek(0)
+
+        dateStart = dateLine = None
+        # The line before a snapshot's top line is either its date or the end of the previous snapshot. A top
+        # line that is the first line read may have had a date before it, so the next snapshot is used instead.
+        previousLine = None if offset > 0 else ''
+        while True:
+            start = reader.position
+            line = reader.readline()
+            if not line:
+                return None, None
+            if line.startswith(self.SNAPSHOT_START) and previousLine is not None:
+                if dateLine is not None:
+                    # Go back to the top line, which the date is parsed before
+                    reader.seek(start)
+                    return dateStart, dateLine.strip()
+                return start, line.strip()
+            if TopEntry.RE_DATE.match(line):
+                dateStart, dateLine = start, line
+            else:
+                dateStart = dateLine = None
+            previousLine = line
+
+
+class Preview(object):
+    """
+    Estimates of the header fields and the busiest commands of a capture, from a sample of its snapshots.
+    Each command's cpu and resident memory is the sum over its jobs in a snapshot, and is zero in snapshots
+    that it's not in.
+    """
+
+    DEFAULT_FIELDS = (TopEntry.LOAD_1_MINUTE, TopEntry.CPU_IDLE, TopEntry.CPU_UNNICED, TopEntry.CPU_WAIT,
+                      TopEntry.MEM_USED, TopEntry.SWAP_USED)
+    NUM_COMMANDS = 10
+
+    # The number of standard errors either side of an estimate for a 95% confidence interval
+    Z_95 = 1.96
+
+    def __init__(self, fields=DEFAULT_FIELDS):
+        """
+        : fields - list of string - The TopEntry header fields to estimate
+        """
+        self.fields = list(fields)
+        self.fileSize = None
+        # (start offset, time, header values) of each snapshot, in file order. The time is the snapshot's
+        # datetime if it has a date line, otherwise its uptime as a timedelta, since its date is made up from that
+        self.samples = []
+        self.snapshotBytes = []
+        # command -> {sample number: [cpu, resident memory]}
+        self.commands = {}
+
+    def addSnapshots(self, sampler):
+        """Add the snapshots picked by a SnapshotSampler"""
+        self.fileSize = sampler.fileSize
+        for start, end, topEntry in sampler.iterSnapshots():
+            self.addSnapshot(start, end, topEntry)
+
+    def addSnapshot(self, start, end, topEntry):
+        sampleNumber = len(self.samples)
+        header = topEntry.header
+        if topEntry.hasDate is False:
+            time = datetime.timedelta(minutes=header.get(TopEntry.UPTIME_MINUTES, 0))
+        else:
+            time = topEntry.getDateTime()
+        self.samples.append((start, time, [header.get(field) for field in self.fields]))
+        self.snapshotBytes.append(end - start)
+        for job in topEntry.jobs.values():
+            info = job.info
+            usages = self.commands.setdefault(info.get(Job.JOB_COMMAND), {})
+            usage = usages.get(sampleNumber)
+            if usage is None:
+                usage = usages[sampleNumber] = [0.0, 0]
+            usage[0] += info.get(Job.JOB_CPU) or 0.0
+            usage[1] += info.get(Job.JOB_RES) or 0
+
+    def getNumSnapshots(self):
+        """:return: float - the estimated number of snapshots in the capture, or None if none were sampled"""
+        if not self.snapshotBytes:
+            return None
+        return self.fileSize / (sum(self.snapshotBytes) / float(len(self.snapshotBytes)))
+
+    def getFieldEstimates(self):
+        """:return: list of (string, float, float) - each field, its estimated mean and the standard error"""
+        numSnapshots = self.getNumSnapshots()
+        estimates = []
+        for i, field in enumerate(self.fields):
+            values = [values[i] for start, time, values in self.samples if values[i] is not None]
+            mean, stdErr = estimate(values, numSnapshots)
+            estimates.append((field, mean, stdErr))
+        return estimates
+
+    def getCommandEstimates(self, numCommands=NUM_COMMANDS):
+        """
+        :return: list of (string, float, float, float, float) - the commands with the highest estimated mean cpu,
+                 each with its mean cpu and standard error, and its mean resident memory and standard error
+        """
+        numSamples = len(self.samples)
+        numSnapshots = self.getNumSnapshots()
+        estimates = []
+        for command, usages in self.commands.items():
+            cpu = [0.0] * numSamples
+            res = [0.0] * numSamples
+            for sampleNumber, (sampleCpu, sampleRes) in usages.items():
+                cpu[sampleNumber] = sampleCpu
+                res[sampleNumber] = float(sampleRes)
+            estimates.append((command,) + estimate(cpu, numSnapshots) + estimate(res, numSnapshots))
+        estimates.sort(key=lambda commandEstimate: -commandEstimate[1])
+        return estimates[:numCommands]
+
+    def report(self, numCommands=NUM_COMMANDS):
+        """:return: string - the estimates, with 95% confidence intervals"""
+        if not self.samples:
+            return "No snapshots were found\n"
+
+        lines = ["Sampled {0} of about {1:.0f} snapshots{2}".format(len(self.samples), self.getNumSnapshots(),
+                                                                    self.formatRange()), ""]
+
+        lines.append("{0:<20} {1:>14} {2:>14}".format('field', 'mean', '95% +/-'))
+        for field, mean, stdErr in self.getFieldEstimates():
+            lines.append("{0:<20} {1:>14} {2:>14}".format(field, self.formatValue(mean),
+                                                          self.formatValue(stdErr, self.Z_95)))
+        lines.append("")
+
+        lines.append("{0:<20} {1:>14} {2:>14} {3:>14} {4:>14}".format('command', 'mean %CPU', '95% +/-',
+                                                                        'mean RES', '95% +/-'))
+        for command, cpu, cpuStdErr, res, resStdErr in self.getCommandEstimates(numCommands):
+            lines.append("{0:<20} {1:>14} {2:>14} {3:>14} {4:>14}".format(
+                command[:20], self.formatValue(cpu), self.formatValue(cpuStdErr, self.Z_95), self.formatValue(res),
+                self.formatValue(resStdErr, self.Z_95)))
+        return '\n'.join(lines) + '\n'
+
+    def isDated(self):
+        """:return: True if every sampled snapshot has a date line"""
+        return all(isinstance(time, datetime.datetime) for start, time, values in self.samples)
+
+    def formatRange(self):
+        """
+        :return: string - the range of the samples' times, or of their uptimes if none of them have a date, or
+                          nothing if some do and some don't
+        """
+        times = [time for start, time, values in self.samples]
+        if self.isDated() or not any(isinstance(time, datetime.datetime) for time in times):
+            return ", from {0} to {1}".format(self.formatTime(min(times)), self.formatTime(max(times)))
+        return ""
+
+    def formatTime(self, time):
+        """:return: string - a sample's time, as a timestamp if it has a date, otherwise as its uptime"""
+        if isinstance(time, datetime.timedelta):
+            days, minutes = divmod(int(time.total_seconds()) // 60, 24 * 60)
+            return "uptime {0}d {1:02d}:{2:02d}".format(days, minutes // 60, minutes % 60)
+        return time.strftime(OutputSink.TIMESTAMP_FORMAT)
+
+    def formatValue(self, value, scale=1.0):
+        if value is None:
+            return '-'
+        return "{0:.2f}".format(value * scale)
+
+
+def main(argv):
+    examples = """
+    Examples:
+    # Estimate load, cpu and memory, and the busiest commands, from a random snapshot in each hundredth of the file:
+        %prog preview huge.log
+
+    # From 500 evenly spaced snapshots, also printing each sampled snapshot's fields:
+        %prog preview huge.log --samples 500 --method even --trend
+
+    # From a repeatable random sample:
+        %prog preview huge.log --seed 1
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to preview large captures of the top command""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("fileName", type=str, help="File to preview, which can't be stdin")
+    parser.add_argument("--samples", type=int, default=SnapshotSampler.SAMPLES,
+                        help="Number of snapshots to sample")
+    parser.add_argument("--method", type=str, default=SnapshotSampler.METHOD_RANDOM, choices=SnapshotSampler.METHODS,
+                        help="Sample a random snapshot from each part of the file, or evenly spaced snapshots")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the random method")
+    parser.add_argument("--fields", type=str, nargs='+', default=list(Preview.DEFAULT_FIELDS),
+                        choices=TopEntry.HEADER_FIELDS, help="Header fields to estimate")
+    parser.add_argument("--commands", type=int, default=Preview.NUM_COMMANDS,
+                        help="Number of the busiest commands to report")
+    parser.add_argument("--trend", action='store_true',
+                        help="Also print the fields of each sampled snapshot, in time order")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    options = parser.parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.INFO
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    preview = Preview(options.fields)
+    preview.addSnapshots(SnapshotSampler(options.fileName, options.samples, options.method, options.seed))
+    sys.stdout.write(preview.report(options.commands))
+
+    if options.trend:
+        # Snapshots without a date are given by their uptime
+        timeColumn = OutputSink.TIMESTAMP if preview.isDated() else 'time'
+        sys.stdout.write("\n{0}\n".format(','.join([timeColumn] + preview.fields)))
+        for start, time, values in preview.samples:
+            sys.stdout.write("{0}\n".format(','.join([preview.formatTime(time)] +
+                                                     ['' if value is None else str(value) for value in values])))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
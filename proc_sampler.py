@@ -0,0 +1,411 @@
+#!/usr/bin/python
+"""
+This module samples the state of the system directly from /proc into TopEntry and Job objects, the same data
+that top displays, without running top and parsing its text output.
+"""
+
+import argparse
+import datetime
+import errno
+import logging
+import os
+import resource
+import struct
+import sys
+import time
+
+from job import Job
+from output_sink import OutputSink
+from top_entry import TopEntry
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class ProcSampler(object):
+    """
+    Reads /proc at each sample, keeping the files that are read every time open and reusing them.
+    Percentages are computed from the change in the cpu counters since the previous sample, as top does. The
+    first sample's job cpu percentages are averages over each process's lifetime, as ps reports them.
+    """
+
+    # The buffer size for reads. /proc files are generated on read, so each is read with a single call.
+    READ_SIZE = 64 * 1024
+    READ_SIZE_LARGE = 1024 * 1024
+
+    # Descriptors to keep free for everything else when caching the per-process files
+    RESERVED_FDS = 64
+
+    # Order of the cpu time counters in /proc/stat
+    CPU_COUNTERS = (TopEntry.CPU_UNNICED, TopEntry.CPU_NICED, TopEntry.CPU_SYSTEM, TopEntry.CPU_IDLE,
+                    TopEntry.CPU_WAIT, TopEntry.CPU_HI, TopEntry.CPU_SI, TopEntry.CPU_ST)
+
+    # utmp record layout on Linux: type is the first int, records are 384 bytes
+    UTMP_RECORD_SIZE = 384
+    UTMP_USER_PROCESS = 7
+
+    def __init__(self, threads=False, perCpu=False, procDir='/proc', utmpFile='/var/run/utmp'):
+        """
+        : threads - boolean - True to sample each thread, like top -H, rather than each process
+        : perCpu - boolean - True to also sample each cpu into TopEntry.cpus, like top -1
+        : procDir - string - Where proc is mounted
+        : utmpFile - string - The utmp file used to count logged in users
+        """
+        self.threads = threads
+        self.perCpu = perCpu
+        self.procDir = procDir
+        self.utmpFile = utmpFile
+
+        self.clockTicks = os.sysconf('SC_CLK_TCK')
+        self.pageKiB = os.sysconf('SC_PAGE_SIZE') // 1024
+
+        self.statFd = self.open('stat')
+        self.meminfoFd = self.open('meminfo')
+        self.loadavgFd = self.open('loadavg')
+        self.uptimeFd = self.open('uptime')
+
+        # path -> fd, for the per-process files
+        self.fds = {}
+        softLimit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        if softLimit == resource.RLIM_INFINITY:
+            softLimit = 4096
+        self.maxFds = max(softLimit - self.RESERVED_FDS, 0)
+
+        # cpu number or None for the summary -> counters at the previous sample
+        self.previousCpu = {}
+        # tid -> cpu ticks at the previous sample
+        self.previousTicks = {}
+        self.previousUptime = None
+        # tid -> uid, which is read once per process
+        self.uids = {}
+        # uid -> user name
+        self.userNames = {}
+
+    def close(self):
+        """Close all of the files held open by the sampler"""
+        for fd in [self.statFd, self.meminfoFd, self.loadavgFd, self.uptimeFd] + list(self.fds.values()):
+            os.close(fd)
+        self.fds = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def open(self, path):
+        return os.open(os.path.join(self.procDir, path), os.O_RDONLY)
+
+    def readFd(self, fd, size=READ_SIZE):
+        """:return: string - the contents of the file open as fd, read from the start"""
+        os.lseek(fd, 0, os.SEEK_SET)
+        data = os.read(fd, size)
+        if bytes is not str:
+            data = data.decode('utf-8', 'replace')
+        return data
+
+    def readProcFile(self, path):
+        """
+        Read a per-process file, reusing its descriptor from previous samples if possible.
+        :return: string - the contents, or None if the process has exited
+        """
+        fd = self.fds.get(path)
+        try:
+            if fd is None:
+                fd = self.open(path)
+                if len(self.fds) < self.maxFds:
+                    self.fds[path] = fd
+                else:
+                    try:
+                        return self.readFd(fd)
+                    finally:
+                        os.close(fd)
+            return self.readFd(fd)
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.ENOENT, errno.ESRCH):
+                raise
+            if path in self.fds:
+                os.close(self.fds.pop(path))
+            return None
+
+    def sample(self):
+        """
+        :return: TopEntry - the current state of the system
+        """
+        topEntry = TopEntry(True)
+        header = topEntry.header
+        now = datetime.datetime.now()
+        header[TopEntry.DATE] = now.date().toordinal()
+        header[TopEntry.TIME_OF_DAY] = now.strftime('%H:%M:%S')
+
+        uptime = float(self.readFd(self.uptimeFd).split()[0])
+        elapsed = uptime - self.previousUptime if self.previousUptime is not None else None
+        self.previousUptime = uptime
+
+        header[TopEntry.UPTIME_MINUTES] = int(uptime // 60)
+        header[TopEntry.NUM_USERS] = self.countUsers()
+        loads = self.readFd(self.loadavgFd).split()
+        header[TopEntry.LOAD_1_MINUTE] = float(loads[0])
+        header[TopEntry.LOAD_5_MINUTES] = float(loads[1])
+        header[TopEntry.LOAD_15_MINUTES] = float(loads[2])
+
+        self.sampleCpu(topEntry)
+        self.sampleMem(header)
+        self.sampleJobs(topEntry, uptime, elapsed)
+        return topEntry
+
+    def iterSamples(self, interval=1.0, count=None):
+        """
+        Yield a sample every interval seconds, count times or forever if count is None
+        """
+        numSamples = 0
+        nextTime = time.time()
+        while count is None or numSamples < count:
+            yield self.sample()
+            numSamples += 1
+            nextTime += interval
+            delay = nextTime - time.time()
+            if delay > 0 and (count is None or numSamples < count):
+                time.sleep(delay)
+
+    def sampleCpu(self, topEntry):
+        """
+        Set the cpu percentages from /proc/stat, e.g.
+        cpu  10296 0 1436 68104 118 0 0 159 0 0
+        cpu0 10296 0 1436 68104 118 0 0 159 0 0
+        """
+        for line in self.readFd(self.statFd, self.READ_SIZE_LARGE).splitlines():
+            if not line.startswith('cpu'):
+                break
+            fields = line.split()
+            if fields[0] == 'cpu':
+                cpu = None
+                values = topEntry.header
+            elif self.perCpu:
+                cpu = int(fields[0][3:])
+                values = topEntry.cpus.setdefault(cpu, {})
+            else:
+                continue
+
+            counters = [int(value) for value in fields[1:9]]
+            counters += [0] * (len(self.CPU_COUNTERS) - len(counters))
+            previous = self.previousCpu.get(cpu, [0] * len(counters))
+            self.previousCpu[cpu] = counters
+
+            deltas = [current - before for current, before in zip(counters, previous)]
+            total = float(sum(deltas)) or 1.0
+            for field, delta in zip(self.CPU_COUNTERS, deltas):
+                values[field] = round(100 * delta / total, 1)
+
+    def sampleMem(self, header):
+        """
+        Set the memory and swap values from /proc/meminfo, in KiB. Used memory is computed as procps-ng 4 does,
+        from MemAvailable when the kernel provides it.
+        """
+        meminfo = {}
+        for line in self.readFd(self.meminfoFd).splitlines():
+            name, _, value = line.partition(':')
+            meminfo[name] = int(value.split()[0])
+
+        total = meminfo['MemTotal']
+        free = meminfo['MemFree']
+        buffCache = meminfo.get('Buffers', 0) + meminfo.get('Cached', 0) + meminfo.get('SReclaimable', 0)
+        header[TopEntry.MEM_TOTAL] = total
+        header[TopEntry.MEM_FREE] = free
+        header[TopEntry.MEM_BUFFERS] = meminfo.get('Buffers', 0)
+        header[TopEntry.MEM_BUFF_CACHE] = buffCache
+        if 'MemAvailable' in meminfo:
+            header[TopEntry.MEM_AVAILABLE] = meminfo['MemAvailable']
+            header[TopEntry.MEM_USED] = total - meminfo['MemAvailable']
+        else:
+            header[TopEntry.MEM_USED] = total - free - buffCache
+
+        header[TopEntry.SWAP_TOTAL] = meminfo.get('SwapTotal', 0)
+        header[TopEntry.SWAP_FREE] = meminfo.get('SwapFree', 0)
+        header[TopEntry.SWAP_USED] = header[TopEntry.SWAP_TOTAL] - header[TopEntry.SWAP_FREE]
+        header[TopEntry.SWAP_CACHED] = meminfo.get('Cached', 0)
+        self.memTotal = total
+
+    def countUsers(self):
+        """:return: int - the number of user sessions in utmp, as counted by top and uptime"""
+        try:
+            with open(self.utmpFile, 'rb') as f:
+                data = f.read()
+        except IOError:
+            return 0
+        numUsers = 0
+        for offset in range(0, len(data) - self.UTMP_RECORD_SIZE + 1, self.UTMP_RECORD_SIZE):
+            if struct.unpack_from('<i', data, offset)[0] == self.UTMP_USER_PROCESS:
+                numUsers += 1
+        return numUsers
+
+    def listTasks(self):
+        """:return: list of (tgid, path of the task's directory relative to procDir)"""
+        pids = [name for name in os.listdir(self.procDir) if name.isdigit()]
+        if not self.threads:
+            return [(pid, pid) for pid in pids]
+
+        tasks = []
+        for pid in pids:
+            try:
+                tids = os.listdir(os.path.join(self.procDir, pid, 'task'))
+            except OSError:
+                continue
+            tasks.extend((pid, os.path.join(pid, 'task', tid)) for tid in tids)
+        return tasks
+
+    def sampleJobs(self, topEntry, uptime, elapsed):
+        """
+        Add a Job to topEntry for each process (or thread), and set the task counts in its header
+        : elapsed - float - Seconds since the previous sample, or None if this is the first
+        """
+        counts = {TopEntry.TASKS_RUNNING: 0, TopEntry.TASKS_SLEEPING: 0, TopEntry.TASKS_STOPPED: 0,
+                  TopEntry.TASKS_ZOMBIE: 0}
+        states = {'R': TopEntry.TASKS_RUNNING, 'T': TopEntry.TASKS_STOPPED, 't': TopEntry.TASKS_STOPPED,
+                  'Z': TopEntry.TASKS_ZOMBIE}
+        ticks = {}
+
+        for tgid, path in self.listTasks():
+            job = self.sampleJob(tgid, path, uptime, elapsed, ticks)
+            if job is None:
+                continue
+            topEntry.jobs[job.getPid()] = job
+            counts[states.get(job.info[Job.JOB_STATUS], TopEntry.TASKS_SLEEPING)] += 1
+
+        # Forget the processes that have exited
+        self.previousTicks = ticks
+        for tid in [tid for tid in self.uids if tid not in ticks]:
+            del self.uids[tid]
+        for path in list(self.fds):
+            if os.path.basename(os.path.dirname(path)) not in ticks:
+                os.close(self.fds.pop(path))
+
+        header = topEntry.header
+        header[TopEntry.TASKS_TOTAL] = len(topEntry.jobs)
+        header.update(counts)
+
+    def sampleJob(self, tgid, path, uptime, elapsed, ticks):
+        """
+        Read one process or thread from /proc/[path]/stat and statm, e.g.
+        4856 (cat) R 4850 4856 4850 0 -1 4194304 83 0 0 0 0 0 0 0 20 0 1 0 80043 2703360 307 ...
+        660 331 305 5 0 123 0
+        :return: Job, or None if it exited while being read
+        """
+        stat = self.readProcFile(os.path.join(path, 'stat'))
+        statm = self.readProcFile(os.path.join(path, 'statm'))
+        if not stat or not statm:
+            return None
+
+        # The command is in parentheses and may contain spaces or parentheses itself
+        commandStart = stat.index('(')
+        commandEnd = stat.rindex(')')
+        tid = stat[:commandStart].strip()
+        fields = stat[commandEnd + 2:].split()
+        size, resident, shared = [int(value) * self.pageKiB for value in statm.split()[:3]]
+
+        cpuTicks = int(fields[11]) + int(fields[12])
+        ticks[tid] = cpuTicks
+        previous = self.previousTicks.get(tid)
+        if elapsed and previous is not None:
+            cpuPercent = 100.0 * (cpuTicks - previous) / (elapsed * self.clockTicks)
+        else:
+            lifetime = uptime - float(fields[19]) / self.clockTicks
+            cpuPercent = 100.0 * cpuTicks / (lifetime * self.clockTicks) if lifetime > 0 else 0.0
+
+        uid = self.uids.get(tid)
+        if uid is None:
+            uid = self.readUid(path)
+            if uid is None:
+                return None
+            self.uids[tid] = uid
+
+        priority = int(fields[15])
+        hundredths = cpuTicks * 100 // self.clockTicks
+
+        job = Job()
+        job.info = {
+            Job.JOB_PID: tid,
+            Job.JOB_USER: self.getUserName(uid),
+            Job.JOB_PR: 'rt' if priority < -99 else str(priority),
+            Job.JOB_NI: int(fields[16]),
+            Job.JOB_VIRT: size,
+            Job.JOB_RES: resident,
+            Job.JOB_SHR: shared,
+            Job.JOB_STATUS: fields[0],
+            Job.JOB_CPU: round(cpuPercent, 1),
+            Job.JOB_MEM: round(100.0 * resident / self.memTotal, 1),
+            Job.JOB_TIME: "{0}:{1:02d}.{2:02d}".format(hundredths // 6000, hundredths % 6000 // 100, hundredths % 100),
+            Job.JOB_COMMAND: stat[commandStart + 1:commandEnd],
+            Job.JOB_PPID: fields[1],
+            Job.JOB_TGID: tgid,
+            Job.JOB_UID: uid,
+            Job.JOB_THREADS: int(fields[17]),
+            Job.JOB_LAST_CPU: int(fields[36]),
+        }
+        return job
+
+    def readUid(self, path):
+        """:return: int - the effective uid of a process from /proc/[path]/status, or None if it has exited"""
+        try:
+            with open(os.path.join(self.procDir, path, 'status')) as f:
+                for line in f:
+                    if line.startswith('Uid:'):
+                        return int(line.split()[2])
+        except IOError:
+            return None
+
+    def getUserName(self, uid):
+        name = self.userNames.get(uid)
+        if name is None:
+            try:
+                import pwd
+                name = pwd.getpwuid(uid).pw_name
+            except (ImportError, KeyError):
+                name = str(uid)
+            self.userNames[uid] = name
+        return name
+
+
+def main(argv):
+    examples = """
+    Examples:
+    # Sample the system every second for a minute, into an SQLite database:
+        %prog sample --interval 1 --count 60 -o top.db
+
+    # Sample each thread, like top -H, until interrupted:
+        %prog sample --threads -o threads.jsonl
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to sample from /proc what top would display""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("-o", "--output", type=str, required=True,
+                        help="File to write the samples to, as SQLite, JSON Lines or CSV")
+    parser.add_argument("--format", type=str, default=None, choices=OutputSink.FORMATS,
+                        help="Format of the output file, defaults to a format based on its extension")
+    parser.add_argument("--interval", type=float, default=3.0, help="Seconds between samples")
+    parser.add_argument("--count", type=int, default=None, help="Number of samples to take, default is forever")
+    parser.add_argument("--threads", action='store_true', help="Sample each thread rather than each process")
+    parser.add_argument("--per-cpu", action='store_true', help="Sample each cpu as well as the summary")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    options = parser.parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.INFO
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    with ProcSampler(options.threads, options.per_cpu) as sampler:
+        with OutputSink.create(options.output, options.format) as sink:
+            try:
+                sink.writeAll(sampler.iterSamples(options.interval, options.count))
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,142 @@
+"""
+A store for parsed top entries that keeps its memory use within a budget, by spilling entries to segment files
+on disk and reading them back on demand.
+"""
+
+import bisect
+import collections
+import logging
+import os
+import shutil
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class SegmentStore(object):
+    """
+    A sequence of TopEntry objects that holds at most memoryBudget bytes of them in memory. Entries are appended
+    to an in-memory segment, which is written to a file in directory once it reaches its share of the budget.
+    Reading an entry that has been spilled loads its whole segment, and the most recently read segments are
+    kept in an LRU cache, so sequential and local access only reads each segment once.
+
+    Sizes are estimated from the number of jobs in each entry, since measuring the real size of the objects
+    would cost more than parsing them.
+    """
+
+    # Estimated memory use of an entry's header and of each job, in bytes
+    ENTRY_BYTES = 4096
+    JOB_BYTES = 1024
+
+    # Number of spilled segments to keep loaded
+    NUM_CACHED_SEGMENTS = 3
+
+    def __init__(self, memoryBudget, directory=None, numCachedSegments=NUM_CACHED_SEGMENTS):
+        """
+        : memoryBudget - int - The number of bytes of entries to hold in memory, split between the segment being
+                               appended to and the cached segments
+        : directory - string - Where to write the segment files, defaults to a new temporary directory which
+                               is removed by close
+        : numCachedSegments - int - The number of spilled segments to keep loaded
+        """
+        self.segmentBytes = max(memoryBudget // (numCachedSegments + 1), 1)
+        self.numCachedSegments = numCachedSegments
+        self.ownsDirectory = directory is None
+        self.directory = directory if directory is not None else tempfile.mkdtemp(prefix='top_segments')
+
+        # The segment being appended to, and its estimated size
+        self.pending = []
+        self.pendingBytes = 0
+        # The index of the first entry of each spilled segment, and the file it was written to
+        self.segmentStarts = []
+        self.segmentFiles = []
+        self.numSpilled = 0
+        # segment number -> list of entries, least recently used first
+        self.cache = collections.OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.numSpilled + len(self.pending)
+
+    def __iter__(self):
+        for segment in range(len(self.segmentFiles)):
+            for topEntry in self.loadSegment(segment):
+                yield topEntry
+        for topEntry in list(self.pending):
+            yield topEntry
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("Entry index {0} is out of range".format(index))
+
+        if index >= self.numSpilled:
+            return self.pending[index - self.numSpilled]
+        segment = bisect.bisect_right(self.segmentStarts, index) - 1
+        return self.loadSegment(segment)[index - self.segmentStarts[segment]]
+
+    def append(self, topEntry):
+        """Add topEntry to the end of the store, spilling the pending segment if it has grown past its budget"""
+        self.pending.append(topEntry)
+        self.pendingBytes += self.ENTRY_BYTES + self.JOB_BYTES * len(topEntry.jobs)
+        if self.pendingBytes >= self.segmentBytes:
+            self.spill()
+
+    def extend(self, entries):
+        for topEntry in entries:
+            self.append(topEntry)
+
+    def spill(self):
+        """Write the pending segment to a file, and start a new one"""
+        if not self.pending:
+            return
+        fileName = os.path.join(self.directory, 'segment{0:06d}.pickle'.format(len(self.segmentFiles)))
+        with open(fileName, 'wb') as f:
+            pickle.dump(self.pending, f, pickle.HIGHEST_PROTOCOL)
+        logger.debug("Spilled %s entries to %s", len(self.pending), fileName)
+
+        self.segmentStarts.append(self.numSpilled)
+        self.segmentFiles.append(fileName)
+        self.numSpilled += len(self.pending)
+        self.pending = []
+        self.pendingBytes = 0
+
+    def loadSegment(self, segment):
+        """:return: list of TopEntry - the entries of a spilled segment, from the cache if it's loaded"""
+        entries = self.cache.pop(segment, None)
+        if entries is None:
+            with open(self.segmentFiles[segment], 'rb') as f:
+                entries = pickle.load(f)
+            while len(self.cache) >= self.numCachedSegments:
+                self.cache.popitem(last=False)
+        if self.numCachedSegments > 0:
+            self.cache[segment] = entries
+        return entries
+
+    def close(self):
+        """Release the cached segments, and remove the segment files"""
+        self.cache.clear()
+        self.pending = []
+        for fileName in self.segmentFiles:
+            if os.path.exists(fileName):
+                os.remove(fileName)
+        if self.ownsDirectory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self.segmentStarts = []
+        self.segmentFiles = []
+        self.numSpilled = 0
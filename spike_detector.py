@@ -0,0 +1,278 @@
+#!/usr/bin/python
+"""
+This module detects spikes in a stream of top entries, and attributes each spike to the jobs that contributed
+most to it. It keeps exponentially weighted statistics for each metric, so its state does not grow with the
+length of the capture, and it only tracks jobs that have been seen recently.
+"""
+
+import argparse
+import collections
+import heapq
+import logging
+import math
+import sys
+import threading
+
+from job import Job
+from top_entry import TopEntry
+from top_parser import TopParser
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class EwmaStat(object):
+    """
+    Exponentially weighted moving mean and variance of a series of values.
+    """
+    __slots__ = ('mean', 'variance', 'count')
+
+    def __init__(self):
+        self.mean = None
+        self.variance = 0.0
+        self.count = 0
+
+    def score(self, value, minStdDev):
+        """
+        :return: float - the number of standard deviations that value is away from the mean, or None if no values
+                         have been seen yet. The standard deviation is at least minStdDev, so that series
+                         which barely change don't report every small change as a spike.
+        """
+        if self.mean is None:
+            return None
+        return (value - self.mean) / max(math.sqrt(self.variance), minStdDev)
+
+    def update(self, value, alpha):
+        """
+        Add value to the series.
+        : alpha - float - The weight of the new value, between 0 and 1
+        """
+        self.count += 1
+        if self.mean is None:
+            self.mean = float(value)
+        else:
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.variance = (1 - alpha) * (self.variance + diff * increment)
+
+
+class SpikeEvent(object):
+    """
+    A spike in one metric, either of the header or of a job.
+    """
+
+    def __init__(self, timestamp, field, value, expected, score, job=None, contributors=None):
+        """
+        : timestamp - datetime.datetime - The time of the entry with the spike
+        : field - string - The TopEntry or Job field that spiked
+        : value - The value of the field
+        : expected - float - The mean of the field before the spike
+        : score - float - The number of standard deviations from the mean
+        : job - Job - The job that spiked, or None for a header field
+        : contributors - list of (Job, float) - For header spikes, the jobs that contributed most to the spike,
+                                                with their change in the related job field
+        """
+        self.timestamp = timestamp
+        self.field = field
+        self.value = value
+        self.expected = expected
+        self.score = score
+        self.job = job
+        self.contributors = contributors or []
+
+    def __str__(self):
+        """Convert to string, for str()."""
+        if self.job is not None:
+            subject = "pid {0} ({1}) {2}".format(self.job.getPid(), self.job.info[Job.JOB_COMMAND], self.field)
+        else:
+            subject = self.field
+        text = "{0} {1} = {2} (expected {3:.2f}, {4:+.1f} sd)".format(
+            self.timestamp, subject, self.value, self.expected, self.score)
+        if self.contributors:
+            text += ", top contributors: " + ", ".join(
+                "{0} ({1}) {2:+.1f}".format(job.getPid(), job.info[Job.JOB_COMMAND], delta)
+                for job, delta in self.contributors)
+        return text
+
+
+class SpikeDetector(object):
+    """
+    Detects spikes in the entries of one host. Call update with each TopEntry, in order.
+    """
+
+    # Header fields that are checked for spikes -> (direction of a spike, job field the spike is attributed to,
+    # minimum standard deviation). MEM_FREE spikes downwards.
+    HEADER_METRICS = {
+        TopEntry.LOAD_1_MINUTE: (1, Job.JOB_CPU, 0.25),
+        TopEntry.LOAD_5_MINUTES: (1, Job.JOB_CPU, 0.1),
+        TopEntry.LOAD_15_MINUTES: (1, Job.JOB_CPU, 0.05),
+        TopEntry.CPU_WAIT: (1, Job.JOB_CPU, 1.0),
+        TopEntry.CPU_ST: (1, Job.JOB_CPU, 1.0),
+        TopEntry.MEM_FREE: (-1, Job.JOB_RES, 64 * 1024),
+        TopEntry.SWAP_USED: (1, Job.JOB_RES, 64 * 1024),
+    }
+
+    # Job fields that are checked for spikes -> minimum standard deviation
+    JOB_METRICS = {
+        Job.JOB_CPU: 5.0,
+        Job.JOB_RES: 64 * 1024,
+    }
+
+    def __init__(self, alpha=0.1, threshold=4.0, warmup=10, maxJobs=10000, maxIdle=5, numContributors=3):
+        """
+        : alpha - float - The weight given to each new value in the moving statistics
+        : threshold - float - The number of standard deviations from the mean that counts as a spike
+        : warmup - int - The number of values a metric needs before it can spike
+        : maxJobs - int - The maximum number of jobs to keep statistics for
+        : maxIdle - int - Statistics for a job are dropped once it has been missing for this many entries
+        : numContributors - int - The number of jobs that each header spike is attributed to
+        """
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.maxJobs = maxJobs
+        self.maxIdle = maxIdle
+        self.numContributors = numContributors
+
+        self.headerStats = dict((field, EwmaStat()) for field in self.HEADER_METRICS)
+        # (pid, command) -> [last entry number seen, {field: EwmaStat}], least recently seen first
+        self.jobStats = collections.OrderedDict()
+        self.numEntries = 0
+
+    def update(self, topEntry):
+        """
+        Add an entry to the statistics.
+        :return: list of SpikeEvent found in topEntry
+        """
+        self.numEntries += 1
+        timestamp = topEntry.getDateTime()
+        events = []
+
+        # Update the jobs first, so their deviations are known when attributing header spikes
+        deviations = {}
+        for field in self.JOB_METRICS:
+            deviations[field] = []
+        for job in topEntry.jobs.values():
+            events.extend(self.updateJob(timestamp, job, deviations))
+        self.evictJobs()
+
+        header = topEntry.header
+        for field, (direction, jobField, minStdDev) in self.HEADER_METRICS.items():
+            value = header.get(field)
+            if value is None:
+                continue
+            stat = self.headerStats[field]
+            score = stat.score(value, minStdDev)
+            if score is not None and stat.count >= self.warmup and score * direction >= self.threshold:
+                contributors = heapq.nlargest(self.numContributors, deviations[jobField], key=lambda item: item[1])
+                events.append(SpikeEvent(timestamp, field, value, stat.mean, score, None,
+                                         [(job, delta) for job, delta in contributors if delta > 0]))
+            stat.update(value, self.alpha)
+
+        return events
+
+    def updateJob(self, timestamp, job, deviations):
+        """
+        Update the statistics of one job, adding its change from the mean of each field to deviations.
+        :return: list of SpikeEvent for the job
+        """
+        info = job.info
+        key = (info[Job.JOB_PID], info.get(Job.JOB_COMMAND))
+        state = self.jobStats.pop(key, None)
+        if state is None:
+            state = [self.numEntries, dict((field, EwmaStat()) for field in self.JOB_METRICS)]
+        state[0] = self.numEntries
+        self.jobStats[key] = state
+
+        events = []
+        for field, stat in state[1].items():
+            value = info.get(field)
+            if value is None:
+                # The field isn't a column of the capture's layout
+                continue
+            if stat.mean is None:
+                # A new job contributes all of its usage
+                deviations[field].append((job, value))
+            else:
+                deviations[field].append((job, value - stat.mean))
+                score = stat.score(value, self.JOB_METRICS[field])
+                if stat.count >= self.warmup and score >= self.threshold:
+                    events.append(SpikeEvent(timestamp, field, value, stat.mean, score, job))
+            stat.update(value, self.alpha)
+        return events
+
+    def evictJobs(self):
+        """Drop the statistics of jobs that have not been seen recently, or that exceed maxJobs"""
+        jobStats = self.jobStats
+        while jobStats:
+            key, state = next(iter(jobStats.items()))
+            if len(jobStats) <= self.maxJobs and self.numEntries - state[0] < self.maxIdle:
+                break
+            del jobStats[key]
+
+    def detect(self, entries):
+        """
+        Run the detector over an iterable of entries, yielding each SpikeEvent as it is found
+        """
+        for topEntry in entries:
+            for event in self.update(topEntry):
+                yield event
+
+
+def main(argv):
+    examples = """
+    Examples:
+    # Report spikes in a capture:
+        %prog spikes topOutput.log
+
+    # Report spikes as they happen in live feeds, from stdin and from files that are being appended to:
+        top -b -d 1 | %prog spikes - host2.fifo host3.fifo
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to detect spikes in output from the top command""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("fileNames", type=str, nargs='+', help="Files to read, one per host, or - to read from stdin")
+    parser.add_argument("--threshold", type=float, default=4.0,
+                        help="Number of standard deviations from the moving mean that counts as a spike")
+    parser.add_argument("--alpha", type=float, default=0.1, help="Weight given to each new value in the moving mean")
+    parser.add_argument("--warmup", type=int, default=10, help="Number of entries to read before reporting spikes")
+    parser.add_argument("--max-jobs", type=int, default=10000, help="Maximum number of jobs to track per host")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    options = parser.parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.INFO
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    outputLock = threading.Lock()
+
+    def detectSpikes(fileName):
+        detector = SpikeDetector(options.alpha, options.threshold, options.warmup, options.max_jobs)
+        for event in detector.detect(TopParser(fileName).iterEntries()):
+            with outputLock:
+                sys.stdout.write("{0}: {1}\n".format(fileName, event))
+                sys.stdout.flush()
+
+    if len(options.fileNames) == 1:
+        detectSpikes(options.fileNames[0])
+        return
+
+    # Read each host's feed in its own thread, so a live feed that is waiting for input doesn't hold up the others
+    threads = [threading.Thread(target=detectSpikes, args=(fileName,)) for fileName in options.fileNames]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
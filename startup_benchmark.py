@@ -0,0 +1,147 @@
+#!/usr/bin/python
+"""
+Measures the cold start time of the top_parser entry point, by running it repeatedly in fresh interpreters.
+For the small files that cron collectors and health checks parse, starting up costs more than parsing, so
+this is the number to watch when adding imports or class level work to the modules it loads.
+
+Pass --baseline with a git revision to run the same commands against that revision too, and compare.
+"""
+
+import argparse
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class StartupBenchmark(object):
+    """
+    Times commands run by a python interpreter from a source directory, reporting the median and best of
+    several runs. The first runs are discarded, so the file system cache is warm and the times are comparable.
+    """
+
+    RUNS = 20
+    WARMUP_RUNS = 2
+
+    def __init__(self, python=sys.executable, runs=RUNS, warmupRuns=WARMUP_RUNS):
+        """
+        : python - string - The interpreter to run the commands with
+        : runs - int - The number of timed runs of each command
+        : warmupRuns - int - The number of untimed runs before them
+        """
+        self.python = python
+        self.runs = runs
+        self.warmupRuns = warmupRuns
+
+    def time(self, args, directories):
+        """
+        : args - list of string - The arguments to the interpreter, e.g. a script and its arguments
+        : directories - list of string - The directories to run them in. Runs alternate between them, so that
+                                         changes in machine load affect each alike.
+        :return: list of list of float - the sorted wall clock times of the runs in each directory, in seconds
+        """
+        times = [[] for directory in directories]
+        # Let the warmup runs write bytecode, as an installed copy would have, so source compilation isn't timed
+        env = dict(os.environ)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        with open(os.devnull, 'w') as devnull:
+            for run in range(self.warmupRuns + self.runs):
+                for directoryTimes, directory in zip(times, directories):
+                    start = time.time()
+                    returnCode = subprocess.call([self.python] + args, cwd=directory, env=env,
+                                                 stdout=devnull, stderr=devnull)
+                    elapsed = time.time() - start
+                    if returnCode != 0:
+                        raise Exception("{0} failed in {1} with exit code {2}".format(' '.join(args), directory,
+                                                                                       returnCode))
+                    if run >= self.warmupRuns:
+                        directoryTimes.append(elapsed)
+        return [sorted(directoryTimes) for directoryTimes in times]
+
+    def report(self, name, times):
+        """:return: string - a line with the median and best of times, in milliseconds"""
+        return "{0:<40} median {1:7.1f} ms   best {2:7.1f} ms\n".format(name, times[len(times) // 2] * 1000,
+                                                                          times[0] * 1000)
+
+
+def exportRevision(revision, directory):
+    """Write the tree of a git revision of this repository to directory"""
+    source = os.path.dirname(os.path.abspath(__file__))
+    archive = subprocess.Popen(['git', 'archive', revision], cwd=source, stdout=subprocess.PIPE)
+    subprocess.check_call(['tar', '-x', '-C', directory], stdin=archive.stdout)
+    archive.stdout.close()
+    if archive.wait() != 0:
+        raise Exception("Could not export revision {0}".format(revision))
+
+
+def main(argv):
+    examples = """
+    Examples:
+    # Time the interpreter alone, and parsing the one entry test files:
+        %prog
+
+    # Compare against the previous commit, or any other revision:
+        %prog --baseline HEAD~1
+
+    # Time other commands, with more runs:
+        %prog --runs 50 --command "top_parser.py query tests/data/topOneEntryNoDate.log --agg count"
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to measure the startup time of top_parser""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="A git revision to time as well, for comparison")
+    parser.add_argument("--command", type=str, action='append', default=None,
+                        help="Arguments to the interpreter to time, relative to the source directory. "
+                             "May be given more than once, defaults to parsing the one entry test files")
+    parser.add_argument("--runs", type=int, default=StartupBenchmark.RUNS, help="Number of timed runs")
+    parser.add_argument("--python", type=str, default=sys.executable, help="The interpreter to run")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    options = parser.parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.INFO
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    commands = options.command or ['top_parser.py tests/data/topOneEntryNoDate.log',
+                                   'top_parser.py tests/data/topOneEntryWithDate.log',
+                                   'top_parser.py --help']
+    benchmark = StartupBenchmark(options.python, options.runs)
+    source = os.path.dirname(os.path.abspath(__file__))
+    directories = [('current', source)]
+    baseline = None
+    if options.baseline:
+        baseline = tempfile.mkdtemp(prefix='top_baseline')
+        exportRevision(options.baseline, baseline)
+        directories.insert(0, (options.baseline, baseline))
+
+    try:
+        sys.stdout.write(benchmark.report('interpreter only', benchmark.time(['-c', 'pass'], [source])[0]))
+        for command in commands:
+            sys.stdout.write("{0}\n".format(command))
+            allTimes = benchmark.time(shlex.split(command), [directory for name, directory in directories])
+            for (name, directory), times in zip(directories, allTimes):
+                sys.stdout.write(benchmark.report('  ' + name, times))
+            if len(allTimes) > 1:
+                medians = [times[len(times) // 2] for times in allTimes]
+                sys.stdout.write("  speedup {0:.2f}x\n".format(medians[0] / medians[1]))
+    finally:
+        if baseline:
+            shutil.rmtree(baseline, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
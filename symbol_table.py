@@ -0,0 +1,120 @@
+"""
+A table of the strings that repeat across the jobs of top output, such as user names, commands and statuses.
+Each distinct string is stored once, and can be given a small integer id for use in serialized output.
+"""
+
+import logging
+import os
+
+from job import Job
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class SymbolTable(object):
+    """
+    Interns the string fields of jobs, so that every job with the same command shares one string object,
+    which also makes comparing them a quick identity check. Ids are assigned in the order that strings are
+    first given one, so they stay stable as the table grows and can be saved and loaded across runs.
+    One table can be shared by several TopParsers to intern the jobs of several files.
+    """
+
+    # The job fields that are interned
+    FIELDS = (Job.JOB_USER, Job.JOB_COMMAND, Job.JOB_STATUS)
+
+    def __init__(self, symbols=None):
+        """
+        : symbols - list of string - Initial symbols, whose ids are their positions in the list
+        """
+        # string -> the same string, used to intern without assigning ids
+        self.strings = {}
+        # id -> string
+        self.symbols = []
+        # string -> id
+        self.ids = {}
+        for symbol in symbols or []:
+            self.getId(symbol)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def intern(self, string):
+        """:return: string - the table's copy of string, adding it if it's not in the table yet"""
+        return self.strings.setdefault(string, string)
+
+    def internJob(self, info):
+        """Replace the interned fields of a job's info with the table's copies"""
+        setdefault = self.strings.setdefault
+        for field in self.FIELDS:
+            value = info.get(field)
+            if value is not None:
+                info[field] = setdefault(value, value)
+
+    def internAll(self, strings):
+        """:return: list of string - the table's copies of strings, e.g. a column of job lines"""
+        setdefault = self.strings.setdefault
+        return list(map(setdefault, strings, strings))
+
+    def getId(self, string):
+        """:return: int - the id of string, assigning it the next id if it doesn't have one yet"""
+        symbolId = self.ids.get(string)
+        if symbolId is None:
+            string = self.intern(string)
+            symbolId = self.ids[string] = len(self.symbols)
+            self.symbols.append(string)
+        return symbolId
+
+    def getSymbol(self, symbolId):
+        """:return: string - the symbol with the given id"""
+        return self.symbols[symbolId]
+
+    def encodeJob(self, info):
+        """:return: dict - a copy of a job's info with the interned fields replaced by their ids"""
+        encoded = dict(info)
+        for field in self.FIELDS:
+            value = encoded.get(field)
+            if value is not None:
+                encoded[field] = self.getId(value)
+        return encoded
+
+    def decodeJob(self, info):
+        """Replace the ids in a job's info, as written by encodeJob, with their symbols"""
+        symbols = self.symbols
+        for field in self.FIELDS:
+            value = info.get(field)
+            if value is not None:
+                info[field] = symbols[value]
+
+    def merge(self, symbols):
+        """
+        Add symbols whose ids were assigned elsewhere, such as the symbols already stored in an output file.
+        : symbols - list of string - The symbols in id order, starting from 0
+        :throws: Exception if an id is already assigned to a different symbol
+        """
+        for symbolId, symbol in enumerate(symbols):
+            if self.getId(symbol) != symbolId:
+                raise Exception("Symbol {0} has id {1} but {2} is expected".format(
+                    symbol, self.ids[symbol], symbolId))
+
+    def save(self, fileName):
+        """Write the symbols to fileName, replacing it once they have all been written"""
+        import json
+        tempFileName = fileName + '.tmp'
+        with open(tempFileName, 'w') as f:
+            json.dump(self.symbols, f, separators=(',', ':'))
+        os.rename(tempFileName, fileName)
+        logger.info("Saved {0} symbols to {1}".format(len(self.symbols), fileName))
+
+    @classmethod
+    def load(cls, fileName):
+        """
+        :return: SymbolTable - the table saved in fileName, or an empty table if the file doesn't exist yet
+        """
+        if not os.path.exists(fileName):
+            return cls()
+        import json
+        with open(fileName, 'r') as f:
+            table = cls(json.load(f))
+        logger.info("Loaded {0} symbols from {1}".format(len(table), fileName))
+        return table
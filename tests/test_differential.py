@@ -0,0 +1,82 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('../')
+
+from differential import DifferentialChecker, TopGenerator
+from job import Job
+from top_entry import TopEntry
+from top_parser import TopParser
+
+class DifferentialTestCase(unittest.TestCase):
+    """ Tests for DifferentialChecker and TopGenerator. """
+
+    NUM_FILES = 40
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='top_differential')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def testFastPaths(self):
+        """ Test that every fast path parses generated files the same as the reference """
+        with DifferentialChecker(processes=1) as checker:
+            mismatches = []
+            for seed in range(self.NUM_FILES):
+                mismatches.extend(checker.checkGenerated(seed, directory=self.directory))
+        self.assertEqual([], mismatches)
+
+    def testGenerator(self):
+        """ Test that the generated files cover the formats the parser accepts """
+        uptimeVariants = set()
+        memUnits = set()
+        layouts = set()
+        numDates = 0
+        jobs = []
+        for seed in range(self.NUM_FILES):
+            fileName = os.path.join(self.directory, 'top{0}.log'.format(seed))
+            TopGenerator(seed).writeFile(fileName, 10)
+            with open(fileName) as f:
+                for line in f:
+                    if line.startswith('top - '):
+                        uptime = line.split(' up ')[1].split(' user')[0]
+                        uptimeVariants.add((' day' in uptime, ' min' in uptime))
+                    elif 'Mem' in line:
+                        memUnits.add(line.split()[0])
+            for topEntry in TopParser(fileName, specialize=False).iterEntries():
+                numDates += topEntry.hasDate
+                layouts.add(topEntry.layout.columns)
+                jobs.extend(job.info for job in topEntry.jobs.values())
+
+        self.assertEqual(4, len(uptimeVariants))
+        self.assertEqual(set(['Mem:', 'KiB', 'MiB', 'GiB']), memUnits)
+        self.assertEqual(len(TopGenerator.LAYOUTS), len(layouts))
+        self.assertTrue(0 < numDates)
+        self.assertTrue(any(info[Job.JOB_NI] < 0 for info in jobs))
+        self.assertTrue(any(info[Job.JOB_PR] == 'rt' for info in jobs))
+        self.assertTrue(any(' ' in info[Job.JOB_COMMAND] for info in jobs))
+        self.assertTrue(any(info[Job.JOB_RES] >= 1024 ** 3 for info in jobs))
+
+    def testMismatch(self):
+        """ Test that a path that parses differently is reported """
+        def parseBroken(fileName):
+            entries = list(TopParser(fileName).iterEntries())
+            entries[-1].header[TopEntry.MEM_FREE] += 1
+            return entries
+
+        fileName = os.path.join(self.directory, 'top.log')
+        TopGenerator(1).writeFile(fileName, 3)
+        with DifferentialChecker(processes=0) as checker:
+            checker.addPath('broken', parseBroken)
+            mismatches = checker.check(fileName)
+        self.assertEqual(1, len(mismatches))
+        self.assertTrue('broken entry 2 header memFree' in mismatches[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
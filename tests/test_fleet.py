@@ -0,0 +1,125 @@
+import datetime
+import logging
+import sys
+import unittest
+
+sys.path.append('../')
+
+import fleet as fleetModule
+from fleet import Fleet, getHostName, percentile
+from top_entry import TopEntry
+
+class FleetTestCase(unittest.TestCase):
+    """ Tests for Fleet. """
+
+    FIELDS = (TopEntry.CPU_IDLE, TopEntry.LOAD_1_MINUTE)
+
+    def testPercentile(self):
+        """ Test that percentiles are interpolated as numpy does """
+        self.assertEqual(3.0, percentile([1.0, 2.0, 3.0, 4.0, 5.0], 50))
+        self.assertAlmostEqual(4.8, percentile([1.0, 2.0, 3.0, 4.0, 5.0], 95))
+        self.assertEqual(7.0, percentile([7.0], 99))
+
+    def testHostName(self):
+        """ Test naming hosts from their file names """
+        self.assertEqual('web1', getHostName('/data/web1.log'))
+        self.assertEqual('db', getHostName('db=/data/capture.log'))
+
+    def testPercentilesAndOutliers(self):
+        """ Test the percentiles across hosts at each step, and finding the outlying host """
+        fleet = Fleet(self.FIELDS, step=60)
+        for host in range(10):
+            idle = 50.0 if host == 9 else 90.0 + host * 0.5
+            fleet.addHost('host{0}'.format(host), {100: [idle, 1.0], 101: [idle, 1.0 + host]})
+        # A host that was only up for the second step
+        fleet.addHost('late', {101: [90.0, None]})
+
+        rows = fleet.getPercentiles(TopEntry.CPU_IDLE, (50, 100))
+        self.assertEqual(2, len(rows))
+        timestamp, numHosts, values = rows[0]
+        self.assertEqual(datetime.datetime(1970, 1, 1, 1, 40), timestamp)
+        self.assertEqual(10, numHosts)
+        self.assertEqual([91.75, 94.0], values)
+        self.assertEqual(11, rows[1][1])
+
+        rows = fleet.getPercentiles(TopEntry.LOAD_1_MINUTE, (50,))
+        self.assertEqual((10, [1.0]), rows[0][1:])
+        self.assertEqual((10, [5.5]), rows[1][1:])
+
+        outliers = fleet.getOutliers(3.0)
+        self.assertEqual('host9', outliers[0][0])
+        self.assertEqual(TopEntry.CPU_IDLE, outliers[0][1])
+        self.assertTrue(outliers[0][2] < -3.0)
+        self.assertEqual(['host9'], [host for host, field, score in outliers if field == TopEntry.CPU_IDLE])
+
+    def testNumpy(self):
+        """ Test that the percentiles and outliers computed with numpy agree with those computed without it """
+        if fleetModule.numpy is None:
+            self.skipTest("numpy is not installed")
+        fleet = Fleet(self.FIELDS, step=60)
+        for host in range(12):
+            means = {}
+            for stepNumber in range(20):
+                if (host + stepNumber) % 7 == 0:
+                    continue
+                idle = 20.0 if host == 3 else 80.0 + (host * 7 + stepNumber * 3) % 11
+                means[stepNumber] = [idle, None if stepNumber % 5 == 0 else 0.5 + (host * stepNumber) % 4]
+            fleet.addHost('host{0}'.format(host), means)
+        # A step that no host has a load for
+        fleet.addHost('idle', {25: [90.0, None]})
+
+        def getResults():
+            return ([fleet.getPercentiles(field, (0, 25, 50, 95, 100)) for field in self.FIELDS],
+                    fleet.getOutliers(2.0))
+
+        withNumpy = getResults()
+        numpy = fleetModule.numpy
+        fleetModule.numpy = None
+        try:
+            withoutNumpy = getResults()
+        finally:
+            fleetModule.numpy = numpy
+
+        for rows, expectedRows in zip(withNumpy[0], withoutNumpy[0]):
+            self.assertEqual([row[:2] for row in expectedRows], [row[:2] for row in rows])
+            for (timestamp, numHosts, values), (_, _, expectedValues) in zip(rows, expectedRows):
+                self.assertEqual([value is None for value in expectedValues], [value is None for value in values])
+                for value, expected in zip(values, expectedValues):
+                    if expected is not None:
+                        self.assertAlmostEqual(expected, value)
+        self.assertEqual([outlier[:2] for outlier in withoutNumpy[1]], [outlier[:2] for outlier in withNumpy[1]])
+        for (host, field, score), (_, _, expected) in zip(withNumpy[1], withoutNumpy[1]):
+            self.assertAlmostEqual(expected, score)
+        self.assertTrue(('host3', TopEntry.CPU_IDLE) in [outlier[:2] for outlier in withNumpy[1]])
+
+    def testFields(self):
+        """ Test that only numeric header fields can be compared """
+        self.assertFalse(TopEntry.TIME_OF_DAY in Fleet.FIELDS)
+        self.assertRaises(Exception, Fleet, [TopEntry.TIME_OF_DAY])
+
+    def testCaptures(self):
+        """ Test parsing captures, in worker processes and in this one """
+        captures = [('a', 'data/topFiveEntriesWithDate.log'), ('b', 'data/topFiveEntriesWithDate.log'),
+                    ('c', 'data/topTwoEntriesWithDate.log')]
+        for processes in (1, 2):
+            fleet = Fleet(self.FIELDS, step=300, processes=processes)
+            fleet.addCaptures(captures)
+            self.assertEqual(['a', 'b', 'c'], sorted(fleet.hosts))
+
+            rows = fleet.getPercentiles(TopEntry.LOAD_1_MINUTE, (50,))
+            self.assertEqual(7, len(rows))
+            self.assertEqual([1, 1, 2, 2, 2, 2, 2], [numHosts for timestamp, numHosts, values in rows])
+            self.assertEqual([0.81], rows[2][2])
+
+    def testUndated(self):
+        """ Test that the entries of a capture without date lines are skipped, since their dates are made up """
+        fleet = Fleet(self.FIELDS, processes=1)
+        fleet.addCaptures([('a', 'data/top_30sec_20iter.log'), ('b', 'data/topFiveEntriesWithDate.log')])
+        self.assertEqual({}, fleet.series[fleet.hosts.index('a')])
+        self.assertEqual([1] * 5, [numHosts for timestamp, numHosts, values in fleet.getPercentiles(TopEntry.CPU_IDLE)])
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+    unittest.main()
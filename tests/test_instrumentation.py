@@ -0,0 +1,75 @@
+import logging
+import sys
+import unittest
+
+sys.path.append('../')
+
+from instrumentation import ParseProfile, StageTimer
+from job import Job
+from top_entry import TopEntry
+from top_parser import TopParser
+
+class InstrumentationTestCase(unittest.TestCase):
+    """ Tests for ParseProfile. """
+
+    TEST_FILE = 'data/top_30sec_20iter.log'
+
+    def testStageTimer(self):
+        """ Test that time is charged to the innermost stage """
+        timer = StageTimer()
+        timer.enter('outer')
+        timer.enter('inner')
+        timer.exit()
+        timer.exit()
+        self.assertEqual(set(['outer', 'inner']), set(timer.times.keys()))
+        self.assertEqual([], timer.stack)
+
+    def testProfile(self):
+        """ Test profiling a parse """
+        parseMethod = Job.__dict__['parse']
+        jobRegex = Job.RE_JOB
+
+        topParser = TopParser(self.TEST_FILE, bulk=False)
+        with ParseProfile(topParser) as profile:
+            topParser.parse()
+
+        with open(self.TEST_FILE) as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), profile.counters[ParseProfile.COUNT_LINES])
+        self.assertEqual(sum(len(line) for line in lines), profile.counters[ParseProfile.COUNT_BYTES])
+        self.assertEqual(20, profile.counters[ParseProfile.COUNT_SNAPSHOTS])
+        self.assertEqual(sum(len(topEntry.jobs) for topEntry in topParser.entries),
+                         profile.counters[ParseProfile.COUNT_JOBS])
+        for stage in (ParseProfile.STAGE_READ, ParseProfile.STAGE_HEADER, ParseProfile.STAGE_JOB_REGEX,
+                      ParseProfile.STAGE_MEM_SCALING, ParseProfile.STAGE_CONSTRUCTION):
+            self.assertTrue(profile.timer.times[stage] > 0, stage)
+        self.assertTrue('jobs/s' in profile.report())
+
+        # Parsing is no longer instrumented
+        self.assertTrue(Job.__dict__['parse'] is parseMethod)
+        self.assertTrue(Job.RE_JOB is jobRegex)
+        self.assertFalse('openFile' in topParser.__dict__)
+
+        # And gives the same result
+        otherParser = TopParser(self.TEST_FILE)
+        otherParser.parse()
+        self.assertEqual([topEntry.header for topEntry in topParser.entries],
+                         [topEntry.header for topEntry in otherParser.entries])
+
+    def testProfileBulk(self):
+        """ Test profiling a parse that parses the job lines of each entry together """
+        topParser = TopParser(self.TEST_FILE)
+        with ParseProfile(topParser) as profile:
+            topParser.parse()
+
+        self.assertEqual(sum(len(topEntry.jobs) for topEntry in topParser.entries),
+                         profile.counters[ParseProfile.COUNT_JOBS])
+        self.assertTrue(profile.timer.times[ParseProfile.STAGE_JOB_BULK] > 0)
+        self.assertFalse(ParseProfile.STAGE_JOB_REGEX in profile.timer.times)
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+
+    unittest.main()
@@ -5,6 +5,7 @@ import unittest
 sys.path.append('../')
 
 from job import Job
+from top_entry import TopEntry
 
 class JobTestCase(unittest.TestCase):
     """ Tests for Job. """
@@ -44,6 +45,21 @@ class JobTestCase(unittest.TestCase):
         line = ' 5199 postgres  10 -10  436m   9m 7904 S  0.0  0.1   0:00.05 postmaster   '
         self.checkParse(line, '5199', 'postgres', '10', -10, (436 * 1024), (9 * 1024), 7904, 'S', 0.0, 0.1, '0:00.05', 'postmaster')
 
+        line = '40512 systemd+  20   0 1.101t  1.2g  98312 R   6.2  3.1   1:59.02 java'
+        self.checkParse(line, '40512', 'systemd+', '20', 0, (1.101 * 1024 ** 3), (1.2 * 1024 ** 2), 98312, 'R', 6.2, 3.1, '1:59.02', 'java')
+
+        line = '40512 root      20   0 2.5p  1.2g  98312 R   6.2  3.1   1:59.02 java'
+        self.checkParse(line, '40512', 'root', '20', 0, (2.5 * 1024 ** 4), (1.2 * 1024 ** 2), 98312, 'R', 6.2, 3.1, '1:59.02', 'java')
+
+    def testParseError(self):
+        """ Test that a line which is not a job raises an exception """
+        self.assertRaises(Exception, Job().parse, 'not a job line')
+        self.assertRaises(Exception, Job().parseScaledMem, '12x')
+
+    def testFieldNames(self):
+        """ Test that no job field has the name of a header field, since queries and sinks put both in one row """
+        self.assertEqual(set(), set(Job.JOB_FIELDS) & set(TopEntry.HEADER_FIELDS))
+
     def checkParse(self, line, pid, user, priority, nice, virtual, resident, shared, status,
                    cpu, mem, cpuTime, command):
         job = Job()
@@ -0,0 +1,124 @@
+import logging
+import sys
+import unittest
+
+sys.path.append('../')
+
+from job import Job
+from job_layout import JobLayout
+
+class JobLayoutTestCase(unittest.TestCase):
+    """ Tests for JobLayout. """
+
+    def testDefaultLayout(self):
+        """ Test that top's default columns use the Job regex """
+        layout = JobLayout('  PID USER      PR  NI    VIRT    RES    SHR S  %CPU %MEM     TIME+ COMMAND\n')
+        self.assertTrue(layout.isDefault)
+        self.assertTrue(layout.regex is Job.RE_JOB)
+
+    def testFromHeader(self):
+        """ Test that layouts are cached by header line """
+        header = '  PID USER      PR  NI    VIRT    RES    SHR S  %CPU %MEM     TIME+ COMMAND  SWAP\n'
+        layout = JobLayout.fromHeader(header)
+        self.assertTrue(layout is JobLayout.fromHeader(header))
+        self.assertFalse(layout.isDefault)
+
+    def testBadHeader(self):
+        """ Test that a line without a PID column is rejected """
+        self.assertRaises(Exception, JobLayout, 'KiB Swap:  4095996 total,    96600 used,  3999396 free, 10201704 cached')
+
+    def testCustomColumns(self):
+        """ Test parsing job lines with extra and reordered columns """
+        layout = JobLayout('    PID   PPID USER      PR  NI    VIRT    RES    SHR S  %CPU  %MEM     TIME+ nTH  P COMMAND')
+        job = Job()
+        job.parse('   2210      1 postgres  20   0  322.4g  1.2g   1.1g S  12.5   7.7  42:10.33   1  2 postgres: writer process',
+                  layout)
+        self.assertEqual('2210', job.getPid())
+        self.assertEqual('1', job.info[Job.JOB_PPID])
+        self.assertEqual('postgres', job.info[Job.JOB_USER])
+        self.assertEqual(int(322.4 * 1024 * 1024), job.info[Job.JOB_VIRT])
+        self.assertEqual(12.5, job.info[Job.JOB_CPU])
+        self.assertEqual(1, job.info[Job.JOB_THREADS])
+        self.assertEqual(2, job.info[Job.JOB_LAST_CPU])
+        self.assertEqual('postgres: writer process', job.info[Job.JOB_COMMAND])
+
+        # The command is not the last column, and there is a column we don't know about
+        layout = JobLayout('  PID USER     COMMAND   %CPU  SWAP WCHAN')
+        job = Job()
+        job.parse('  662 root     Xorg       6.2  1.5m poll_schedule_timeout', layout)
+        self.assertEqual('Xorg', job.info[Job.JOB_COMMAND])
+        self.assertEqual(6.2, job.info[Job.JOB_CPU])
+        self.assertEqual(int(1.5 * 1024), job.info[Job.JOB_SWAP])
+        self.assertEqual('poll_schedule_timeout', job.info['WCHAN'])
+
+        self.assertRaises(Exception, job.parse, '  662 root', layout)
+
+    def testParseLines(self):
+        """ Test that parsing the job lines of an entry together gives the same jobs as parsing each one """
+        lines = [' 1453 dpinkney  20   0 1983544 409608  44200 S  12.5  2.5 480:36.59 cinnamon\n',
+                 '32469 dpinkney  20   0 3920412 2.403g  72804 S   6.2 15.4   2709:11 firefox\n',
+                 ' 5199 postgres  10 -10  436m   9m 7904 S  0.0  0.1   0:00.05 postmaster: writer   \n',
+                 '   10 root      rt   0       0      0      0 S   0.0  0.0   0:01.71 migration/0\n']
+        layout = JobLayout(' PID USER      PR  NI    VIRT    RES    SHR S  %CPU %MEM     TIME+ COMMAND')
+        jobs = layout.parseLines(lines)
+        self.assertEqual(['10', '1453', '32469', '5199'], sorted(jobs))
+        for line in lines:
+            job = Job()
+            job.parse(line, layout)
+            self.assertEqual(job.info, jobs[job.getPid()].info)
+        self.assertEqual('postmaster: writer', jobs['5199'].info[Job.JOB_COMMAND])
+        self.assertEqual(-10, jobs['5199'].info[Job.JOB_NI])
+        self.assertEqual({}, layout.parseLines([]))
+
+        # Lines that don't split into the columns, or have the same pid, are left to be parsed one at a time
+        self.assertEqual(None, layout.parseLines(lines + [' 1454 dpinkney  20   0 1983544\n']))
+        self.assertEqual(None, layout.parseLines(lines + ['x1454' + lines[0][5:]]))
+        self.assertEqual(None, layout.parseLines(lines + [lines[0]]))
+
+        # The command is not the last column
+        layout = JobLayout('  PID USER     COMMAND   %CPU  SWAP WCHAN')
+        jobs = layout.parseLines(['  662 root     Xorg       6.2  1.5m poll_schedule_timeout\n'])
+        self.assertEqual('poll_schedule_timeout', jobs['662'].info['WCHAN'])
+        self.assertEqual(int(1.5 * 1024), jobs['662'].info[Job.JOB_SWAP])
+        self.assertEqual(None, layout.parseLines(['  662 root     Xorg       6.2  1.5m poll schedule\n']))
+
+    def testParseLinesMalformed(self):
+        """ Test that a line with a column that doesn't match the layout's regex is rejected by both paths """
+        line = ' 1453 dpinkney  20   0 1983544 409608  44200 S  12.5  2.5 480:36.59 cinnamon\n'
+        goodLine = line.replace('1453', '1454')
+        malformed = [line.replace(' S ', ' ? '), line.replace('480:36.59', 'abc'), line.replace('480:36.59', '480'),
+                     line.replace(' 20 ', ' 2+ '), line.replace(' 0 ', ' +0 '), line.replace('12.5', '1e5'),
+                     line.replace('409608', '+409608'), line.replace('409608', '409_608')]
+        for layout in [JobLayout(' PID USER      PR  NI    VIRT    RES    SHR S  %CPU %MEM     TIME+ COMMAND'),
+                       JobLayout(' PID USER      PR  NI    VIRT    RES    SHR S  %CPU %MEM     TIME+ COMMAND  SWAP')]:
+            for badLine in malformed:
+                if not layout.isDefault:
+                    badLine = badLine.rstrip() + '  12m\n'
+                self.assertEqual(None, layout.parseLines([goodLine, badLine]), badLine)
+                self.assertRaises(Exception, Job().parse, badLine, layout)
+
+    def testParseLinesReuse(self):
+        """ Test that the info of lines that haven't changed since the previous entry is reused """
+        layout = JobLayout(' PID USER      PR  NI    VIRT    RES    SHR S  %CPU %MEM     TIME+ COMMAND')
+        idle = '  662 root      20   0  273524  86820  17340 S   0.0  0.5 338:15.30 Xorg\n'
+        previousLines = {}
+        jobs = layout.parseLines([idle, ' 1453 dpinkney  20   0 1983544 409608  44200 S  12.5  2.5 480:36.59 cinnamon\n'],
+                                 None, previousLines)
+        self.assertEqual(2, len(previousLines))
+        # The jobs' infos are copies, which can be changed without changing the reused info
+        jobs['662'].info[Job.JOB_PID] = '1'
+        self.assertEqual('662', previousLines[idle][Job.JOB_PID])
+
+        jobs = layout.parseLines([' 1453 dpinkney  20   0 1983544 409608  44200 S   6.2  2.5 480:37.01 cinnamon\n', idle],
+                                 None, previousLines)
+        self.assertEqual(6.2, jobs['1453'].info[Job.JOB_CPU])
+        self.assertEqual('338:15.30', jobs['662'].info[Job.JOB_TIME])
+        self.assertEqual('662', jobs['662'].info[Job.JOB_PID])
+        self.assertTrue(jobs['662'].info is not previousLines[idle])
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+
+    unittest.main()
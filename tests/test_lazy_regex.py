@@ -0,0 +1,41 @@
+import re
+import sys
+import unittest
+
+sys.path.append('../')
+
+from lazy_regex import LazyRegex
+
+class LazyRegexTestCase(unittest.TestCase):
+    """ Tests for LazyRegex. """
+
+    def testCompiledOnFirstUse(self):
+        """ Test that the regex is compiled when first read, and then replaces the descriptor """
+        class Parser(object):
+            RE_WORD = LazyRegex(r'(\w+)\s+(\d+)')
+            RE_VERBOSE = LazyRegex(r"""(\d+)   # number
+                                      """, re.VERBOSE)
+
+        self.assertTrue(isinstance(Parser.__dict__['RE_WORD'], LazyRegex))
+        regex = Parser().RE_WORD
+        self.assertEqual(('total', '285'), regex.match('total 285').groups())
+        self.assertTrue(Parser.__dict__['RE_WORD'] is regex)
+        self.assertTrue(Parser.RE_WORD is regex)
+        self.assertEqual('42', Parser.RE_VERBOSE.match('42').group(1))
+
+    def testSubclass(self):
+        """ Test that reading the regex through a subclass replaces it in the class that defined it """
+        class Parser(object):
+            RE_WORD = LazyRegex(r'(\w+)')
+
+        class SubParser(Parser):
+            pass
+
+        regex = SubParser.RE_WORD
+        self.assertTrue(Parser.__dict__['RE_WORD'] is regex)
+        self.assertFalse('RE_WORD' in SubParser.__dict__)
+        self.assertTrue(Parser.RE_WORD is SubParser().RE_WORD)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import datetime
+import logging
+import sys
+import unittest
+
+sys.path.append('../')
+
+from job import Job
+from leak_detector import LeakDetector, RegressionStat
+from top_entry import TopEntry
+
+class LeakDetectorTestCase(unittest.TestCase):
+    """ Tests for LeakDetector. """
+
+    START = datetime.date(2015, 5, 26)
+
+    def makeEntry(self, hour, jobs, memAvailable, swapFree):
+        """:return: TopEntry - an entry at hour, with a job for each (pid, command, res)"""
+        topEntry = TopEntry(True)
+        topEntry.header[TopEntry.DATE] = (self.START + datetime.timedelta(days=hour // 24)).toordinal()
+        topEntry.header[TopEntry.TIME_OF_DAY] = "{0:02d}:00:00".format(hour % 24)
+        topEntry.header[TopEntry.MEM_AVAILABLE] = memAvailable
+        topEntry.header[TopEntry.SWAP_FREE] = swapFree
+        for pid, command, res in jobs:
+            job = Job()
+            job.info = {Job.JOB_PID: pid, Job.JOB_COMMAND: command, Job.JOB_RES: res, Job.JOB_VIRT: 500000,
+                        Job.JOB_SHR: 1000}
+            topEntry.jobs[pid] = job
+        return topEntry
+
+    def testRegression(self):
+        """ Test the online fit against the closed form """
+        xs = [0.0, 1.0, 2.0, 4.0, 7.0]
+        ys = [1.0, 3.5, 4.0, 9.0, 15.5]
+        stat = RegressionStat()
+        for x, y in zip(xs, ys):
+            stat.update(x, y)
+
+        meanX = sum(xs) / len(xs)
+        meanY = sum(ys) / len(ys)
+        sxy = sum((x - meanX) * (y - meanY) for x, y in zip(xs, ys))
+        sxx = sum((x - meanX) ** 2 for x in xs)
+        syy = sum((y - meanY) ** 2 for y in ys)
+        self.assertAlmostEqual(sxy / sxx, stat.getSlope())
+        self.assertAlmostEqual(sxy * sxy / (sxx * syy), stat.getRSquared())
+        self.assertEqual(7.0, stat.getSpan())
+        self.assertEqual(5, stat.count)
+
+        flat = RegressionStat()
+        flat.update(1.0, 5.0)
+        flat.update(2.0, 5.0)
+        self.assertEqual(0.0, flat.getSlope())
+        self.assertEqual(0.0, flat.getRSquared())
+
+    def testLeak(self):
+        """ Test that only steady growth is reported, with the time until memory runs out """
+        detector = LeakDetector()
+        for hour in range(48):
+            jobs = [('100', 'leaky', 100000 + 2048 * hour),
+                    ('200', 'steady', 50000),
+                    ('300', 'noisy', 50000 + (40000 if hour % 2 else 0) + 100 * hour)]
+            if hour < 24:
+                # The pid is reused by another command, which starts a new fit
+                jobs.append(('400', 'old', 300000 - 10000 * hour))
+            else:
+                jobs.append(('400', 'new', 10000 + 4096 * hour))
+            detector.update(self.makeEntry(hour, jobs, 8000000 - 2048 * hour, 1000000))
+
+        leaks = detector.getLeaks()
+        self.assertEqual([('400', 'new', Job.JOB_RES), ('100', 'leaky', Job.JOB_RES), (None, None, detector.HEADROOM)],
+                         [(leak.job.getPid() if leak.job else None, leak.job.info[Job.JOB_COMMAND] if leak.job else None,
+                           leak.field) for leak in leaks])
+
+        leaky = leaks[1]
+        self.assertAlmostEqual(2048.0, leaky.growth)
+        self.assertAlmostEqual(1.0, leaky.rSquared)
+        self.assertEqual(47.0, leaky.hours)
+        self.assertEqual(48, leaky.count)
+        headroom = 8000000 - 2048 * 47 + 1000000
+        self.assertAlmostEqual(headroom / 2048.0, leaky.hoursToExhaustion)
+        self.assertEqual(24, leaks[0].count)
+
+        host = leaks[2]
+        self.assertAlmostEqual(-2048.0, host.growth)
+        self.assertAlmostEqual(headroom / 2048.0, host.hoursToExhaustion)
+        self.assertTrue('memory and swap used up in' in str(leaky))
+
+    def testUndated(self):
+        """ Test that the growth of undated entries is fitted against uptime, across midnights and a reboot """
+        detector = LeakDetector()
+        expected = RegressionStat()
+        uptime = 10 * 60 + 20
+        for hour in range(48):
+            if hour == 30:
+                # A capture from after a reboot, which carries on from the previous entry
+                uptime = 5
+            topEntry = TopEntry(False)
+            topEntry.header[TopEntry.UPTIME_MINUTES] = uptime
+            topEntry.header[TopEntry.DATE] = topEntry.getDateFromUptimeMinutes(uptime)
+            topEntry.header[TopEntry.TIME_OF_DAY] = "{0:02d}:00:00".format((22 + hour) % 24)
+            topEntry.jobs['100'] = Job({Job.JOB_PID: '100', Job.JOB_COMMAND: 'leaky',
+                                        Job.JOB_RES: 100000 + 2048 * hour})
+            detector.update(topEntry)
+            expected.update(hour if hour < 30 else hour - 1, 100000 + 2048 * hour)
+            uptime += 60
+
+        leak = detector.getLeaks()[0]
+        self.assertAlmostEqual(46.0, leak.hours)
+        self.assertAlmostEqual(expected.getSlope(), leak.growth)
+        self.assertAlmostEqual(expected.getRSquared(), leak.rSquared)
+        self.assertTrue(leak.rSquared > 0.99)
+
+    def testEviction(self):
+        """ Test that jobs which are gone are dropped """
+        detector = LeakDetector(maxIdle=2)
+        detector.update(self.makeEntry(0, [('1', 'a', 1), ('2', 'b', 1)], 1000, 0))
+        detector.update(self.makeEntry(1, [('1', 'a', 1)], 1000, 0))
+        self.assertEqual(2, len(detector.jobStats))
+        detector.update(self.makeEntry(2, [('1', 'a', 1)], 1000, 0))
+        self.assertEqual([('1', 'a')], list(detector.jobStats))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+try:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import urlopen, HTTPError
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.append('../')
+
+from job import Job
+from metrics_exporter import MetricsExporter, MetricsServer, isLiveFeed, main
+from top_entry import TopEntry
+from top_parser import TopParser
+
+class MetricsExporterTestCase(unittest.TestCase):
+    """ Tests for MetricsExporter and MetricsServer. """
+
+    TEST_FILE = 'data/topFiveEntriesWithDate.log'
+
+    def getSamples(self, payload, name):
+        """:return: dict - the labels -> value of each sample of the metric name in payload"""
+        samples = {}
+        for line in payload.decode('utf-8').splitlines():
+            if line.startswith(name + '{') or line.startswith(name + ' '):
+                series, value = line.rsplit(' ', 1)
+                samples[series[len(name):]] = float(value)
+        return samples
+
+    def testPayload(self):
+        """ Test the metrics of each entry, and that processes and users beyond the top n are summed """
+        exporter = MetricsExporter(3)
+        self.assertEqual(b'', b''.join(line for line in exporter.getPayload().splitlines() if not line.startswith(b'#')))
+
+        entries = list(TopParser(self.TEST_FILE).iterEntries())
+        for topEntry in entries:
+            exporter.update(topEntry)
+        payload = exporter.getPayload()
+        topEntry = entries[-1]
+
+        self.assertEqual({'': 5}, self.getSamples(payload, 'top_snapshots_total'))
+        self.assertEqual({'': len(topEntry.jobs)}, self.getSamples(payload, 'top_jobs'))
+        self.assertEqual(topEntry.header[TopEntry.LOAD_1_MINUTE],
+                         self.getSamples(payload, 'top_load_average')['{period="1m"}'])
+        self.assertEqual(topEntry.header[TopEntry.CPU_WAIT],
+                         self.getSamples(payload, 'top_cpu_percent')['{mode="iowait"}'])
+        self.assertEqual(topEntry.header[TopEntry.MEM_USED],
+                         self.getSamples(payload, 'top_memory_kib')['{state="used"}'])
+
+        processes = self.getSamples(payload, 'top_process_resident_kib')
+        self.assertEqual(4, len(processes))
+        self.assertEqual(sum(job.info[Job.JOB_RES] for job in topEntry.jobs.values()), sum(processes.values()))
+        largest = max(topEntry.jobs.values(), key=lambda job: job.info[Job.JOB_RES]).info
+        self.assertEqual(largest[Job.JOB_RES], processes['{{pid="{0}",command="{1}"}}'.format(
+            largest[Job.JOB_PID], largest[Job.JOB_COMMAND])])
+        self.assertTrue('{pid="other",command="other"}' in processes)
+
+        users = self.getSamples(payload, 'top_user_cpu_percent')
+        self.assertAlmostEqual(sum(job.info[Job.JOB_CPU] for job in topEntry.jobs.values()), sum(users.values()))
+        self.assertEqual(1, payload.count(b'# TYPE top_user_cpu_percent gauge'))
+
+    def testUndated(self):
+        """ Test that an entry without a date has no snapshot timestamp, since its date is made up """
+        exporter = MetricsExporter()
+        topEntry = next(TopParser('data/top_30sec_20iter.log').iterEntries())
+        self.assertFalse(topEntry.hasDate)
+        exporter.update(topEntry)
+        payload = exporter.getPayload()
+        self.assertEqual({}, self.getSamples(payload, 'top_snapshot_timestamp_seconds'))
+        self.assertEqual({'': 1}, self.getSamples(payload, 'top_snapshots_total'))
+
+    def testPrint(self):
+        """ Test that --print prints the metrics once a file has been read, or after each entry of a live feed """
+        stdin, stdout = sys.stdin, sys.stdout
+        sys.stdout = StringIO()
+        try:
+            main([self.TEST_FILE, '--print'])
+            self.assertEqual(1, sys.stdout.getvalue().count('# HELP top_snapshots_total '))
+            self.assertEqual({'': 5}, self.getSamples(sys.stdout.getvalue().encode('utf-8'), 'top_snapshots_total'))
+
+            sys.stdout = StringIO()
+            with open(self.TEST_FILE, 'r') as f:
+                sys.stdin = f
+                main(['-', '--print'])
+            self.assertEqual(5, sys.stdout.getvalue().count('# HELP top_snapshots_total '))
+        finally:
+            sys.stdin, sys.stdout = stdin, stdout
+
+    def testIsLiveFeed(self):
+        """ Test that stdin and fifos are live feeds, and files aren't """
+        self.assertTrue(isLiveFeed('-'))
+        self.assertFalse(isLiveFeed(self.TEST_FILE))
+        self.assertFalse(isLiveFeed('data/missing.log'))
+        directory = tempfile.mkdtemp()
+        try:
+            fifo = os.path.join(directory, 'top.fifo')
+            os.mkfifo(fifo)
+            self.assertTrue(isLiveFeed(fifo))
+        finally:
+            shutil.rmtree(directory)
+
+    def testSources(self):
+        """ Test that the metrics of several sources are labelled and grouped under one header """
+        exporter = MetricsExporter()
+        entries = list(TopParser(self.TEST_FILE).iterEntries())
+        exporter.update(entries[0], 'web1')
+        exporter.update(entries[1], 'we"b2')
+        exporter.update(entries[2], 'web1')
+        payload = exporter.getPayload()
+
+        self.assertEqual(1, payload.count(b'# HELP top_load_average '))
+        loads = self.getSamples(payload, 'top_load_average')
+        self.assertEqual(entries[2].header[TopEntry.LOAD_1_MINUTE], loads['{host="web1",period="1m"}'])
+        self.assertEqual(entries[1].header[TopEntry.LOAD_1_MINUTE], loads['{host="we\\"b2",period="1m"}'])
+        self.assertEqual({'{host="web1"}': 2, '{host="we\\"b2"}': 1}, self.getSamples(payload, 'top_snapshots_total'))
+
+    def testServer(self):
+        """ Test that the payload is served at /metrics """
+        exporter = MetricsExporter()
+        exporter.update(next(TopParser(self.TEST_FILE).iterEntries()))
+        server = MetricsServer(('127.0.0.1', 0), exporter)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+            response = urlopen(url + '/metrics')
+            self.assertEqual(MetricsExporter.CONTENT_TYPE, response.info()['Content-Type'])
+            self.assertEqual(exporter.getPayload(), response.read())
+            self.assertRaises(HTTPError, urlopen, url + '/missing')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+    unittest.main()
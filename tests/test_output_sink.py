@@ -0,0 +1,152 @@
+import csv
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.append('../')
+
+from job import Job
+from output_sink import OutputSink, CsvSink, JsonLinesSink, SqliteSink
+from symbol_table import SymbolTable
+from top_entry import TopEntry
+from top_parser import TopParser
+
+class OutputSinkTestCase(unittest.TestCase):
+    """ Tests for the output sinks. """
+
+    TEST_FILE = 'data/topFiveEntriesWithDate.log'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.entries = list(TopParser(self.TEST_FILE).iterEntries())
+        self.numJobs = sum(len(topEntry.jobs) for topEntry in self.entries)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeEntries(self, fileName, format=None, symbols=None):
+        """Write the test entries to fileName in the temp directory, using a small batch size."""
+        fileName = os.path.join(self.directory, fileName)
+        with OutputSink.create(fileName, format, batchSize=100, symbols=symbols) as sink:
+            self.assertEqual(5, sink.writeAll(self.entries))
+        return fileName
+
+    def testCreate(self):
+        """ Test that the sink is chosen from the format or extension """
+        for fileName, format, sinkClass in (('top.csv', None, CsvSink), ('top.jsonl', None, JsonLinesSink),
+                                            ('top.db', None, SqliteSink), ('top.out', 'sqlite', SqliteSink)):
+            sink = OutputSink.create(os.path.join(self.directory, fileName), format)
+            self.assertTrue(isinstance(sink, sinkClass))
+            sink.close()
+        self.assertRaises(Exception, OutputSink.create, os.path.join(self.directory, 'top.out'))
+
+    def testSqlite(self):
+        """ Test writing to an SQLite database """
+        fileName = self.writeEntries('top.db')
+
+        connection = sqlite3.connect(fileName)
+        self.assertEqual(5, connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0])
+        self.assertEqual(self.numJobs, connection.execute('SELECT COUNT(*) FROM jobs').fetchone()[0])
+
+        timestamp, load = connection.execute('SELECT timestamp, "1 minute load" FROM entries WHERE id = 1').fetchone()
+        self.assertEqual(self.entries[0].getDateTime().strftime(OutputSink.TIMESTAMP_FORMAT), timestamp)
+        self.assertEqual(self.entries[0].header[TopEntry.LOAD_1_MINUTE], load)
+
+        job = self.entries[0].jobs['4408']
+        row = connection.execute('SELECT memResident, command FROM jobs WHERE entry_id = 1 AND pid = 4408').fetchone()
+        self.assertEqual((job.info[Job.JOB_RES], job.info[Job.JOB_COMMAND]), row)
+
+        indexes = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        self.assertTrue('jobs_pid' in indexes)
+        self.assertTrue('jobs_timestamp' in indexes)
+        connection.close()
+
+        # Appending continues the entry ids
+        self.writeEntries('top.db')
+        connection = sqlite3.connect(fileName)
+        self.assertEqual(10, connection.execute('SELECT MAX(id) FROM entries').fetchone()[0])
+        connection.close()
+
+    def testSqliteSymbols(self):
+        """ Test writing symbol ids to an SQLite database, and appending with a different symbol table """
+        symbols = SymbolTable()
+        fileName = self.writeEntries('top.db', symbols=symbols)
+
+        connection = sqlite3.connect(fileName)
+        self.assertEqual(len(symbols), connection.execute('SELECT COUNT(*) FROM symbols').fetchone()[0])
+        job = self.entries[0].jobs['4408']
+        row = connection.execute('SELECT jobs.command, symbols.symbol FROM jobs JOIN symbols ON jobs.command = symbols.id '
+                                 'WHERE entry_id = 1 AND pid = 4408').fetchone()
+        self.assertEqual((symbols.getId(job.info[Job.JOB_COMMAND]), job.info[Job.JOB_COMMAND]), row)
+        connection.close()
+
+        # The stored symbols are merged into a new table, so that existing ids keep their meaning
+        otherSymbols = SymbolTable()
+        self.writeEntries('top.db', symbols=otherSymbols)
+        self.assertEqual(symbols.symbols, otherSymbols.symbols)
+
+        conflictingSymbols = SymbolTable(['not in the database'])
+        self.assertRaises(Exception, self.writeEntries, 'top.db', symbols=conflictingSymbols)
+
+    def testJsonLinesSymbols(self):
+        """ Test that JSON Lines written with symbol ids are read back with the symbols """
+        symbols = SymbolTable()
+        fileName = self.writeEntries('top.jsonl', symbols=symbols)
+
+        with open(fileName) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(symbols.symbols, sum([record['symbols'] for record in records if 'symbols' in record], []))
+        self.assertTrue(all(isinstance(info[Job.JOB_COMMAND], int) for record in records if 'jobs' in record
+                            for info in record['jobs']))
+
+        entries = list(JsonLinesSink.readEntries(fileName))
+        self.assertEqual(5, len(entries))
+        for topEntry, readEntry in zip(self.entries, entries):
+            for pid, job in topEntry.jobs.items():
+                self.assertEqual(job.info[Job.JOB_COMMAND], readEntry.jobs[pid].info[Job.JOB_COMMAND])
+                self.assertEqual(job.info[Job.JOB_USER], readEntry.jobs[pid].info[Job.JOB_USER])
+
+    def testJsonLines(self):
+        """ Test writing JSON Lines """
+        fileName = self.writeEntries('top.jsonl')
+
+        with open(fileName) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(5, len(records))
+        self.assertEqual(self.entries[4].header, records[4]['header'])
+        self.assertEqual(len(self.entries[4].jobs), len(records[4]['jobs']))
+
+    def testCsv(self):
+        """ Test writing CSV """
+        fileName = self.writeEntries('top.csv')
+
+        with open(fileName) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(6, len(rows))
+        self.assertEqual([OutputSink.TIMESTAMP] + list(TopEntry.HEADER_FIELDS), rows[0])
+
+        with open(os.path.join(self.directory, 'top.jobs.csv')) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(self.numJobs + 1, len(rows))
+
+    def testCsvSymbols(self):
+        """ Test that CSV written with symbol ids has a file of the symbols """
+        symbols = SymbolTable()
+        self.writeEntries('top.csv', symbols=symbols)
+
+        with open(os.path.join(self.directory, 'top.symbols.csv')) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(['id', 'symbol'], rows[0])
+        self.assertEqual(symbols.symbols, [symbol for symbolId, symbol in rows[1:]])
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+
+    unittest.main()
@@ -0,0 +1,115 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append('../')
+
+from job import Job
+from parse_client import ParseClient
+from parse_service import ParseCache, ParseService, ServiceServer
+from top_entry import TopEntry
+
+class ParseServiceTestCase(unittest.TestCase):
+    """ Tests for ParseService and ParseClient. """
+
+    TEST_FILE = 'data/topFiveEntriesWithDate.log'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.directory, 'top.log')
+        shutil.copy(self.TEST_FILE, self.fileName)
+        self.socketPath = os.path.join(self.directory, 'service.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testService(self):
+        """ Test requests to a service with a pool of workers, over its socket """
+        pool = multiprocessing.Pool(1)
+        server = ServiceServer(self.socketPath, ParseService(ParseCache(2, pool)))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            client = ParseClient.connect(self.socketPath)
+            self.assertEqual('pong', client.request('ping'))
+
+            series = client.request('header', file=self.fileName, fields=[TopEntry.LOAD_1_MINUTE])
+            self.assertEqual(5, len(series))
+            self.assertEqual({'timestamp': '{0}-05-26 18:05:02'.format(TopEntry.YEAR), TopEntry.LOAD_1_MINUTE: 0.81},
+                             series[0])
+
+            series = client.request('jobs', file=self.fileName, pid='4408', fields=[Job.JOB_COMMAND])
+            self.assertEqual(5, len(series))
+            self.assertEqual('java', series[0][Job.JOB_COMMAND])
+
+            summary = client.request('summary', file=self.fileName)
+            self.assertEqual(5, summary['entries'])
+            stats = client.request('stats')
+            self.assertEqual({'hits': 2, 'misses': 1, 'files': 1},
+                             dict((key, stats[key]) for key in ('hits', 'misses', 'files')))
+            self.assertTrue(stats['bytes'] > 0)
+
+            result = client.request('query', file=self.fileName, args=[self.fileName, '--agg', 'count'])
+            self.assertEqual({'columns': ['count(*)'], 'rows': [[5]]}, result)
+
+            self.assertRaises(Exception, client.request, 'unknown')
+            # Bad query arguments are reported, and the connection can still be used
+            self.assertRaises(Exception, client.request, 'query', file=self.fileName, args=['--agg'])
+            self.assertRaises(Exception, client.request, 'query', file=self.fileName, args=['--help'])
+            self.assertEqual('pong', client.request('ping'))
+            self.assertRaises(Exception, client.request, 'summary', file=os.path.join(self.directory, 'missing.log'))
+            client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            pool.terminate()
+
+    def testCacheInvalidation(self):
+        """ Test that a file is parsed again once it changes, and that the least recently used file is dropped """
+        cache = ParseCache(1)
+        entries = cache.getEntries(self.fileName)
+        self.assertTrue(entries is cache.getEntries(self.fileName))
+
+        with open(self.fileName, 'a') as f:
+            f.write('\n')
+        os.utime(self.fileName, (time.time() + 10, time.time() + 10))
+        self.assertFalse(entries is cache.getEntries(self.fileName))
+        self.assertEqual(1, len(cache.entries))
+
+        cache.getEntries('data/topTwoEntriesWithDate.log')
+        self.assertEqual(1, len(cache.entries))
+        self.assertEqual((1, 3), (cache.hits, cache.misses))
+
+    def testCacheMemory(self):
+        """ Test that the least recently used files are dropped once the cache holds too many bytes of entries """
+        cache = ParseCache(8)
+        size = cache.getSize(cache.getEntries(self.fileName))
+        cache.getEntries('data/topTwoEntriesWithDate.log')
+        self.assertEqual(2, len(cache.entries))
+
+        cache = ParseCache(8, cacheBytes=size + 1)
+        cache.getEntries(self.fileName)
+        entries = cache.getEntries('data/topTwoEntriesWithDate.log')
+        self.assertEqual([entries], list(cache.entries.values()))
+        self.assertEqual(cache.getSize(entries), cache.numBytes)
+        # The most recently used file is kept even if it is over the limit on its own
+        cache = ParseCache(8, cacheBytes=1)
+        cache.getEntries(self.fileName)
+        self.assertEqual(1, len(cache.entries))
+
+    def testNotRunning(self):
+        """ Test that connecting when the service isn't running gives None """
+        self.assertEqual(None, ParseClient.connect(self.socketPath))
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+    unittest.main()
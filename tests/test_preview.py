@@ -0,0 +1,76 @@
+import logging
+import sys
+import unittest
+
+sys.path.append('../')
+
+from preview import Preview, SnapshotSampler, estimate
+from top_entry import TopEntry
+from top_parser import TopParser
+
+class PreviewTestCase(unittest.TestCase):
+    """ Tests for SnapshotSampler and Preview. """
+
+    DATE_FILE = 'data/topFiveEntriesWithDate.log'
+    NO_DATE_FILE = 'data/top_30sec_20iter.log'
+
+    def testEstimate(self):
+        """ Test the mean and its standard error """
+        self.assertEqual((None, None), estimate([]))
+        self.assertEqual((2.0, None), estimate([2.0]))
+        mean, stdErr = estimate([1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(2.5, mean)
+        self.assertAlmostEqual((5.0 / 3 / 4) ** 0.5, stdErr)
+        # A sample of the whole population has no error
+        self.assertEqual(0.0, estimate([1.0, 2.0, 3.0, 4.0], 4)[1])
+
+    def testSampleAll(self):
+        """ Test that with more samples than snapshots, each snapshot is found once, with its date """
+        entries = list(TopParser(self.DATE_FILE).iterEntries())
+        sampler = SnapshotSampler(self.DATE_FILE, 50, SnapshotSampler.METHOD_EVEN)
+        snapshots = list(sampler.iterSnapshots())
+        self.assertEqual(len(entries), len(snapshots))
+        with open(self.DATE_FILE, 'rb') as f:
+            data = f.read()
+        for expected, (start, end, topEntry) in zip(entries, snapshots):
+            self.assertEqual(expected.header, topEntry.header)
+            self.assertEqual(sorted(expected.jobs), sorted(topEntry.jobs))
+            self.assertTrue(TopEntry.RE_DATE.match(data[start:end].decode('utf-8')))
+
+        preview = Preview()
+        preview.addSnapshots(sampler)
+        self.assertEqual(len(entries), len(preview.samples))
+        for field, mean, stdErr in preview.getFieldEstimates():
+            self.assertAlmostEqual(sum(topEntry.header[field] for topEntry in entries) / float(len(entries)), mean)
+        commands = preview.getCommandEstimates(3)
+        self.assertEqual(3, len(commands))
+        self.assertTrue(commands[0][1] >= commands[1][1] >= commands[2][1])
+        self.assertTrue('Sampled 5 of about 5 snapshots' in preview.report())
+
+    def testRandomSample(self):
+        """ Test that a random sample is repeatable, and its snapshots are parsed as they are by TopParser """
+        entries = dict((topEntry.header[TopEntry.TIME_OF_DAY], topEntry)
+                       for topEntry in TopParser(self.NO_DATE_FILE).iterEntries())
+        snapshots = list(SnapshotSampler(self.NO_DATE_FILE, 8, seed=1).iterSnapshots())
+        starts = [start for start, end, topEntry in snapshots]
+        again = SnapshotSampler(self.NO_DATE_FILE, 8, seed=1).iterSnapshots()
+        self.assertEqual(starts, [start for start, end, topEntry in again])
+        self.assertTrue(4 <= len(snapshots) <= 8)
+        self.assertEqual(sorted(set(starts)), starts)
+        for start, end, topEntry in snapshots:
+            expected = entries[topEntry.header[TopEntry.TIME_OF_DAY]]
+            self.assertEqual(expected.header, topEntry.header)
+            self.assertEqual(len(expected.jobs), len(topEntry.jobs))
+
+    def testUndated(self):
+        """ Test that snapshots without a date are reported by their uptime rather than their made up dates """
+        preview = Preview()
+        preview.addSnapshots(SnapshotSampler(self.NO_DATE_FILE, 50, SnapshotSampler.METHOD_EVEN))
+        self.assertFalse(preview.isDated())
+        report = preview.report()
+        self.assertTrue('Sampled 20 of about 20 snapshots, from uptime 27d 16:32 to uptime 27d 16:' in report)
+        self.assertFalse('2000-01-' in report)
+
+
+if __name__ == '__main__':
+    unittest.main()
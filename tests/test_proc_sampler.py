@@ -0,0 +1,132 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('../')
+
+from job import Job
+from proc_sampler import ProcSampler
+from top_entry import TopEntry
+
+class ProcSamplerTestCase(unittest.TestCase):
+    """ Tests for ProcSampler, using a fake /proc. """
+
+    MEMINFO = """MemTotal:        1000000 kB
+MemFree:          400000 kB
+MemAvailable:     700000 kB
+Buffers:           10000 kB
+Cached:           200000 kB
+SwapCached:            0 kB
+SReclaimable:      40000 kB
+SwapTotal:        500000 kB
+SwapFree:         450000 kB
+"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.writeFile('meminfo', self.MEMINFO)
+        self.writeFile('loadavg', '0.50 0.25 0.10 2/120 4856\n')
+        self.writeStat(1000, 0, 200, 8000, 100)
+        self.writeFile('uptime', '3723.50 7000.00\n')
+        self.writeJob(1, 'init', 'S', 0, 100, 50, 20)
+        self.writeJob(42, 'my (odd) cmd', 'R', 1000, 300, 100, -100)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeFile(self, path, contents):
+        path = os.path.join(self.directory, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(contents)
+
+    def writeStat(self, user, nice, system, idle, wait):
+        self.writeFile('stat', "cpu  {0} {1} {2} {3} {4} 0 0 0 0 0\ncpu0 {0} {1} {2} {3} {4} 0 0 0 0 0\n"
+                               "intr 0\n".format(user, nice, system, idle, wait))
+
+    def writeJob(self, pid, command, state, uid, utime, stime, priority):
+        fields = [state, '1', str(pid), '0', '0', '-1', '0', '0', '0', '0', '0', str(utime), str(stime), '0', '0',
+                  str(priority), '0', '1', '0', '100'] + ['0'] * 16 + ['3'] + ['0'] * 13
+        self.writeFile(os.path.join(str(pid), 'stat'), "{0} ({1}) {2}\n".format(pid, command, ' '.join(fields)))
+        self.writeFile(os.path.join(str(pid), 'statm'), "1000 300 100 10 0 200 0\n")
+        self.writeFile(os.path.join(str(pid), 'status'),
+                       "Name:\t{0}\nUid:\t{1}\t{1}\t{1}\t{1}\n".format(command, uid))
+
+    def makeSampler(self):
+        sampler = ProcSampler(perCpu=True, procDir=self.directory, utmpFile=os.path.join(self.directory, 'utmp'))
+        sampler.clockTicks = 100
+        sampler.pageKiB = 4
+        return sampler
+
+    def testSample(self):
+        """ Test the header and jobs of the first sample """
+        with self.makeSampler() as sampler:
+            topEntry = sampler.sample()
+
+        header = topEntry.header
+        self.assertEqual(62, header[TopEntry.UPTIME_MINUTES])
+        self.assertEqual(0, header[TopEntry.NUM_USERS])
+        self.assertEqual(0.5, header[TopEntry.LOAD_1_MINUTE])
+        self.assertEqual(0.1, header[TopEntry.LOAD_15_MINUTES])
+        self.assertEqual(2, header[TopEntry.TASKS_TOTAL])
+        self.assertEqual(1, header[TopEntry.TASKS_RUNNING])
+        self.assertEqual(1, header[TopEntry.TASKS_SLEEPING])
+        self.assertEqual(10.8, header[TopEntry.CPU_UNNICED])
+        self.assertEqual(86.0, header[TopEntry.CPU_IDLE])
+        self.assertEqual(10.8, topEntry.cpus[0][TopEntry.CPU_UNNICED])
+        self.assertEqual(1000000, header[TopEntry.MEM_TOTAL])
+        self.assertEqual(300000, header[TopEntry.MEM_USED])
+        self.assertEqual(250000, header[TopEntry.MEM_BUFF_CACHE])
+        self.assertEqual(700000, header[TopEntry.MEM_AVAILABLE])
+        self.assertEqual(50000, header[TopEntry.SWAP_USED])
+        self.assertIsNotNone(topEntry.getDateTime())
+
+        job = topEntry.jobs['42']
+        self.assertEqual('my (odd) cmd', job.info[Job.JOB_COMMAND])
+        self.assertEqual('rt', job.info[Job.JOB_PR])
+        self.assertEqual('R', job.info[Job.JOB_STATUS])
+        self.assertEqual(4000, job.info[Job.JOB_VIRT])
+        self.assertEqual(1200, job.info[Job.JOB_RES])
+        self.assertEqual(400, job.info[Job.JOB_SHR])
+        self.assertEqual(0.1, job.info[Job.JOB_MEM])
+        self.assertEqual('0:04.00', job.info[Job.JOB_TIME])
+        self.assertEqual(1000, job.info[Job.JOB_UID])
+        self.assertEqual(3, job.info[Job.JOB_LAST_CPU])
+        self.assertEqual('1', job.info[Job.JOB_PPID])
+        self.assertEqual('20', topEntry.jobs['1'].info[Job.JOB_PR])
+
+    def testCpuDeltas(self):
+        """ Test that percentages are computed from the change since the previous sample """
+        with self.makeSampler() as sampler:
+            sampler.sample()
+            self.writeStat(1150, 0, 250, 8200, 100)
+            self.writeFile('uptime', '3725.50 7000.00\n')
+            self.writeJob(42, 'my (odd) cmd', 'R', 1000, 400, 150, -100)
+            shutil.rmtree(os.path.join(self.directory, '1'))
+            topEntry = sampler.sample()
+
+        self.assertEqual(37.5, topEntry.header[TopEntry.CPU_UNNICED])
+        self.assertEqual(12.5, topEntry.header[TopEntry.CPU_SYSTEM])
+        self.assertEqual(50.0, topEntry.header[TopEntry.CPU_IDLE])
+        self.assertEqual(['42'], list(topEntry.jobs))
+        self.assertEqual(75.0, topEntry.jobs['42'].info[Job.JOB_CPU])
+        self.assertEqual(1, topEntry.header[TopEntry.TASKS_TOTAL])
+
+    @unittest.skipUnless(os.path.exists('/proc/stat'), "requires /proc")
+    def testLiveProc(self):
+        """ Test sampling the real /proc """
+        with ProcSampler(threads=True) as sampler:
+            entries = list(sampler.iterSamples(0.01, 2))
+        self.assertEqual(2, len(entries))
+        self.assertTrue(str(os.getpid()) in entries[1].jobs)
+        self.assertTrue(entries[1].header[TopEntry.MEM_TOTAL] > 0)
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+    unittest.main()
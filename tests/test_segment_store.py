@@ -0,0 +1,66 @@
+import logging
+import os
+import sys
+import unittest
+
+sys.path.append('../')
+
+from job import Job
+from segment_store import SegmentStore
+from top_parser import TopParser
+
+class SegmentStoreTestCase(unittest.TestCase):
+    """ Tests for SegmentStore. """
+
+    TEST_FILE = 'data/top_30sec_20iter.log'
+
+    def setUp(self):
+        self.entries = list(TopParser(self.TEST_FILE).iterEntries())
+
+    def assertSameEntry(self, expected, actual):
+        self.assertEqual(expected.header, actual.header)
+        self.assertEqual(sorted(expected.jobs), sorted(actual.jobs))
+        for pid, job in expected.jobs.items():
+            self.assertEqual(job.info, actual.jobs[pid].info)
+
+    def testSpill(self):
+        """ Test that entries past the budget are spilled, and read back in order """
+        # Room for about one entry per segment
+        budget = (SegmentStore.ENTRY_BYTES + SegmentStore.JOB_BYTES * 300) * (SegmentStore.NUM_CACHED_SEGMENTS + 1)
+        with SegmentStore(budget) as store:
+            store.extend(self.entries)
+            self.assertEqual(20, len(store))
+            self.assertTrue(len(store.segmentFiles) >= 10)
+            self.assertTrue(len(store.pending) < 20)
+
+            for expected, actual in zip(self.entries, store):
+                self.assertSameEntry(expected, actual)
+            self.assertSameEntry(self.entries[3], store[3])
+            self.assertSameEntry(self.entries[-1], store[-1])
+            self.assertEqual(3, len(store[5:11:2]))
+            self.assertSameEntry(self.entries[9], store[5:11:2][2])
+            self.assertRaises(IndexError, store.__getitem__, 20)
+
+            # Only the most recently used segments stay loaded
+            self.assertTrue(len(store.cache) <= SegmentStore.NUM_CACHED_SEGMENTS)
+            directory = store.directory
+        self.assertFalse(os.path.exists(directory))
+
+    def testTopParserBudget(self):
+        """ Test parsing with a memory budget """
+        topParser = TopParser(self.TEST_FILE, memoryBudget=512 * 1024)
+        topParser.parse()
+        try:
+            self.assertEqual(20, len(topParser.entries))
+            self.assertTrue(topParser.entries.segmentFiles)
+            self.assertSameEntry(self.entries[0], topParser.entries[0])
+            self.assertEqual(self.entries[12].jobs['1'].info[Job.JOB_COMMAND],
+                             topParser.entries[12].jobs['1'].info[Job.JOB_COMMAND])
+        finally:
+            topParser.close()
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+    unittest.main()
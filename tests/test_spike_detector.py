@@ -0,0 +1,119 @@
+import datetime
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('../')
+
+from job import Job
+from spike_detector import EwmaStat, SpikeDetector
+from top_entry import TopEntry
+from top_parser import TopParser
+
+class SpikeDetectorTestCase(unittest.TestCase):
+    """ Tests for SpikeDetector. """
+
+    def makeEntry(self, second, load, jobs):
+        """
+        Make a TopEntry with the given 1 minute load and jobs.
+        : jobs - list of (pid, command, cpuPercent, memResident)
+        """
+        topEntry = TopEntry(True)
+        topEntry.header[TopEntry.DATE] = datetime.date(2015, 7, 20).toordinal()
+        topEntry.header[TopEntry.TIME_OF_DAY] = '10:{0:02d}:{1:02d}'.format(second // 60, second % 60)
+        topEntry.header[TopEntry.LOAD_1_MINUTE] = load
+        for pid, command, cpu, res in jobs:
+            job = Job()
+            job.info = {Job.JOB_PID: pid, Job.JOB_COMMAND: command, Job.JOB_CPU: cpu, Job.JOB_RES: res}
+            topEntry.jobs[pid] = job
+        return topEntry
+
+    def testEwmaStat(self):
+        """ Test the moving statistics """
+        stat = EwmaStat()
+        self.assertEqual(None, stat.score(1.0, 0.1))
+        for i in range(100):
+            stat.update(5.0, 0.1)
+        self.assertAlmostEqual(5.0, stat.mean)
+        self.assertAlmostEqual(0.0, stat.variance)
+        self.assertAlmostEqual(10.0, stat.score(6.0, 0.1))
+
+        stat.update(6.0, 0.5)
+        self.assertAlmostEqual(5.5, stat.mean)
+        self.assertAlmostEqual(0.25, stat.variance)
+
+    def testLoadSpike(self):
+        """ Test that a load spike is detected and attributed to the job whose cpu rose """
+        detector = SpikeDetector(warmup=5)
+        for second in range(20):
+            jobs = [('100', 'java', 10.0 + second % 2, 1000), ('200', 'postgres', 5.0, 2000)]
+            self.assertEqual([], detector.update(self.makeEntry(second, 1.0 + 0.01 * (second % 3), jobs)))
+
+        jobs = [('100', 'java', 11.0, 1000), ('200', 'postgres', 95.0, 2000), ('300', 'cron', 1.0, 10)]
+        events = detector.update(self.makeEntry(20, 3.5, jobs))
+
+        fields = dict((event.field, event) for event in events)
+        event = fields[TopEntry.LOAD_1_MINUTE]
+        self.assertEqual(3.5, event.value)
+        self.assertTrue(event.score >= 4.0)
+        self.assertEqual('200', event.contributors[0][0].getPid())
+        self.assertEqual(['200', '300'], [job.getPid() for job, delta in event.contributors[:2]])
+
+        # The job's own cpu spike is reported too
+        event = fields[Job.JOB_CPU]
+        self.assertEqual('200', event.job.getPid())
+        self.assertTrue('postgres' in str(event))
+
+    def testBoundedState(self):
+        """ Test that jobs which have gone away are no longer tracked """
+        detector = SpikeDetector(maxJobs=50, maxIdle=3)
+        for second in range(100):
+            jobs = [(str(pid), 'worker', 1.0, 100) for pid in range(second * 10, second * 10 + 20)]
+            detector.update(self.makeEntry(second, 1.0, jobs))
+            self.assertTrue(len(detector.jobStats) <= 50)
+        self.assertEqual(set(str(pid) for pid in range(990, 1010)) | set(str(pid) for pid in range(970, 990)),
+                         set(pid for pid, command in detector.jobStats))
+
+    def testCapture(self):
+        """ Test running over a capture """
+        detector = SpikeDetector(warmup=3)
+        events = list(detector.detect(TopParser('data/top_30sec_20iter.log').iterEntries()))
+        self.assertEqual(20, detector.numEntries)
+        for event in events:
+            self.assertTrue(abs(event.score) >= detector.threshold)
+
+    def testReducedLayout(self):
+        """ Test a capture whose layout has no RES column, whose jobs are only checked for cpu spikes """
+        directory = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(directory, 'top.log')
+            with open('data/top_30sec_20iter.log', 'r') as f, open(fileName, 'w') as out:
+                inJobs = False
+                for line in f:
+                    if line.lstrip().startswith('PID '):
+                        inJobs = True
+                        line = '  PID USER      %CPU COMMAND\n'
+                    elif inJobs and line.strip():
+                        columns = line.split(None, 11)
+                        line = '{0:>5} {1:<8} {2:>5} {3}'.format(columns[0], columns[1], columns[8], columns[11])
+                    elif not line.strip():
+                        inJobs = False
+                    out.write(line)
+
+            detector = SpikeDetector(warmup=3)
+            events = list(detector.detect(TopParser(fileName).iterEntries()))
+            self.assertEqual(20, detector.numEntries)
+            self.assertTrue(len(detector.jobStats) > 0)
+            self.assertEqual([], [event for event in events if event.field == Job.JOB_RES])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+
+    unittest.main()
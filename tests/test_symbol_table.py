@@ -0,0 +1,66 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('../')
+
+from job import Job
+from symbol_table import SymbolTable
+from top_parser import TopParser
+
+class SymbolTableTestCase(unittest.TestCase):
+    """ Tests for SymbolTable. """
+
+    def testIds(self):
+        """ Test that ids are assigned in order and looked up both ways """
+        symbols = SymbolTable(['root', 'java'])
+        self.assertEqual(0, symbols.getId('root'))
+        self.assertEqual(2, symbols.getId('postgres'))
+        self.assertEqual(1, symbols.getId('java'))
+        self.assertEqual('postgres', symbols.getSymbol(2))
+        self.assertEqual(3, len(symbols))
+
+        info = {Job.JOB_PID: '1', Job.JOB_USER: 'root', Job.JOB_COMMAND: 'init', Job.JOB_STATUS: 'S'}
+        encoded = symbols.encodeJob(info)
+        self.assertEqual({Job.JOB_PID: '1', Job.JOB_USER: 0, Job.JOB_COMMAND: 3, Job.JOB_STATUS: 4}, encoded)
+        symbols.decodeJob(encoded)
+        self.assertEqual(info, encoded)
+
+        symbols.merge(['root', 'java', 'postgres'])
+        self.assertRaises(Exception, symbols.merge, ['java'])
+
+    def testSharedAcrossFiles(self):
+        """ Test that the jobs of several files share the table's strings """
+        symbols = SymbolTable()
+        first = list(TopParser('data/topTwoEntriesWithDate.log', symbols).iterEntries())
+        second = list(TopParser('data/topFiveEntriesWithDate.log', symbols).iterEntries())
+
+        job = first[0].jobs['2']
+        otherJob = second[4].jobs['2']
+        self.assertEqual(job.info[Job.JOB_COMMAND], otherJob.info[Job.JOB_COMMAND])
+        self.assertTrue(job.info[Job.JOB_COMMAND] is otherJob.info[Job.JOB_COMMAND])
+        self.assertTrue(job.info[Job.JOB_USER] is symbols.intern(job.info[Job.JOB_USER]))
+
+    def testSaveAndLoad(self):
+        """ Test that ids persist across a save and load """
+        directory = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(directory, 'top.symbols')
+            self.assertEqual(0, len(SymbolTable.load(fileName)))
+
+            symbols = SymbolTable(['root', 'java'])
+            symbols.save(fileName)
+            loaded = SymbolTable.load(fileName)
+            self.assertEqual(['root', 'java'], loaded.symbols)
+            self.assertEqual(1, loaded.getId('java'))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+    unittest.main()
@@ -0,0 +1,117 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('../')
+
+from job import Job
+from thread_fold import ThreadFolder, loadTgids
+from top_entry import TopEntry
+from top_parser import TopParser
+
+class ThreadFoldTestCase(unittest.TestCase):
+    """ Tests for ThreadFolder. """
+
+    TEST_FILE = 'data/topTwoEntriesWithDate.log'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='test_thread_fold')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def makeEntry(self, rows, command='java'):
+        """:return: TopEntry - an entry with a job for each row of (pid, tgid, cpu, time, status)"""
+        topEntry = TopEntry()
+        for pid, tgid, cpu, time, status in rows:
+            job = Job()
+            job.info = {Job.JOB_PID: pid, Job.JOB_USER: 'rss', Job.JOB_VIRT: 6053888, Job.JOB_RES: 592896,
+                        Job.JOB_SHR: 9604, Job.JOB_MEM: 7.3, Job.JOB_CPU: cpu, Job.JOB_TIME: time,
+                        Job.JOB_STATUS: status, Job.JOB_COMMAND: command}
+            if tgid is not None:
+                job.info[Job.JOB_TGID] = tgid
+            topEntry.jobs[pid] = job
+        return topEntry
+
+    def testHeuristic(self):
+        """ Test folding threads by their user and memory, leaving kernel threads alone """
+        threads = list(TopParser(self.TEST_FILE).iterEntries())
+        folder = ThreadFolder()
+        processes = list(TopParser(self.TEST_FILE, threadFolder=folder).iterEntries())
+        self.assertEqual(sum(len(topEntry.jobs) for topEntry in threads), folder.numThreads)
+        self.assertEqual(sum(len(topEntry.jobs) for topEntry in processes), folder.numProcesses)
+
+        javaThreads = [job.info for job in threads[0].jobs.values() if job.info[Job.JOB_RES] == 592896]
+        java = processes[0].jobs['697'].info
+        self.assertEqual(698, len(javaThreads))
+        self.assertEqual(698, java[Job.JOB_THREADS])
+        self.assertEqual('java', java[Job.JOB_COMMAND])
+        self.assertEqual(592896, java[Job.JOB_RES])
+        self.assertAlmostEqual(sum(info[Job.JOB_CPU] for info in javaThreads), java[Job.JOB_CPU])
+        self.assertEqual(sum(folder.parseTime(info[Job.JOB_TIME]) for info in javaThreads),
+                         folder.parseTime(java[Job.JOB_TIME]))
+
+        # Kernel threads have no memory, so can't be grouped
+        kernelThreads = [pid for pid, job in threads[0].jobs.items() if job.info[Job.JOB_VIRT] == 0]
+        for pid in kernelThreads:
+            self.assertEqual(1, processes[0].jobs[pid].info[Job.JOB_THREADS])
+        self.assertEqual(threads[0].header, processes[0].header)
+
+    def testHeuristicCommands(self):
+        """ Test that processes running different commands aren't folded together, even with the same memory """
+        topEntry = self.makeEntry([('500', None, 1.0, '0:01.00', 'S'), ('501', None, 2.0, '0:02.00', 'S')])
+        for pid, job in self.makeEntry([('600', None, 1.0, '0:01.00', 'S')], 'bash').jobs.items():
+            topEntry.jobs[pid] = job
+        topEntry = ThreadFolder().fold(topEntry)
+        self.assertEqual(['500', '600'], sorted(topEntry.jobs))
+        self.assertEqual(2, topEntry.jobs['500'].info[Job.JOB_THREADS])
+        self.assertEqual('bash', topEntry.jobs['600'].info[Job.JOB_COMMAND])
+
+    def testTgids(self):
+        """ Test folding threads by their TGID column, or by a map of thread ids """
+        folder = ThreadFolder()
+        topEntry = folder.fold(self.makeEntry([('101', '100', 1.5, '0:01.50', 'S'),
+                                               ('100', '100', 0.2, '1:59.60', 'S'),
+                                               ('102', '100', 3.0, '0:00.01', 'R'),
+                                               ('200', '200', 0.0, '0:00.00', 'S')]))
+        self.assertEqual(['100', '200'], sorted(topEntry.jobs))
+        process = topEntry.jobs['100'].info
+        self.assertEqual(3, process[Job.JOB_THREADS])
+        self.assertEqual(4.7, process[Job.JOB_CPU])
+        self.assertEqual('2:01.11', process[Job.JOB_TIME])
+        self.assertEqual('R', process[Job.JOB_STATUS])
+        self.assertEqual(1, topEntry.jobs['200'].info[Job.JOB_THREADS])
+
+        fileName = os.path.join(self.directory, 'top.tgids')
+        with open(fileName, 'w') as f:
+            f.write("# ps -eLo lwp=,pid=\n  300   300\n  301   300\n\n/proc/400/task/401\n")
+        tgids = loadTgids(fileName)
+        self.assertEqual({'300': '300', '301': '300', '401': '400'}, tgids)
+
+        # The map takes priority over the heuristic, which would fold these together
+        folder = ThreadFolder(tgids)
+        topEntry = folder.fold(self.makeEntry([('300', None, 1.0, '0:01.00', 'S'),
+                                               ('301', None, 1.0, '0:01.00', 'S'),
+                                               ('400', None, 1.0, '0:01.00', 'S'),
+                                               ('401', None, 1.0, '0:01.00', 'S')]))
+        self.assertEqual(['300', '400'], sorted(topEntry.jobs))
+        self.assertEqual(2, topEntry.jobs['300'].info[Job.JOB_THREADS])
+        self.assertEqual(2, topEntry.jobs['400'].info[Job.JOB_THREADS])
+        self.assertEqual('400', topEntry.jobs['400'].info[Job.JOB_TGID])
+
+        # Without its leader, 401 is left as it is, rather than taking a pid that another row could have
+        topEntry = folder.fold(self.makeEntry([('300', None, 1.0, '0:01.00', 'S'),
+                                               ('401', None, 1.0, '0:01.00', 'S')]))
+        self.assertEqual(['300', '401'], sorted(topEntry.jobs))
+        self.assertEqual(0, folder.numCollisions)
+
+        with open(fileName, 'w') as f:
+            f.write("300\n")
+        self.assertRaises(Exception, loadTgids, fileName)
+
+
+if __name__ == '__main__':
+    unittest.main()
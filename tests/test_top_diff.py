@@ -0,0 +1,114 @@
+import copy
+import logging
+import sys
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.append('../')
+
+from job import Job
+from top_diff import Change, MeanStat, TopDiff, WindowSummary, getWindow, main, summarize
+from top_entry import TopEntry
+from top_parser import TopParser
+
+class TopDiffTestCase(unittest.TestCase):
+    """ Tests for TopDiff. """
+
+    TEST_FILE = 'data/top_30sec_20iter.log'
+
+    def getStat(self, values):
+        stat = MeanStat()
+        for value in values:
+            stat.update(value)
+        return stat
+
+    def testMeanStat(self):
+        """ Test that padding a series with zeros gives the same mean and variance as adding them """
+        values = [3.0, 5.5, 1.0, 7.25]
+        stat = self.getStat(values)
+        self.assertAlmostEqual(sum(values) / 4, stat.mean)
+        self.assertAlmostEqual(sum((value - stat.mean) ** 2 for value in values) / 3, stat.getVariance())
+
+        padded = stat.withZeros(7)
+        expected = self.getStat(values + [0, 0, 0])
+        self.assertEqual(7, padded.count)
+        self.assertAlmostEqual(expected.mean, padded.mean)
+        self.assertAlmostEqual(expected.getVariance(), padded.getVariance())
+        self.assertEqual(0, MeanStat().withZeros(3).getVariance())
+
+    def testWelchT(self):
+        """ Test Welch's t statistic against values worked by hand """
+        change = Change(Job.JOB_CPU, self.getStat([1, 2, 3, 4]), self.getStat([3, 5, 7, 9, 11]))
+        # Means 2.5 and 7, variances 5/3 and 10
+        self.assertAlmostEqual(4.5, change.difference)
+        self.assertAlmostEqual(4.5 / (5.0 / 12 + 2.0) ** 0.5, change.t)
+        self.assertAlmostEqual((5.0 / 12 + 2.0) ** 2 / ((5.0 / 12) ** 2 / 3 + 4.0 / 4), change.degreesOfFreedom)
+
+        change = Change(Job.JOB_CPU, self.getStat([1, 1]), self.getStat([2, 2]))
+        self.assertEqual(float('inf'), change.t)
+
+    def testDiff(self):
+        """ Test that a command whose cpu went up, and one that started, rank above unchanged commands """
+        entries = list(TopParser(self.TEST_FILE).iterEntries())
+        before = WindowSummary()
+        after = WindowSummary()
+        for index, topEntry in enumerate(entries):
+            before.update(topEntry)
+            topEntry = copy.deepcopy(topEntry)
+            for job in topEntry.jobs.values():
+                if job.info[Job.JOB_COMMAND] == 'Xorg':
+                    job.info[Job.JOB_CPU] += 20 + index % 3
+            topEntry.header[TopEntry.CPU_WAIT] += 5 + index % 2
+            if index % 2:
+                newJob = Job({Job.JOB_PID: '99999', Job.JOB_USER: 'newuser', Job.JOB_COMMAND: 'deployed',
+                              Job.JOB_CPU: 50.0, Job.JOB_RES: 1024 * 1024})
+                topEntry.jobs['99999'] = newJob
+            after.update(topEntry)
+
+        diff = TopDiff(before, after)
+        headerChanges = diff.getHeaderChanges()
+        self.assertEqual([TopEntry.CPU_WAIT], [change.field for change in headerChanges])
+        self.assertAlmostEqual(5.5, headerChanges[0].difference)
+
+        changes = diff.getGroupChanges(Job.JOB_COMMAND)
+        self.assertEqual([('Xorg', Job.JOB_CPU), ('deployed', Job.JOB_RES), ('deployed', Job.JOB_CPU)],
+                         [(change.key, change.field) for change in changes])
+        # Each Xorg job's cpu went up by 20.95 on average
+        numXorg = len([job for job in entries[0].jobs.values() if job.info[Job.JOB_COMMAND] == 'Xorg'])
+        self.assertAlmostEqual(20.95 * numXorg, changes[0].difference)
+        # The new command is counted as zero in the entries that it isn't in
+        self.assertAlmostEqual(25.0, changes[2].difference)
+        self.assertEqual(['newuser', 'newuser', 'root'],
+                         sorted(change.key for change in diff.getGroupChanges(Job.JOB_USER)))
+
+        self.assertRaises(Exception, TopDiff, before, WindowSummary())
+
+    def testWindows(self):
+        """ Test that the entries of one capture are summarized into the windows that they are in """
+        summaries = [WindowSummary(), WindowSummary(), WindowSummary()]
+        windows = [getWindow(('05:58', '06:03')), getWindow(('06:03', '06:10')), getWindow(None)]
+        summarize([self.TEST_FILE], windows, summaries)
+        self.assertEqual([9, 11, 20], [summary.numEntries for summary in summaries])
+        self.assertEqual(20, summaries[2].header[TopEntry.LOAD_1_MINUTE].count)
+
+    def testMainErrors(self):
+        """ Test that a window which crosses midnight, or has fewer than 2 entries, is reported as a usage error """
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertRaises(SystemExit, main, [self.TEST_FILE, '--before', '23:00', '01:00', '--after', '06:03', '06:10'])
+            self.assertTrue('Bad --before window: The time range ends before it starts' in sys.stderr.getvalue())
+            self.assertRaises(SystemExit, main, [self.TEST_FILE, '--before', '05:58', '06:03', '--after', '07:00', '08:00'])
+            self.assertTrue('The after window needs at least 2 entries, it has 0' in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+    unittest.main()
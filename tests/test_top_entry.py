@@ -5,6 +5,7 @@ import unittest
 sys.path.append('../')
 
 from top_entry import TopEntry
+from top_format import TopFormat
 
 class TopEntryTestCase(unittest.TestCase):
     """ Tests for TopEntry. """
@@ -37,6 +38,43 @@ class TopEntryTestCase(unittest.TestCase):
         self.checkParseUptime(line, '11:00:26', 9, 0, 0.01, 0.05, 0.05)
 
 
+    def testSpecializedFormat(self):
+        """ Tests that lines parsed with a shared TopFormat match the general parse, as the format changes """
+        topFormat = TopFormat()
+        lines = ['top - 10:53:52 up 59 min,  1 user,  load average: 0.21, 0.16, 0.06',
+                 'top - 10:54:52 up  1:00,  1 user,  load average: 0.21, 0.16, 0.06',
+                 'top - 10:55:52 up  1:01,  2 users,  load average: 0.21, 0.16, 0.06',
+                 'top - 10:56:52 up 1 day, 23:29,  0 users,  load average: 0.00, 0.01, 0.05',
+                 'top - 10:57:52 up 3 days, 5 min,  0 users,  load average: 0.00, 0.01, 0.05']
+        for line in lines:
+            entry = TopEntry(False, topFormat=topFormat)
+            entry.parseUptime(line)
+            general = TopEntry(False)
+            general.parseUptime(line)
+            self.assertEqual(general.header, entry.header)
+            self.assertTrue(topFormat.uptimeRegexes[0].match(line))
+        self.assertEqual(0, topFormat.numFallbacks)
+
+        memLines = ['KiB Mem:  16355800 total, 15649032 used,   706768 free,   294280 buffers',
+                    'KiB Mem:  16355800 total, 15649033 used,   706767 free,   294281 buffers',
+                    'MiB Mem :  15972.5 total,    690.2 free,  10873.8 used,   4408.5 buff/cache']
+        for line in memLines:
+            entry = TopEntry(topFormat=topFormat)
+            entry.parseMem(line)
+            general = TopEntry()
+            general.parseMem(line)
+            self.assertEqual(general.header, entry.header)
+        self.assertEqual(1, topFormat.numFallbacks)
+
+        for line in ('Tasks: 285 total,   1 running, 284 sleeping,   0 stopped,   0 zombie',
+                     'Threads: 1090 total,   1 running, 1082 sleeping,   0 stopped,   7 zombie'):
+            entry = TopEntry(topFormat=topFormat)
+            entry.parseTasks(line)
+            general = TopEntry()
+            general.parseTasks(line)
+            self.assertEqual(general.header, entry.header)
+        self.assertEqual(2, topFormat.numFallbacks)
+
     def checkParseUptime(self, line, timeOfDay, uptimeMinutes, numUsers, load1Min, load5Min, load15Min):
         """
         Parse uptime from the provided line, and verify that it parses
@@ -99,6 +137,24 @@ class TopEntryTestCase(unittest.TestCase):
         line = 'Cpu(s):  2.1%us,  1.0%sy,  0.0%ni, 85.4%id, 11.5%wa,  0.0%hi,  0.1%si,  0.0%st'
         self.checkParseCpu(line, 2.1, 1.0, 0.0, 85.4, 11.5, 0.0, 0.1, 0.0)
 
+        line = '%Cpu(s):  0.0 us,  0.0 sy,  0.0 ni,100.0 id,  0.0 wa,  0.0 hi,  0.0 si,  0.0 st'
+        self.checkParseCpu(line, 0.0, 0.0, 0.0, 100.0, 0.0, 0.0, 0.0, 0.0)
+
+    def testParsePerCpu(self):
+        """ Tests the parseCpu method with per-cpu lines, as output by top -1. """
+        entry = TopEntry()
+        entry.parseCpu('%Cpu0  : 12.5 us,  3.1 sy,  0.0 ni, 84.4 id,  0.0 wa,  0.0 hi,  0.0 si,  0.0 st')
+        entry.parseCpu('%Cpu1  :  1.0 us,  1.0 sy,  0.0 ni, 98.0 id,  0.0 wa,  0.0 hi,  0.0 si,  0.0 st '
+                       '%Cpu2  :  0.0 us,  0.0 sy,  0.0 ni,100.0 id,  0.0 wa,  0.0 hi,  0.0 si,  0.0 st')
+        self.assertEqual([0, 1, 2], sorted(entry.cpus.keys()))
+        self.assertEqual(12.5, entry.cpus[0][TopEntry.CPU_UNNICED])
+        self.assertEqual(98.0, entry.cpus[1][TopEntry.CPU_IDLE])
+        self.assertEqual(100.0, entry.cpus[2][TopEntry.CPU_IDLE])
+        self.assertFalse(TopEntry.CPU_IDLE in entry.header)
+
+        entry.summarizeCpus()
+        self.assertAlmostEqual((84.4 + 98.0 + 100.0) / 3, entry.header[TopEntry.CPU_IDLE])
+
     def checkParseCpu(self, line, unniced, system, niced, idle, wait, hi, si, st):
         """
         Parse cpu info from the provided line, and verify that it parses
@@ -132,6 +188,26 @@ class TopEntryTestCase(unittest.TestCase):
         line = 'Mem:   8170096k total,  7148836k used,  1021260k free,   337592k buffers'
         self.checkParseMem(line, 8170096, 7148836, 1021260, 337592)
 
+    def testParseMemBuffCache(self):
+        """ Tests the parseMem method with procps-ng 3.3.10+ output. """
+        entry = TopEntry()
+        entry.parseMem('KiB Mem : 16355800 total,   706768 free, 15649032 used,   294280 buff/cache')
+        self.assertEqual(16355800, entry.header[TopEntry.MEM_TOTAL])
+        self.assertEqual(15649032, entry.header[TopEntry.MEM_USED])
+        self.assertEqual(706768, entry.header[TopEntry.MEM_FREE])
+        self.assertEqual(294280, entry.header[TopEntry.MEM_BUFF_CACHE])
+
+        entry = TopEntry()
+        entry.parseMem('MiB Mem :  15972.5 total,    690.2 free,  10873.8 used,   4408.5 buff/cache')
+        self.assertEqual(int(round(15972.5 * 1024)), entry.header[TopEntry.MEM_TOTAL])
+        self.assertEqual(int(round(10873.8 * 1024)), entry.header[TopEntry.MEM_USED])
+        self.assertEqual(int(round(690.2 * 1024)), entry.header[TopEntry.MEM_FREE])
+        self.assertEqual(int(round(4408.5 * 1024)), entry.header[TopEntry.MEM_BUFF_CACHE])
+
+        entry = TopEntry()
+        entry.parseMem('GiB Mem :     15.6 total,      0.7 free,     10.6 used,      4.3 buff/cache')
+        self.assertEqual(int(round(15.6 * 1024 * 1024)), entry.header[TopEntry.MEM_TOTAL])
+
     def checkParseMem(self, line, total, used, free, buffers):
         """
         Parse mem info from the provided line, and verify that it parses
@@ -161,6 +237,15 @@ class TopEntryTestCase(unittest.TestCase):
         line = 'Swap:  3146748k total,   905060k used,  2241688k free,  1705700k cached'
         self.checkParseSwap(line, 3146748, 905060, 2241688, 1705700)
 
+    def testParseSwapAvailMem(self):
+        """ Tests the parseSwap method with procps-ng 3.3.10+ output. """
+        entry = TopEntry()
+        entry.parseSwap('MiB Swap:   4000.0 total,   3905.7 free,     94.3 used.   4712.1 avail Mem ')
+        self.assertEqual(4000 * 1024, entry.header[TopEntry.SWAP_TOTAL])
+        self.assertEqual(int(round(94.3 * 1024)), entry.header[TopEntry.SWAP_USED])
+        self.assertEqual(int(round(3905.7 * 1024)), entry.header[TopEntry.SWAP_FREE])
+        self.assertEqual(int(round(4712.1 * 1024)), entry.header[TopEntry.MEM_AVAILABLE])
+
     def checkParseSwap(self, line, total, used, free, buffers):
         """
         Parse swap info from the provided line, and verify that it parses
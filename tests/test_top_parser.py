@@ -7,6 +7,7 @@ sys.path.append('../')
 
 from top_parser import TopParser
 from top_entry import TopEntry
+from job import Job
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,44 @@ class TopParserTestCase(unittest.TestCase):
         self.checkTopParser('data/top_30sec_20iter.log', 20, self.getOrdinalDateFromUptimeDays(27))
         self.checkTopParser('data/topFiveEntriesWithDate.log', 5, datetime.date(datetime.date.today().year, 5, 26).toordinal())
         self.checkTopParser('data/topTwoEntriesWithDate.log', 2, datetime.date(datetime.date.today().year, 3, 29).toordinal())
+        self.checkTopParser('data/topProcpsNgPerCpu.log', 2, self.getOrdinalDateFromUptimeDays(3))
+
+    def testProcpsNgFormat(self):
+        """ Test parsing output from procps-ng top run with -1 and extra columns """
+        topParser = TopParser('data/topProcpsNgPerCpu.log')
+        topParser.parse()
+
+        topEntry = topParser.entries[0]
+        self.assertEqual(4, len(topEntry.cpus))
+        self.assertEqual(100.0, topEntry.cpus[1][TopEntry.CPU_IDLE])
+        self.assertAlmostEqual((84.4 + 100.0 + 87.5 + 94.1) / 4, topEntry.header[TopEntry.CPU_IDLE])
+        self.assertEqual(int(round(15972.5 * 1024)), topEntry.header[TopEntry.MEM_TOTAL])
+        self.assertEqual(int(round(4712.1 * 1024)), topEntry.header[TopEntry.MEM_AVAILABLE])
+        self.assertEqual(6, len(topEntry.jobs))
+
+        job = topEntry.jobs['2210']
+        self.assertEqual('1', job.info[Job.JOB_PPID])
+        self.assertEqual(1, job.info[Job.JOB_THREADS])
+        self.assertEqual(2, job.info[Job.JOB_LAST_CPU])
+        self.assertEqual('postgres: writer process', job.info[Job.JOB_COMMAND])
+        self.assertEqual(int(1.2 * 1024 * 1024), job.info[Job.JOB_RES])
+        self.assertEqual('systemd+', topEntry.jobs['1873'].info[Job.JOB_USER])
+
+        # Two cpus per line in the second entry
+        topEntry = topParser.entries[1]
+        self.assertEqual(4, len(topEntry.cpus))
+        self.assertEqual(96.0, topEntry.cpus[1][TopEntry.CPU_IDLE])
+        self.assertEqual(3, len(topEntry.jobs))
+
+    def testSpecializedFormat(self):
+        """ Test that parsing with regexes specialized to each file's format gives the same entries """
+        for testFile in ('data/topOneEntryWithDate.log', 'data/topOneEntryNoDate.log', 'data/top_30sec_20iter.log',
+                         'data/topFiveEntriesWithDate.log', 'data/topTwoEntriesWithDate.log',
+                         'data/topProcpsNgPerCpu.log'):
+            general = list(TopParser(testFile, specialize=False).iterEntries())
+            specialized = list(TopParser(testFile).iterEntries())
+            self.assertEqual([topEntry.header for topEntry in general], [topEntry.header for topEntry in specialized])
+            self.assertEqual([topEntry.cpus for topEntry in general], [topEntry.cpus for topEntry in specialized])
 
     def getOrdinalDateFromUptimeDays(self, uptimeDays):
         topEntry = TopEntry()
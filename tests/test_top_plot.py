@@ -0,0 +1,100 @@
+import datetime
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('../')
+
+from job import Job
+from top_entry import TopEntry
+from top_parser import TopParser
+from top_plot import Downsampler, TimelineChart, TopPlotter
+
+class TopPlotTestCase(unittest.TestCase):
+    """ Tests for the timeline charts. """
+
+    def makePoints(self, numPoints):
+        return [(x, math.sin(x / 50.0) * 10 + (100 if x == 1234 else 0)) for x in range(numPoints)]
+
+    def testLttb(self):
+        """ Test Largest-Triangle-Three-Buckets downsampling """
+        points = self.makePoints(10000)
+        sampled = Downsampler.downsample(points, 500, Downsampler.LTTB)
+        self.assertEqual(500, len(sampled))
+        self.assertEqual(points[0], sampled[0])
+        self.assertEqual(points[-1], sampled[-1])
+        self.assertEqual(sorted(sampled), sampled)
+        # The outlier forms the largest triangle in its bucket
+        self.assertTrue(points[1234] in sampled)
+
+        self.assertEqual(points[:10], Downsampler.downsample(points[:10], 500))
+
+    def testMinMax(self):
+        """ Test min/max bucket downsampling """
+        points = self.makePoints(10000)
+        sampled = Downsampler.downsample(points, 500, Downsampler.MIN_MAX)
+        self.assertTrue(len(sampled) <= 500)
+        self.assertEqual(sorted(sampled), sampled)
+        self.assertTrue(points[1234] in sampled)
+        self.assertEqual(min(y for x, y in points), min(y for x, y in sampled))
+
+    def testChart(self):
+        """ Test that a long series is drawn with about one point per pixel """
+        start = datetime.datetime(2015, 7, 20)
+        points = [(start + datetime.timedelta(seconds=second), second % 60) for second in range(50000)]
+        chart = TimelineChart('load <1>', width=400)
+        chart.addSeries('load', points)
+        self.assertEqual(400 - TimelineChart.MARGIN_LEFT - TimelineChart.MARGIN_RIGHT, len(chart.series[0][1]))
+
+        svg = chart.toSvg()
+        self.assertTrue(svg.startswith('<svg'))
+        self.assertTrue('load &lt;1&gt;' in svg)
+        self.assertEqual(1, svg.count('<polyline'))
+
+    def testPlotter(self):
+        """ Test charting a capture to HTML and SVG """
+        plotter = TopPlotter(numJobs=3)
+        plotter.addEntries(TopParser('data/top_30sec_20iter.log').iterEntries())
+        charts = plotter.getCharts()
+        self.assertEqual(len(TopPlotter.DEFAULT_HEADER_FIELDS) + 2, len(charts))
+        self.assertEqual(20, len(charts[0].series[0][1]))
+
+        # The busiest process by average cpu is charted first
+        self.assertTrue(charts[-2].series[0][0].startswith('32469 firefox'))
+        self.assertEqual(3, len(charts[-1].series))
+
+        directory = tempfile.mkdtemp()
+        try:
+            plotter.writeHtml(os.path.join(directory, 'top.html'), 'top <a&b>.log', charts)
+            with open(os.path.join(directory, 'top.html')) as f:
+                html = f.read()
+            self.assertEqual(len(charts), html.count('<svg'))
+            self.assertTrue('<title>top &lt;a&amp;b&gt;.log</title>' in html)
+
+            plotter.writeSvg(os.path.join(directory, 'top.svg'), charts[:2])
+            self.assertEqual(['top-1.svg', 'top.html', 'top.svg'], sorted(os.listdir(directory)))
+        finally:
+            shutil.rmtree(directory)
+
+    def testRankJobs(self):
+        """ Test that ranking first only keeps the points of the charted processes, and charts the same ones """
+        plotter = TopPlotter(numJobs=3)
+        plotter.addEntries(TopParser('data/top_30sec_20iter.log').iterEntries())
+        expected = plotter.getCharts()
+
+        plotter = TopPlotter(numJobs=3)
+        plotter.rankJobs(TopParser('data/top_30sec_20iter.log').iterEntries())
+        plotter.addEntries(TopParser('data/top_30sec_20iter.log').iterEntries())
+        self.assertEqual([3, 3], [len(series) for series in plotter.jobSeries.values()])
+        self.assertEqual([chart.series for chart in expected], [chart.series for chart in plotter.getCharts()])
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+
+    unittest.main()
@@ -0,0 +1,113 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('../')
+
+from job import Job
+from output_sink import OutputSink, JsonLinesSink
+from top_entry import TopEntry
+from top_parser import TopParser
+from top_query import TopQuery
+
+class TopQueryTestCase(unittest.TestCase):
+    """ Tests for TopQuery. """
+
+    TEST_FILE = 'data/top_30sec_20iter.log'
+
+    def setUp(self):
+        topParser = TopParser(self.TEST_FILE)
+        topParser.parse()
+        self.entries = topParser.entries
+
+    def testHeaderAggregate(self):
+        """ Test aggregating header fields, one row per entry """
+        rows = TopQuery().aggregate(TopQuery.MAX, TopEntry.LOAD_1_MINUTE).aggregate(TopQuery.COUNT).run(self.entries)
+        expected = max(topEntry.header[TopEntry.LOAD_1_MINUTE] for topEntry in self.entries)
+        self.assertEqual([(expected, 20)], rows)
+
+    def testGroupByHour(self):
+        """ Test grouping by the hour pseudo column """
+        query = TopQuery().groupBy(TopQuery.HOUR).aggregate(TopQuery.AVG, TopEntry.CPU_IDLE).orderBy(TopQuery.HOUR)
+        rows = query.run(self.entries)
+        self.assertEqual(['hour', 'avg(cpuIdle)'], query.getColumns())
+        self.assertEqual(sorted(set(topEntry.getDateTime().strftime('%Y-%m-%d %H') for topEntry in self.entries)),
+                         [row[0] for row in rows])
+
+    def testTopPids(self):
+        """ Test the top pids by average resident memory within a time of day range """
+        query = TopQuery().between('05:59', '06:05').groupBy(Job.JOB_PID).aggregate(TopQuery.AVG, Job.JOB_RES) \
+                          .orderBy('avg(memResident)', True).limit(3)
+        rows = query.run(self.entries)
+
+        totals = {}
+        for topEntry in self.entries:
+            if '05:59:00' <= topEntry.header[TopEntry.TIME_OF_DAY] < '06:05:00':
+                for pid, job in topEntry.jobs.items():
+                    totals.setdefault(pid, []).append(job.info[Job.JOB_RES])
+        averages = sorted(((float(sum(values)) / len(values), pid) for pid, values in totals.items()), reverse=True)
+        self.assertEqual([(pid, average) for average, pid in averages[:3]], rows)
+
+    def testFilters(self):
+        """ Test header and job filters with a selection """
+        query = TopQuery().where(Job.JOB_COMMAND, '~', '^chrome').where(Job.JOB_CPU, '>', '0') \
+                          .where(TopEntry.TASKS_TOTAL, '>=', '0').select(TopQuery.TIMESTAMP, Job.JOB_PID, Job.JOB_CPU)
+        rows = query.run(self.entries)
+        expected = sum(1 for topEntry in self.entries for job in topEntry.jobs.values()
+                       if job.info[Job.JOB_COMMAND].startswith('chrome') and job.info[Job.JOB_CPU] > 0)
+        self.assertEqual(expected, len(rows))
+        self.assertTrue(all(row[2] > 0 for row in rows))
+
+        self.assertEqual([], TopQuery().where(Job.JOB_PID, '=', 'none').select(Job.JOB_PID).run(self.entries))
+
+        # A regex is matched against a number as a string
+        rows = TopQuery().where(Job.JOB_RES, '~', '^1').select(Job.JOB_RES).run(self.entries)
+        self.assertTrue(rows)
+        self.assertEqual(sum(1 for topEntry in self.entries for job in topEntry.jobs.values()
+                             if str(job.info[Job.JOB_RES]).startswith('1')), len(rows))
+
+    def testBetween(self):
+        """ Test that a time range whose ends are of different forms, or which ends before it starts, is rejected """
+        query = TopQuery().between('9:00', '10:00')
+        self.assertEqual(('09:00:00', '10:00:00'), (query.startTime, query.endTime))
+        self.assertRaises(Exception, TopQuery().between, '23:00', '01:00')
+        self.assertRaises(Exception, TopQuery().between, '10:00', '10:00')
+        self.assertRaises(Exception, TopQuery().between, '05:00', '2015-07-20 06:00')
+        self.assertRaises(Exception, TopQuery().between, '2015-07-21 00:00', '2015-07-20 06:00')
+
+    def testPseudoColumnFilters(self):
+        """ Test filters on the hour, day and timestamp pseudo columns, which aren't in the entries' headers """
+        timestamps = [topEntry.getDateTime().strftime('%Y-%m-%d %H:%M:%S') for topEntry in self.entries]
+        hour = timestamps[0][:13]
+        query = TopQuery().where(TopQuery.HOUR, '=', hour).groupBy(TopQuery.HOUR).aggregate(TopQuery.COUNT)
+        self.assertEqual([(hour, sum(1 for timestamp in timestamps if timestamp.startswith(hour)))],
+                         query.run(self.entries))
+
+        rows = TopQuery().where(TopQuery.TIMESTAMP, '>=', timestamps[10]).where(TopQuery.DAY, '=', timestamps[0][:10]) \
+                         .aggregate(TopQuery.COUNT).run(self.entries)
+        self.assertEqual([(10,)], rows)
+
+    def testJsonLines(self):
+        """ Test that querying entries read back from JSON Lines gives the same result """
+        directory = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(directory, 'top.jsonl')
+            with OutputSink.create(fileName) as sink:
+                sink.writeAll(self.entries)
+
+            query = TopQuery().between('06:00', '06:03').groupBy(Job.JOB_USER).aggregate(TopQuery.SUM, Job.JOB_CPU) \
+                              .orderBy(Job.JOB_USER)
+            expected = query.run(self.entries)
+            self.assertEqual(expected, query.run(JsonLinesSink.readEntries(fileName, query.acceptHeader)))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    logLevel = logging.DEBUG
+    logging.basicConfig(level=logLevel)
+
+    unittest.main()
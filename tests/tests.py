@@ -7,6 +7,24 @@ sys.path.append('../')
 from test_top_entry import TopEntryTestCase
 from test_job import JobTestCase
 from test_top_parser import TopParserTestCase
+from test_job_layout import JobLayoutTestCase
+from test_output_sink import OutputSinkTestCase
+from test_top_query import TopQueryTestCase
+from test_spike_detector import SpikeDetectorTestCase
+from test_top_plot import TopPlotTestCase
+from test_instrumentation import InstrumentationTestCase
+from test_proc_sampler import ProcSamplerTestCase
+from test_symbol_table import SymbolTableTestCase
+from test_lazy_regex import LazyRegexTestCase
+from test_thread_fold import ThreadFoldTestCase
+from test_preview import PreviewTestCase
+from test_leak_detector import LeakDetectorTestCase
+from test_differential import DifferentialTestCase
+from test_segment_store import SegmentStoreTestCase
+from test_fleet import FleetTestCase
+from test_parse_service import ParseServiceTestCase
+from test_metrics_exporter import MetricsExporterTestCase
+from test_top_diff import TopDiffTestCase
 
 if __name__ == '__main__':
     logLevel = logging.DEBUG
@@ -14,7 +32,25 @@ if __name__ == '__main__':
 
     unittest.TestSuite([unittest.TestLoader().loadTestsFromTestCase(TopEntryTestCase),
                         unittest.TestLoader().loadTestsFromTestCase(JobTestCase),
-                        unittest.TestLoader().loadTestsFromTestCase(TopParserTestCase)
+                        unittest.TestLoader().loadTestsFromTestCase(TopParserTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(JobLayoutTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(OutputSinkTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(TopQueryTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(SpikeDetectorTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(TopPlotTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(InstrumentationTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(ProcSamplerTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(SymbolTableTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(LazyRegexTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(SegmentStoreTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(FleetTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(ParseServiceTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(ThreadFoldTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(PreviewTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(LeakDetectorTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(DifferentialTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(MetricsExporterTestCase),
+                        unittest.TestLoader().loadTestsFromTestCase(TopDiffTestCase)
                         ])
     unittest.main()
     
@@ -0,0 +1,177 @@
+"""
+Folds the per-thread rows of top -H output back into one row per process, so that a process with thousands of
+threads is stored and analysed as one job rather than thousands.
+"""
+
+import logging
+
+from job import Job
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class ThreadFolder(object):
+    """
+    Replaces the jobs of each TopEntry with one job per thread group. The thread group of a thread is found from,
+    in order:
+      - its TGID column, if top was configured to show it (or the entry was sampled with ProcSampler)
+      - a map of thread id to thread group id, e.g. a sidecar file written with the capture (see loadTgids)
+      - a heuristic: the threads of a process have the same user and command and report the same VIRT, RES and
+        SHR, since memory belongs to the process. Kernel threads have no memory, and are each left as their own
+        process.
+    The heuristic is only sound for top -H output, since separate processes would be folded together if
+    they ran the same command and happened to use exactly the same memory.
+
+    The threads of a known thread group are only folded if its leader, the thread whose id is the group's id,
+    is one of them. Otherwise they are left as they are, so every folded job has the pid of one of its own rows
+    and can't take the pid of another job.
+
+    A folded job has the pid and fields of its thread group leader (or of its lowest thread id, if the leader
+    isn't known), the sum of its threads' %CPU and TIME+, its memory counted once, and its number of threads.
+    It is running if any of its threads are.
+    """
+
+    # Status of a running thread
+    STATUS_RUNNING = 'R'
+
+    def __init__(self, tgids=None):
+        """
+        : tgids - dict - Thread id -> thread group id, both strings, for threads without a TGID column
+        """
+        self.tgids = tgids or {}
+        # The thread group ids, whose leaders belong to their own group even if the map doesn't list them
+        self.leaders = set(self.tgids.values())
+        # Counts of the rows read and written, for reporting
+        self.numThreads = 0
+        self.numProcesses = 0
+        self.numCollisions = 0
+
+    def __str__(self):
+        """Convert to string, for str()."""
+        return "ThreadFolder({0} threads folded into {1} processes)".format(self.numThreads, self.numProcesses)
+
+    def getGroupKey(self, info):
+        """
+        :return: the key of the thread group of the thread with info, and the group's pid if it is known, or None
+        """
+        pid = info[Job.JOB_PID]
+        tgid = info.get(Job.JOB_TGID) or self.tgids.get(pid) or (pid if pid in self.leaders else None)
+        if tgid is not None:
+            return ('tgid', tgid), tgid
+        if not info.get(Job.JOB_VIRT):
+            return ('pid', pid), pid
+        return (info.get(Job.JOB_USER), info.get(Job.JOB_COMMAND), info.get(Job.JOB_VIRT), info.get(Job.JOB_RES),
+                info.get(Job.JOB_SHR)), None
+
+    def fold(self, topEntry):
+        """
+        Replace the jobs of topEntry, which are threads, with the processes they belong to.
+        :return: topEntry
+        """
+        # key -> [group pid, list of thread infos]
+        groups = {}
+        for job in topEntry.jobs.values():
+            key, pid = self.getGroupKey(job.info)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [pid, [job.info]]
+            else:
+                group[1].append(job.info)
+
+        jobs = {}
+        for pid, infos in groups.values():
+            if pid is not None and not any(info[Job.JOB_PID] == pid for info in infos):
+                # The group's leader isn't one of its rows, so leave them as they are
+                processes = [self.foldInfos(None, [info]) for info in infos]
+            else:
+                processes = [self.foldInfos(pid, infos)]
+
+            for info in processes:
+                existing = jobs.get(info[Job.JOB_PID])
+                if existing is not None:
+                    self.numCollisions += 1
+                    logger.warning("Two processes were folded into pid {0}, keeping the one with more threads".format(
+                        info[Job.JOB_PID]))
+                    if existing.info[Job.JOB_THREADS] >= info[Job.JOB_THREADS]:
+                        continue
+                jobs[info[Job.JOB_PID]] = Job(info)
+
+        self.numThreads += len(topEntry.jobs)
+        self.numProcesses += len(jobs)
+        topEntry.jobs = jobs
+        return topEntry
+
+    def iterFold(self, entries):
+        """Fold each of entries as it is read, yielding it"""
+        for topEntry in entries:
+            yield self.fold(topEntry)
+
+    def foldInfos(self, pid, infos):
+        """
+        : pid - string - The pid of the thread group, or None to use its lowest thread id
+        : infos - list of dict - The info of each thread in the group
+        :return: dict - the info of the process
+        """
+        if len(infos) == 1:
+            info = infos[0]
+            if pid is not None:
+                info[Job.JOB_PID] = pid
+                info[Job.JOB_TGID] = pid
+            info.setdefault(Job.JOB_THREADS, 1)
+            return info
+
+        leader = None
+        if pid is not None:
+            leader = next((info for info in infos if info[Job.JOB_PID] == pid), None)
+        if leader is None:
+            leader = min(infos, key=lambda info: int(info[Job.JOB_PID]))
+
+        folded = dict(leader)
+        if pid is not None:
+            folded[Job.JOB_PID] = pid
+            folded[Job.JOB_TGID] = pid
+        folded[Job.JOB_THREADS] = len(infos)
+        folded[Job.JOB_CPU] = round(sum(info.get(Job.JOB_CPU) or 0.0 for info in infos), 1)
+        for field in (Job.JOB_VIRT, Job.JOB_RES, Job.JOB_SHR, Job.JOB_MEM):
+            if field in folded:
+                folded[field] = max(info.get(field) or 0 for info in infos)
+        if Job.JOB_TIME in folded:
+            folded[Job.JOB_TIME] = self.formatTime(sum(self.parseTime(info.get(Job.JOB_TIME)) for info in infos))
+        if any(info.get(Job.JOB_STATUS) == self.STATUS_RUNNING for info in infos):
+            folded[Job.JOB_STATUS] = self.STATUS_RUNNING
+        return folded
+
+    def parseTime(self, time):
+        """:return: int - the hundredths of a second in a TIME+ value, e.g. '479:33.92' or '2709:11'"""
+        if not time:
+            return 0
+        minutes, seconds = time.split(':')
+        return int(minutes) * 6000 + int(round(float(seconds) * 100))
+
+    def formatTime(self, hundredths):
+        """:return: string - hundredths of a second as a TIME+ value, e.g. '479:33.92'"""
+        return "{0}:{1:02d}.{2:02d}".format(hundredths // 6000, hundredths % 6000 // 100, hundredths % 100)
+
+
+def loadTgids(fileName):
+    """
+    Read a map of thread id to thread group id from fileName. Each line holds either a thread id and its thread
+    group id, as written by "ps -eLo lwp=,pid=", or the /proc path of a thread, as listed by
+    "ls -d /proc/[0-9]*/task/[0-9]*". Blank lines and lines starting with # are skipped.
+    :return: dict - thread id -> thread group id, both strings
+    """
+    tgids = {}
+    with open(fileName, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if len(fields) == 1:
+                # /proc/<tgid>/task/<tid>
+                fields = fields[0].rstrip('/').split('/')[-3::2][::-1]
+            if len(fields) != 2 or not fields[0].isdigit() or not fields[1].isdigit():
+                raise Exception("Could not parse thread group: '{0}' in {1}".format(line.rstrip(), fileName))
+            tgids[fields[0]] = fields[1]
+    logger.info("Loaded {0} thread groups from {1}".format(len(tgids), fileName))
+    return tgids
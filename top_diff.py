@@ -0,0 +1,334 @@
+#!/usr/bin/python
+"""
+This module compares two captures, or two time windows of captures, such as before and after a deploy. Each
+window is reduced as it is read to the mean and variance of its header fields, and of the total cpu and
+resident memory of each command and each user in each entry, so only those summaries are held, however large
+the captures are. The summaries of the two windows are then joined on their commands and users, and the
+changes are ranked by Welch's t statistic, so a large change in a noisy value ranks below a steady shift.
+
+The entries of a window are treated as independent samples, which they are not quite, since top's values change
+slowly between entries. The t statistics are best used to rank the changes rather than as exact tests.
+"""
+
+import argparse
+import logging
+import math
+import sys
+
+from job import Job
+from top_entry import TopEntry
+from top_query import TopQuery, getEntries
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class MeanStat(object):
+    """
+    The running mean and variance of a series of values, updated with Welford's algorithm.
+    """
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, value):
+        """Add value to the series"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def withZeros(self, count):
+        """
+        :return: MeanStat - this series padded with zeros to count values, for a command or user that was only
+                            in some of the entries of a window. The zeros are merged in as a second series, as in
+                            Chan's parallel algorithm, rather than being added one at a time.
+        """
+        stat = MeanStat()
+        stat.count = max(count, self.count)
+        numZeros = stat.count - self.count
+        if stat.count:
+            stat.mean = self.mean * self.count / stat.count
+            stat.m2 = self.m2 + self.mean * self.mean * self.count * numZeros / stat.count
+        return stat
+
+    def getVariance(self):
+        """:return: float - the sample variance, or 0 if there are fewer than two values"""
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+
+class WindowSummary(object):
+    """
+    The mean and variance of the header fields of the entries in a window, and of the per-entry totals of the job
+    fields of each command and each user. Call update with each TopEntry of the window.
+    """
+
+    # Header fields that are compared, by default
+    HEADER_FIELDS = (TopEntry.LOAD_1_MINUTE, TopEntry.LOAD_5_MINUTES, TopEntry.LOAD_15_MINUTES,
+                     TopEntry.TASKS_TOTAL, TopEntry.TASKS_RUNNING) + TopEntry.CPU_FIELDS + \
+                    (TopEntry.MEM_USED, TopEntry.MEM_FREE, TopEntry.MEM_AVAILABLE, TopEntry.SWAP_USED)
+
+    # The job fields that are totalled for each group, and the fields jobs are grouped by
+    JOB_FIELDS = (Job.JOB_CPU, Job.JOB_RES)
+    GROUPS = (Job.JOB_COMMAND, Job.JOB_USER)
+
+    def __init__(self, headerFields=HEADER_FIELDS, jobFields=JOB_FIELDS, groups=GROUPS):
+        """
+        : headerFields - list of string - The TopEntry fields to summarize
+        : jobFields - list of string - The numeric Job fields to total for each group
+        : groups - list of string - The Job fields to group jobs by
+        """
+        self.headerFields = headerFields
+        self.jobFields = jobFields
+        self.numEntries = 0
+        self.header = dict((field, MeanStat()) for field in headerFields)
+        # group -> group value -> a MeanStat for each job field
+        self.groups = dict((group, {}) for group in groups)
+
+    def update(self, topEntry):
+        """Add an entry to the summary"""
+        self.numEntries += 1
+        header = topEntry.header
+        for field, stat in self.header.items():
+            value = header.get(field)
+            if value is not None:
+                stat.update(value)
+
+        jobFields = self.jobFields
+        infos = [job.info for job in topEntry.jobs.values()]
+        for group, stats in self.groups.items():
+            totals = {}
+            for info in infos:
+                key = info.get(group)
+                values = [info.get(field, 0) for field in jobFields]
+                total = totals.get(key)
+                if total is None:
+                    totals[key] = values
+                else:
+                    totals[key] = [a + b for a, b in zip(total, values)]
+
+            for key, values in totals.items():
+                keyStats = stats.get(key)
+                if keyStats is None:
+                    keyStats = stats[key] = [MeanStat() for field in jobFields]
+                for stat, value in zip(keyStats, values):
+                    stat.update(value)
+
+
+class Change(object):
+    """
+    The change in the mean of one field between two windows, for the host or for one command or user.
+    """
+
+    def __init__(self, field, before, after, group=None, key=None):
+        """
+        : field - string - The TopEntry or Job field
+        : before - MeanStat - The field's values in the first window
+        : after - MeanStat - The field's values in the second window
+        : group - string - The Job field that key is a value of, or None for a header field
+        : key - string - The command or user, or None for a header field
+        """
+        self.field = field
+        self.group = group
+        self.key = key
+        self.before = before.mean
+        self.after = after.mean
+        self.difference = after.mean - before.mean
+        self.t, self.degreesOfFreedom = self.getWelchT(before, after)
+
+    def __str__(self):
+        """Convert to string, for str()."""
+        subject = "{0} {1} {2}".format(self.group, self.key, self.field) if self.group else "host {0}".format(self.field)
+        return "{0} {1:.2f} -> {2:.2f} ({3:+.2f}, t {4:+.1f}, {5:.0f} df)".format(
+            subject, self.before, self.after, self.difference, self.t, self.degreesOfFreedom)
+
+    def getWelchT(self, before, after):
+        """
+        :return: (float, float) - Welch's t statistic for the difference in means, and its Welch-Satterthwaite
+                                  degrees of freedom. t is infinite if the means differ but neither varies.
+        """
+        beforeError = before.getVariance() / before.count
+        afterError = after.getVariance() / after.count
+        standardError = math.sqrt(beforeError + afterError)
+        if standardError == 0:
+            if self.difference == 0:
+                return 0.0, float(before.count + after.count - 2)
+            return math.copysign(float('inf'), self.difference), float(before.count + after.count - 2)
+
+        degreesOfFreedom = (beforeError + afterError) ** 2 / (
+            beforeError ** 2 / max(before.count - 1, 1) + afterError ** 2 / max(after.count - 1, 1))
+        return self.difference / standardError, degreesOfFreedom
+
+
+class TopDiff(object):
+    """
+    Compares the summaries of two windows. Commands and users are joined on their names, and one that is only
+    in some entries of a window counts as zero in the others.
+    """
+
+    MIN_T = 3.0
+
+    # The smallest change in the mean of a field that is reported, so that tiny but steady changes aren't
+    MIN_CHANGES = {Job.JOB_CPU: 0.5, Job.JOB_RES: 1024}
+
+    def __init__(self, before, after, minT=MIN_T, minChanges=MIN_CHANGES):
+        """
+        : before - WindowSummary - The first window
+        : after - WindowSummary - The second window
+        : minT - float - The smallest absolute t statistic that is reported
+        : minChanges - dict - Field -> the smallest absolute change in its mean that is reported
+        :throws: Exception if a window has fewer than two entries, since its variance is unknown
+        """
+        for name, summary in (('before', before), ('after', after)):
+            if summary.numEntries < 2:
+                raise Exception("The {0} window needs at least 2 entries, it has {1}".format(name,
+                                                                                           summary.numEntries))
+        self.before = before
+        self.after = after
+        self.minT = minT
+        self.minChanges = minChanges
+
+    def getHeaderChanges(self):
+        """:return: list of Change - the significant changes in the header fields, most significant first"""
+        changes = []
+        for field in self.before.headerFields:
+            before = self.before.header.get(field)
+            after = self.after.header.get(field)
+            if before is not None and after is not None and before.count >= 2 and after.count >= 2:
+                changes.append(Change(field, before, after))
+        return self.rank(changes)
+
+    def getGroupChanges(self, group):
+        """
+        :return: list of Change - the significant changes in the job fields of each value of group, e.g. of each
+                                  command, most significant first
+        """
+        beforeStats = self.before.groups[group]
+        afterStats = self.after.groups[group]
+        missing = [MeanStat() for field in self.before.jobFields]
+        changes = []
+        for key in set(beforeStats) | set(afterStats):
+            for field, before, after in zip(self.before.jobFields, beforeStats.get(key, missing),
+                                            afterStats.get(key, missing)):
+                changes.append(Change(field, before.withZeros(self.before.numEntries),
+                                      after.withZeros(self.after.numEntries), group, key))
+        return self.rank(changes)
+
+    def rank(self, changes):
+        """:return: list of Change - the changes that pass the thresholds, by descending absolute t"""
+        changes = [change for change in changes if abs(change.t) >= self.minT and
+                   abs(change.difference) >= self.minChanges.get(change.field, 0)]
+        changes.sort(key=lambda change: (-abs(change.t), -abs(change.difference)))
+        return changes
+
+
+def getWindow(between):
+    """
+    :return: TopQuery - a query whose time range is between, or which accepts every entry if between is None
+    """
+    query = TopQuery()
+    if between:
+        query.between(*between)
+    return query
+
+
+def inWindow(query, topEntry):
+    """:return: True if topEntry is in the time range of query, see TopQuery.between"""
+    if query.startTime is None:
+        return True
+    if query.timeOfDayRange:
+        return query.acceptHeader(topEntry.header)
+    return query.inRange(topEntry.getDateTime().strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def summarize(fileNames, windows, summaries):
+    """
+    Stream the entries of fileNames into the summaries of the windows that they are in.
+    : windows - list of TopQuery - The time range of each summary
+    : summaries - list of WindowSummary - The summaries, one per window
+    """
+    for fileName in fileNames:
+        for topEntry in getEntries(fileName, TopQuery()):
+            for query, summary in zip(windows, summaries):
+                if inWindow(query, topEntry):
+                    summary.update(topEntry)
+
+
+def main(argv):
+    examples = """
+    Examples:
+    # Compare the capture from before a deploy with the capture from after it:
+        %prog diff before.log after.log
+
+    # Compare two windows of one capture, as HH:MM[:SS] or 'YYYY-MM-DD HH:MM[:SS]':
+        %prog diff topWithDate.log --before 09:00 10:00 --after 10:30 11:30
+
+    # Only report changes with a t statistic of at least 5, at most 10 of each kind:
+        %prog diff before.log after.log --min-t 5 --limit 10
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to compare two captures of output from the top command""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("fileNames", type=str, nargs='+',
+                        help="One capture to compare two windows of, or the before and after captures. Either "
+                             "can be top output or JSON Lines")
+    parser.add_argument("--before", nargs=2, metavar=('START', 'END'), default=None,
+                        help="Only include entries of the first window from START until END")
+    parser.add_argument("--after", nargs=2, metavar=('START', 'END'), default=None,
+                        help="Only include entries of the second window from START until END")
+    parser.add_argument("--min-t", type=float, default=TopDiff.MIN_T,
+                        help="Smallest absolute Welch's t statistic of a change to report")
+    parser.add_argument("--min-cpu", type=float, default=TopDiff.MIN_CHANGES[Job.JOB_CPU],
+                        help="Smallest change in the cpu percentage of a command or user to report")
+    parser.add_argument("--min-res", type=float, default=TopDiff.MIN_CHANGES[Job.JOB_RES],
+                        help="Smallest change in KiB of the resident memory of a command or user to report")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of changes of each kind to report")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    options = parser.parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.INFO
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    if len(options.fileNames) > 2:
+        parser.error("Give one capture to compare two windows of, or two captures")
+    if len(options.fileNames) == 1 and not (options.before and options.after):
+        parser.error("Give --before and --after to compare two windows of one capture")
+
+    windows = []
+    for name, between in (('--before', options.before), ('--after', options.after)):
+        try:
+            windows.append(getWindow(between))
+        except Exception as e:
+            parser.error("Bad {0} window: {1}".format(name, e))
+    summaries = [WindowSummary(), WindowSummary()]
+    if len(options.fileNames) == 1:
+        summarize(options.fileNames, windows, summaries)
+    else:
+        for fileName, window, summary in zip(options.fileNames, windows, summaries):
+            summarize([fileName], [window], [summary])
+    logger.info("Compared {0} entries with {1} entries".format(summaries[0].numEntries, summaries[1].numEntries))
+
+    minChanges = {Job.JOB_CPU: options.min_cpu, Job.JOB_RES: options.min_res}
+    try:
+        diff = TopDiff(summaries[0], summaries[1], options.min_t, minChanges)
+    except Exception as e:
+        parser.error(str(e))
+    for changes in [diff.getHeaderChanges()] + [diff.getGroupChanges(group) for group in WindowSummary.GROUPS]:
+        for change in changes[:options.limit]:
+            sys.stdout.write("{0}\n".format(change))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,8 +1,12 @@
 import datetime
+import itertools
 import logging
 import re
 
 from job import Job
+from job_layout import JobLayout
+from lazy_regex import LazyRegex
+from top_format import TopFormat
 
 __author__ = 'Dave Pinkney'
 
@@ -19,7 +23,7 @@ class TopEntry(object):
 
     # Date / Timestamp header - Not part of standard top output. Will be manufactured if needed using uptime.
     DATE = 'date'                                  # int:  the datetime.date ordinal value (days since 70)
-    RE_DATE = re.compile('^(\d+)/(\d+)')
+    RE_DATE = LazyRegex(r'^(\d+)/(\d+)')
 
     # Uptime
     TIME_OF_DAY = 'timeOfDay'                      # string
@@ -30,22 +34,32 @@ class TopEntry(object):
     LOAD_15_MINUTES = '15 minute load'             # float
     # Uptime has variable time unit output, might be days, minutes, or just hours:min
 
-    RE_UPTIME = re.compile("""^top\s+-
-                              \s+(\d+):(\d+):(\d+)                                 # time of day
-                              \s+up
-                              \s+(\d+\s+days?,\s+\d+:\d+                           # uptime
-                                  |\d+\s+days?,\s+\d+\s+mins?                      # uptime
-                                  |\d+\s+mins?                                     # uptime
-                                  |\d+:\d+),                                       # uptime
-                              \s+(\d+)\s+users?,                                   # num users
-                              \s+load\s+average:
-                              \s+([\d.]+),\s+([\d.]+),\s+([\d.]+)                  # load
-                              """, re.VERBOSE)
-
-    RE_UPTIME_DAYS = re.compile('(\d+)\s+days?,\s+(\d+):(\d+)')
-    RE_UPTIME_DAYS_MIN = re.compile('(\d+)\s+days?,\s+(\d+)\s+mins?')
-    RE_UPTIME_HOUR = re.compile('(\d+):(\d+)')
-    RE_UPTIME_MIN = re.compile('(\d+)\s+mins?')
+    RE_UPTIME = LazyRegex(r"""^top\s+-
+                             \s+(\d+):(\d+):(\d+)                                 # time of day
+                             \s+up
+                             \s+(\d+\s+days?,\s+\d+:\d+                           # uptime
+                                 |\d+\s+days?,\s+\d+\s+mins?                      # uptime
+                                 |\d+\s+mins?                                     # uptime
+                                 |\d+:\d+),                                       # uptime
+                             \s+(\d+)\s+users?,                                   # num users
+                             \s+load\s+average:
+                             \s+([\d.]+),\s+([\d.]+),\s+([\d.]+)                  # load
+                             """, re.VERBOSE)
+
+    RE_UPTIME_DAYS = LazyRegex(r'(\d+)\s+days?,\s+(\d+):(\d+)')
+    RE_UPTIME_DAYS_MIN = LazyRegex(r'(\d+)\s+days?,\s+(\d+)\s+mins?')
+    RE_UPTIME_HOUR = LazyRegex(r'(\d+):(\d+)')
+    RE_UPTIME_MIN = LazyRegex(r'(\d+)\s+mins?')
+
+    # Whole line uptime regexes, one per variant of the uptime, used once the file's format is known (see
+    # TopFormat). They capture the time of day, the days, hours and minutes of uptime (empty if not shown),
+    # the number of users and the load averages, so the uptime doesn't need to be parsed again. TopFormat
+    # compiles each the first time it is tried, since a file usually only shows one or two of them.
+    RE_UPTIME_VARIANT = r'^top\s+-\s+(\d+:\d+:\d+)\s+up\s+{0},\s+(\d+)\s+users?,\s+load\s+average:\s+([\d.]+),\s+([\d.]+),\s+([\d.]+)'
+    RE_UPTIME_VARIANTS = (RE_UPTIME_VARIANT.format(r'(\d+)\s+days?,\s+(\d+):(\d+)'),
+                          RE_UPTIME_VARIANT.format(r'()(\d+):(\d+)'),
+                          RE_UPTIME_VARIANT.format(r'(\d+)\s+days?,\s+()(\d+)\s+mins?'),
+                          RE_UPTIME_VARIANT.format(r'()()(\d+)\s+mins?'))
 
     # Tasks
     TASKS_TOTAL = 'tasksTotal'                     # int
@@ -53,7 +67,8 @@ class TopEntry(object):
     TASKS_SLEEPING = 'tasksSleeping'               # int
     TASKS_STOPPED = 'tasksStopped'                 # int
     TASKS_ZOMBIE = 'tasksZombie'                   # int
-    RE_TASKS = re.compile('^(?:Tasks|Threads):\s+(\d+) total,\s+(\d+)\s+running,\s+(\d+)\s+sleeping,\s+(\d+)\s+stopped,\s+(\d+)\s+zombie')
+    RE_TASKS_VALUES = r':\s+(\d+) total,\s+(\d+)\s+running,\s+(\d+)\s+sleeping,\s+(\d+)\s+stopped,\s+(\d+)\s+zombie'
+    RE_TASKS = LazyRegex('^(Tasks|Threads)' + RE_TASKS_VALUES)
 
     # CPU
     CPU_UNNICED = 'cpuUnNiced'                     # float
@@ -64,38 +79,102 @@ class TopEntry(object):
     CPU_HI = 'cpuHardwareInt'                      # float
     CPU_SI = 'cpuSoftwareInt'                      # float
     CPU_ST = 'cpuStolen'                           # float
-    RE_CPU = re.compile('^%?Cpu\(s\):\s+([\d.]+)[% ]us,\s+([\d.]+)[% ]sy,\s+([\d.]+)[% ]ni,\s+([\d.]+)[% ]id,\s+([\d.]+)[% ]wa,\s+([\d.]+)[% ]hi,\s+([\d.]+)[% ]si,\s+([\d.]+)[% ]st')
-
-    # Memory
-    MEM_TOTAL = 'memTotal'
-    MEM_USED = 'memUsed'
-    MEM_FREE = 'memFree'
-    MEM_BUFFERS = 'memBuffers'
-    RE_MEM = re.compile('^(?:KiB )?Mem:\s+(\d+)k? total,\s+(\d+)k? used,\s+(\d+)k? free,\s+(\d+)k? buffers?')
+    CPU_FIELDS = (CPU_UNNICED, CPU_SYSTEM, CPU_NICED, CPU_IDLE, CPU_WAIT, CPU_HI, CPU_SI, CPU_ST)
+    # Either the '%Cpu(s)' summary, or one or more per-cpu '%Cpu0' entries when top is run with -1
+    RE_CPU = LazyRegex(r'%?Cpu(\(s\)|\d+)\s*:\s*([\d.]+)[% ]us,\s*([\d.]+)[% ]sy,\s*([\d.]+)[% ]ni,\s*([\d.]+)[% ]id,\s*([\d.]+)[% ]wa,\s*([\d.]+)[% ]hi,\s*([\d.]+)[% ]si,\s*([\d.]+)[% ]st')
+    RE_CPU_LINE = LazyRegex('^%?Cpu')
+
+    # Memory - all values are stored in KiB, whatever unit top displayed them in.
+    # Older versions of top report buffers, procps-ng 3.3.10+ reports buff/cache (and avail Mem on the swap line)
+    MEM_TOTAL = 'memTotal'                         # int
+    MEM_USED = 'memUsed'                           # int
+    MEM_FREE = 'memFree'                           # int
+    MEM_BUFFERS = 'memBuffers'                     # int
+    MEM_BUFF_CACHE = 'memBuffCache'                # int
+    MEM_AVAILABLE = 'memAvailable'                 # int
+    RE_MEM = LazyRegex(r'^(?:([KMGTPE])iB\s+)?Mem\s*:(.*)')
+    MEM_LABELS = {'total': MEM_TOTAL, 'used': MEM_USED, 'free': MEM_FREE, 'buffers': MEM_BUFFERS,
+                  'buffer': MEM_BUFFERS, 'buff/cache': MEM_BUFF_CACHE}
 
     # Swap
-    SWAP_TOTAL = 'swapTotal'
-    SWAP_USED = 'swapUsed'
-    SWAP_FREE = 'swapFree'
-    SWAP_CACHED = 'swapCached'
-    RE_SWAP = re.compile('^(?:KiB )?Swap:\s+(\d+)k? total,\s+(\d+)k? used,\s+(\d+)k? free,\s+(\d+)k? cached')
-
-    # Jobs
-    RE_JOB_HEADER = re.compile('^\s+PID\s+USER\s+PR\s+NI\s+VIRT\s+RES\s+SHR\s+S\s+%CPU\s+%MEM\s+TIME\+\s+COMMAND')
-
-    def __init__(self, hasDate=None):
+    SWAP_TOTAL = 'swapTotal'                       # int
+    SWAP_USED = 'swapUsed'                         # int
+    SWAP_FREE = 'swapFree'                         # int
+    SWAP_CACHED = 'swapCached'                     # int
+    RE_SWAP = LazyRegex(r'^(?:([KMGTPE])iB\s+)?Swap\s*:(.*)')
+    SWAP_LABELS = {'total': SWAP_TOTAL, 'used': SWAP_USED, 'free': SWAP_FREE, 'cached': SWAP_CACHED,
+                   'avail Mem': MEM_AVAILABLE}
+
+    # A value in the Mem or Swap line, e.g. '16355800 total', '8170096k total' or '15896.4 total'
+    RE_MEM_VALUE = LazyRegex(r'([\d.]+)k?\s+(total|used|free|buffers?|buff/cache|cached|avail Mem)')
+    # Multipliers to convert the unit prefix of the Mem and Swap lines to KiB
+    MEM_UNITS = {None: 1, 'K': 1, 'M': 1024, 'G': 1024 ** 2, 'T': 1024 ** 3, 'P': 1024 ** 4, 'E': 1024 ** 5}
+
+    # Jobs - the header with top's default columns. Other column layouts are handled by JobLayout.
+    RE_JOB_HEADER = LazyRegex(r'^\s+PID\s+USER\s+PR\s+NI\s+VIRT\s+RES\s+SHR\s+S\s+%CPU\s+%MEM\s+TIME\+\s+COMMAND')
+
+    # The line that ends the jobs section
+    BLANK_LINE = '\n'
+
+    # All of the header fields, in display order
+    HEADER_FIELDS = (DATE, TIME_OF_DAY, UPTIME_MINUTES, NUM_USERS, LOAD_1_MINUTE, LOAD_5_MINUTES, LOAD_15_MINUTES,
+                     TASKS_TOTAL, TASKS_RUNNING, TASKS_SLEEPING, TASKS_STOPPED, TASKS_ZOMBIE) + CPU_FIELDS + \
+                    (MEM_TOTAL, MEM_USED, MEM_FREE, MEM_BUFFERS, MEM_BUFF_CACHE, MEM_AVAILABLE,
+                     SWAP_TOTAL, SWAP_USED, SWAP_FREE, SWAP_CACHED)
+
+    def __init__(self, hasDate=None, layout=None, symbols=None, topFormat=None, bulk=True):
         """
         : hasDate - boolean - True if we should parse a date before parsing the topEntry, false if we shouldn't, 
                               None if not known.
+        : layout - JobLayout - The layout of the jobs section in the previous entry, or None if not known.
+        : symbols - SymbolTable - The table to intern the jobs' strings in, or None to not intern them.
+        : topFormat - TopFormat - The format of the file's header lines, shared by its entries, or None to
+                                  parse them with the general regexes.
+        : bulk - boolean - True to parse the job lines together (see JobLayout.parseLines), False to match each
+                           with the layout's regex
         """
         self.header = {}
         self.jobs = {}
+        self.cpus = {}
         self.hasDate = hasDate
+        self.layout = layout
+        self.symbols = symbols
+        self.format = topFormat
+        self.bulk = bulk
 
     def __str__(self):
         """Convert to string, for str()."""
         return "Header = {0}, {1} Jobs ".format(self.header, len(self.jobs))
 
+    def __getstate__(self):
+        """
+        The layout, symbol table and format are only used while parsing, so they aren't pickled with each entry.
+        Jobs are pickled as their info dicts, which is several times quicker than pickling the Job objects.
+        """
+        state = dict(self.__dict__)
+        state['layout'] = None
+        state['symbols'] = None
+        state['format'] = None
+        state['jobs'] = [job.info for job in self.jobs.values()]
+        return state
+
+    def __setstate__(self, state):
+        jobInfos = state.pop('jobs')
+        self.__dict__.update(state)
+        self.jobs = {}
+        for info in jobInfos:
+            job = Job()
+            job.info = info
+            self.jobs[info[Job.JOB_PID]] = job
+
+    def getDateTime(self):
+        """
+        :return: datetime.datetime - The time this entry was captured, from its DATE and TIME_OF_DAY
+        """
+        hours, minutes, seconds = self.header[self.TIME_OF_DAY].split(':')
+        return datetime.datetime.combine(datetime.date.fromordinal(self.header[self.DATE]),
+                                         datetime.time(int(hours), int(minutes), int(seconds)))
+
     def parse(self, firstLine, f):
         """
         Reads a top entry from f and initializes this object from it.
@@ -107,7 +186,7 @@ class TopEntry(object):
         self.parseHeader(firstLine, f)
         self.eatBlankLine(f)
         self.parseBody(f)
-        logger.debug("Parsed entry: {0}".format(self))
+        logger.debug("Parsed entry: %s", self)
         return self
 
     def parseHeader(self, firstLine, f):
@@ -130,6 +209,15 @@ class TopEntry(object):
         KiB Mem:  16355800 total, 15649032 used,   706768 free,   294280 buffers
         KiB Swap:  4095996 total,    96600 used,  3999396 free, 10201704 cached
 
+        or, from procps-ng 3.3.10+ run with -1:
+
+        top - 05:58:39 up 27 days, 16:32,  1 user,  load average: 0.01, 0.04, 0.05
+        Tasks: 285 total,   1 running, 284 sleeping,   0 stopped,   0 zombie
+        %Cpu0  :  2.4 us,  0.5 sy,  0.0 ni, 96.8 id,  0.1 wa,  0.1 hi,  0.0 si,  0.0 st
+        %Cpu1  :  1.0 us,  0.0 sy,  0.0 ni, 99.0 id,  0.0 wa,  0.0 hi,  0.0 si,  0.0 st
+        MiB Mem :  15972.5 total,    690.2 free,  10873.8 used,   4408.5 buff/cache
+        MiB Swap:   4000.0 total,   3905.7 free,     94.3 used.   4712.1 avail Mem
+
         :return: a TopEntry instance
         :throws: Exception if at EOF
         """
@@ -139,8 +227,15 @@ class TopEntry(object):
 
         self.parseUptime(firstLine)
         self.parseTasks(self.readline(f))
-        self.parseCpu(self.readline(f))
-        self.parseMem(self.readline(f))
+
+        line = self.readline(f)
+        while self.RE_CPU_LINE.match(line):
+            self.parseCpu(line)
+            line = self.readline(f)
+        if self.CPU_IDLE not in self.header and self.cpus:
+            self.summarizeCpus()
+
+        self.parseMem(line)
         self.parseSwap(self.readline(f))
 
 
@@ -180,10 +275,19 @@ class TopEntry(object):
         top - 10:53:52 up 2 min,  1 user,  load average: 0.21, 0.16, 0.06
         top - 11:51:42 up  1:00,  1 user,  load average: 0.00, 0.01, 0.05
         """
-        logger.debug("Parsing uptime from '{0}'".format(line))
+        topFormat = self.format
+        if topFormat is not None and topFormat.specialize:
+            if topFormat.uptimeRegexes is None:
+                topFormat.uptimeRegexes = list(self.RE_UPTIME_VARIANTS)
+            match = topFormat.matchUptime(line)
+            if match:
+                self.setUptime(match.groups())
+                return
+
+        logger.debug("Parsing uptime from '%s'", line)
         match = self.RE_UPTIME.match(line)
         groups = match.groups()
-        logger.debug("Got groups: {0}".format(groups))
+        logger.debug("Got groups: %s", groups)
 
         # Can't recall why I broke this out into components - to plot time as #seconds?
         hours = groups[0]
@@ -202,6 +306,22 @@ class TopEntry(object):
             self.header[self.DATE] = self.getDateFromUptimeMinutes(self.header[self.UPTIME_MINUTES])
 
 
+    def setUptime(self, groups):
+        """
+        Store the uptime line's values, as captured by one of RE_UPTIME_VARIANTS
+        """
+        header = self.header
+        header[self.TIME_OF_DAY] = groups[0]
+        days, hours, minutes = groups[1:4]
+        header[self.UPTIME_MINUTES] = (int(days or 0) * 24 + int(hours or 0)) * 60 + int(minutes)
+        header[self.NUM_USERS] = int(groups[4])
+        header[self.LOAD_1_MINUTE] = float(groups[5])
+        header[self.LOAD_5_MINUTES] = float(groups[6])
+        header[self.LOAD_15_MINUTES] = float(groups[7])
+
+        if not self.hasDate:
+            header[self.DATE] = self.getDateFromUptimeMinutes(header[self.UPTIME_MINUTES])
+
     def parseUptimeMinutes(self, line):
         """
         Parse the uptime minutes and return it.
@@ -214,28 +334,28 @@ class TopEntry(object):
         match = self.RE_UPTIME_DAYS.match(line)
         if match:
             groups = match.groups()
-            logger.debug("Parsed groups: {0}".format(groups))
+            logger.debug("Parsed groups: %s", groups)
             minutes = int(groups[0]) * 24 * 60 + int(groups[1]) * 60 + int(groups[2])
             return minutes
 
         match = self.RE_UPTIME_DAYS_MIN.match(line)
         if match:
             groups = match.groups()
-            logger.debug("Parsed groups: {0}".format(groups))
+            logger.debug("Parsed groups: %s", groups)
             minutes = int(groups[0]) * 24 * 60 + int(groups[1])
             return minutes
 
         match = self.RE_UPTIME_HOUR.match(line)
         if match:
             groups = match.groups()
-            logger.debug("Parsed groups: {0}".format(groups))
+            logger.debug("Parsed groups: %s", groups)
             minutes = int(groups[0]) * 60 + int(groups[1])
             return minutes
 
         match = self.RE_UPTIME_MIN.match(line)
         if match:
             groups = match.groups()
-            logger.debug("Parsed groups: {0}".format(groups))
+            logger.debug("Parsed groups: %s", groups)
             minutes = int(groups[0])
             return minutes
 
@@ -248,12 +368,30 @@ class TopEntry(object):
         Example input:
         Tasks: 285 total,   1 running, 284 sleeping,   0 stopped,   0 zombie
         """
-        logger.debug("Parsing tasks from {0}".format(line))
+        topFormat = self.format
+        if topFormat is not None and topFormat.specialize:
+            if topFormat.tasksRegex is not None:
+                match = topFormat.tasksRegex.match(line)
+                if match:
+                    self.setTasks(match.groups())
+                    return
+                topFormat.fallback('Tasks')
+
+        logger.debug("Parsing tasks from %s", line)
 
         match = self.RE_TASKS.match(line)
         groups = match.groups()
-        logger.debug("Got groups: {0}".format(groups))
+        logger.debug("Got groups: %s", groups)
+        self.setTasks(groups[1:])
+
+        if topFormat is not None and topFormat.specialize:
+            # Tasks for processes, or Threads when run with -H
+            topFormat.tasksRegex = re.compile('^' + groups[0] + self.RE_TASKS_VALUES)
 
+    def setTasks(self, groups):
+        """
+        Store the Tasks line's values, as captured by RE_TASKS
+        """
         self.header[self.TASKS_TOTAL] = int(groups[0])
         self.header[self.TASKS_RUNNING] = int(groups[1])
         self.header[self.TASKS_SLEEPING] = int(groups[2])
@@ -263,22 +401,39 @@ class TopEntry(object):
 
     def parseCpu(self, line):
         """
-        Parse the cpu information from line and store it in this object's state
+        Parse the cpu information from line and store it in this object's state.
+        The summary is stored in the header, per-cpu values are stored in self.cpus by cpu number.
         %Cpu(s):  2.4 us,  0.5 sy,  0.0 ni, 96.8 id,  0.1 wa,  0.1 hi,  0.0 si,  0.0 st
+          or
+        %Cpu0  :  2.4 us,  0.5 sy,  0.0 ni, 96.8 id,  0.1 wa,  0.1 hi,  0.0 si,  0.0 st
         """
-        logger.debug("Parsing Cpu from {0}".format(line))
+        logger.debug("Parsing Cpu from %s", line)
 
-        match = self.RE_CPU.match(line)
-        groups = match.groups()
-        logger.debug("Got groups: {0}".format(groups))
-        self.header[self.CPU_UNNICED] = float(groups[0])
-        self.header[self.CPU_SYSTEM] = float(groups[1])
-        self.header[self.CPU_NICED] = float(groups[2])
-        self.header[self.CPU_IDLE] = float(groups[3])
-        self.header[self.CPU_WAIT] = float(groups[4])
-        self.header[self.CPU_HI] = float(groups[5])
-        self.header[self.CPU_SI] = float(groups[6])
-        self.header[self.CPU_ST] = float(groups[7])
+        matched = False
+        for match in self.RE_CPU.finditer(line):
+            groups = match.groups()
+            logger.debug("Got groups: %s", groups)
+            matched = True
+
+            if groups[0] == '(s)':
+                values = self.header
+            else:
+                values = self.cpus.setdefault(int(groups[0]), {})
+
+            for field, value in zip(self.CPU_FIELDS, groups[1:]):
+                values[field] = float(value)
+
+        if not matched:
+            raise Exception("Could not parse cpu: {0}".format(line))
+
+    def summarizeCpus(self):
+        """
+        Set the cpu summary in the header to the average of the per-cpu values, for output from
+        top -1, which does not include the %Cpu(s) line.
+        """
+        numCpus = float(len(self.cpus))
+        for field in self.CPU_FIELDS:
+            self.header[field] = sum(cpu[field] for cpu in self.cpus.values()) / numCpus
 
     def parseMem(self, line):
         """
@@ -286,16 +441,11 @@ class TopEntry(object):
         KiB Mem:  16355800 total, 15649032 used,   706768 free,   294280 buffers
           or
         Mem:   8170096k total,  7148836k used,  1021260k free,   337592k buffers
+          or
+        MiB Mem :  15972.5 total,    690.2 free,  10873.8 used,   4408.5 buff/cache
         """
-        logger.debug("Parsing Mem from {0}".format(line))
-
-        match = self.RE_MEM.match(line)
-        groups = match.groups()
-        logger.debug("Got groups: {0}".format(groups))
-        self.header[self.MEM_TOTAL] = int(groups[0])
-        self.header[self.MEM_USED] = int(groups[1])
-        self.header[self.MEM_FREE] = int(groups[2])
-        self.header[self.MEM_BUFFERS] = int(groups[3])
+        logger.debug("Parsing Mem from %s", line)
+        self.parseMemValues(line, self.RE_MEM, self.MEM_LABELS)
 
     def parseSwap(self, line):
         """
@@ -303,16 +453,59 @@ class TopEntry(object):
         KiB Swap:  4095996 total,    96600 used,  3999396 free, 10201704 cached
           or
         Swap:  3146748k total,   905060k used,  2241688k free,  1705700k cached'
+          or
+        MiB Swap:   4000.0 total,   3905.7 free,     94.3 used.   4712.1 avail Mem
         """
-        logger.debug("Parsing Swap from {0}".format(line))
+        logger.debug("Parsing Swap from %s", line)
+        self.parseMemValues(line, self.RE_SWAP, self.SWAP_LABELS)
 
-        match = self.RE_SWAP.match(line)
-        groups = match.groups()
-        logger.debug("Got groups: {0}".format(groups))
-        self.header[self.SWAP_TOTAL] = int(groups[0])
-        self.header[self.SWAP_USED] = int(groups[1])
-        self.header[self.SWAP_FREE] = int(groups[2])
-        self.header[self.SWAP_CACHED] = int(groups[3])
+    def parseMemValues(self, line, regex, labels):
+        """
+        Parse the labelled values of a Mem or Swap line, convert them to KiB and store them in the header.
+        : regex - The regex that matches the line, capturing the unit prefix and the values
+        : labels - dict - The header field to store each labelled value in
+        """
+        topFormat = self.format
+        specialized = None
+        if topFormat is not None and topFormat.specialize:
+            specialized = topFormat.memRegexes.get(regex)
+            if specialized is not None:
+                lineRegex, fields, scale = specialized
+                match = lineRegex.match(line)
+                if match:
+                    self.setMemValues(zip(match.groups(), fields), scale)
+                    return
+                topFormat.fallback(regex.pattern)
+
+        match = regex.match(line)
+        if not match:
+            raise Exception("Could not parse memory: {0}".format(line))
+
+        unit, values = match.groups()
+        scale = self.MEM_UNITS[unit]
+        valueLabels = self.RE_MEM_VALUE.findall(values)
+        logger.debug("Got values: %s", valueLabels)
+        self.setMemValues([(value, labels[label]) for value, label in valueLabels], scale)
+
+        if topFormat is not None and topFormat.specialize:
+            # Match the whole line with the labels in the order this file has them
+            pattern = '^' + re.escape(line[:len(line) - len(values)]) + ''.join(
+                r'\D*?([\d.]+)k?\s+' + re.escape(label) for value, label in valueLabels)
+            topFormat.memRegexes[regex] = (re.compile(pattern), [labels[label] for value, label in valueLabels],
+                                           scale)
+
+    def setMemValues(self, valueFields, scale):
+        """
+        Store memory values in the header, in KiB
+        : valueFields - list of (string, string) - Each value as given in the line, and its header field
+        : scale - int - The multiplier that converts the values to KiB
+        """
+        header = self.header
+        for value, field in valueFields:
+            if scale == 1 and value.isdigit():
+                header[field] = int(value)
+            else:
+                header[field] = int(round(float(value) * scale))
 
 
     def parseBody(self, f):
@@ -328,30 +521,55 @@ class TopEntry(object):
         # strip off the header
         self.readHeader(f)
 
+        # Checked once per entry, so that the loop over the job lines does no logging work when debug is off
+        debug = logger.isEnabledFor(logging.DEBUG)
+        symbols = self.symbols
+
+        if self.bulk:
+            # Read the job lines up to the blank line after them, or the end of the file, without a loop in python
+            lines = list(itertools.takewhile(self.BLANK_LINE.__ne__, iter(f.readline, '')))
+            previousLines = self.format.getJobLines(self.layout) if self.format is not None else None
+            jobs = self.layout.parseLines(lines, symbols, previousLines)
+            if jobs is not None:
+                self.jobs = jobs
+                if debug:
+                    for job in jobs.values():
+                        logger.debug('read job: %s', job)
+                return
+            # A line didn't split into the layout's columns, so parse them one at a time to report it
+        else:
+            lines = self.iterJobLines(f)
+
+        for line in lines:
+            job = Job()
+            job.parse(line, self.layout)
+            if symbols is not None:
+                symbols.internJob(job.info)
+            if debug:
+                logger.debug('read job: %s', job)
+            if job.getPid() in self.jobs:
+                raise Exception ("Duplicate pid: {0}".format(job.getPid()))
+            else:
+                self.jobs[job.getPid()] = job
+
+    def iterJobLines(self, f):
+        """Yield the job lines from f, up to the blank line after them or the end of the file"""
         while True:
             line = f.readline()
-            logger.debug('read line: {0}'.format(line))
             if not line or len(line) == 1:
-                break;
-            else:
-                job = Job()
-                job.parse(line)
-                logger.debug('read job: {0}'.format(job))
-                if self.jobs.has_key(job.getPid()):
-                    raise Exception ("Duplicate pid: {0}".format(job.getPid()))
-                else:
-                    self.jobs[job.getPid()] = job
-
+                break
+            yield line
 
     def readHeader(self, f):
         """
         Reads the header line from the job section of the top output.
-        This just validates that we're at the right point in the file.
+        This validates that we're at the right point in the file, and picks the layout of the job lines
+        that follow. The layout is normally the same as the previous entry's, so it is only rebuilt if
+        the header changes.
         """
         line = self.readline(f)
-        match = self.RE_JOB_HEADER.match(line)
-        if not match:
-            raise Exception("Did not parse header correctly: '{0}'".format(line))
+        if self.layout is None or line != self.layout.headerLine:
+            self.layout = JobLayout.fromHeader(line)
 
 
     def eatBlankLine(self, f):
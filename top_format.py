@@ -0,0 +1,75 @@
+import logging
+import re
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class TopFormat(object):
+    """
+    The format of the header lines in one file of top output, fingerprinted from its first entry.
+    A file nearly always has the same date mode, units and labels in every entry, and only a few variants
+    of the uptime line, so TopEntry parses each header line with a regex specialized to the format it saw
+    last, and only falls back to its general regexes (which then update the format) when that doesn't match.
+    One TopFormat is shared by the entries of a file.
+    """
+
+    def __init__(self, specialize=True):
+        """
+        : specialize - boolean - False to always use the general regexes, e.g. to check the specialized ones
+        """
+        self.specialize = specialize
+
+        # The full line uptime regexes, or their patterns until they're first tried, most recently matched first
+        self.uptimeRegexes = None
+        # The regex for the Tasks or Threads line
+        self.tasksRegex = None
+        # Line name, e.g. 'Mem' -> (regex for the whole line, header field of each group, unit scale)
+        self.memRegexes = {}
+
+        # The number of lines that the specialized regexes did not match
+        self.numFallbacks = 0
+
+        # The layout of the last entry's jobs, and line -> info for its job lines (see JobLayout.parseLines)
+        self.jobLayout = None
+        self.jobLines = {}
+
+    def __str__(self):
+        """Convert to string, for str()."""
+        return "TopFormat(uptime={0}, tasks={1}, mem={2}, fallbacks={3})".format(
+            [getattr(regex, 'pattern', regex) for regex in self.uptimeRegexes or []][:1],
+            self.tasksRegex.pattern if self.tasksRegex else None,
+            dict((name, regex.pattern) for name, (regex, fields, scale) in self.memRegexes.items()),
+            self.numFallbacks)
+
+    def matchUptime(self, line):
+        """
+        :return: the match of the first uptime regex that matches line, or None. The regex that matched is
+                 moved to the front, so the variant the file uses is tried first next time.
+        """
+        regexes = self.uptimeRegexes
+        for i, regex in enumerate(regexes):
+            if isinstance(regex, str):
+                regex = regexes[i] = re.compile(regex)
+            match = regex.match(line)
+            if match:
+                if i:
+                    regexes.insert(0, regexes.pop(i))
+                return match
+        self.numFallbacks += 1
+        return None
+
+    def getJobLines(self, layout):
+        """
+        :return: dict - line -> info, for the job lines of the last entry if they had the same layout, otherwise
+                        an empty dict, to be filled with this entry's
+        """
+        if layout is not self.jobLayout:
+            self.jobLayout = layout
+            self.jobLines = {}
+        return self.jobLines
+
+    def fallback(self, lineName):
+        """Record that a specialized regex did not match, so the general one is used"""
+        self.numFallbacks += 1
+        logger.debug("Format changed, parsing the %s line with the general regex", lineName)
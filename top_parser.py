@@ -5,33 +5,93 @@ It expects to be fed the output corresponding to one iteration of top.
 """
 
 import argparse
+import importlib
+import itertools
 import logging
 import os
 import sys
 
+from output_sink import OutputSink
+from symbol_table import SymbolTable
 from top_entry import TopEntry
+from top_format import TopFormat
 
 __author__ = 'Dave Pinkney'
 
 logger = logging.getLogger(__name__)
 
+# Subcommands, each implemented by the main function of the named module
+SUBCOMMANDS = {
+    'query': 'top_query',
+    'spikes': 'spike_detector',
+    'leaks': 'leak_detector',
+    'plot': 'top_plot',
+    'sample': 'proc_sampler',
+    'fleet': 'fleet',
+    'serve': 'parse_service',
+    'ask': 'parse_client',
+    'preview': 'preview',
+    'export': 'metrics_exporter',
+    'diff': 'top_diff',
+}
+
 class TopParser(object):
 
-    def __init__(self, fileName):
+    def __init__(self, fileName, symbols=None, memoryBudget=None, specialize=True, threadFolder=None, bulk=True):
         """
+        : fileName - string - The file of top output to parse, or '-' to read it from stdin
+        : symbols - SymbolTable - The table to intern the jobs' strings in, which may be shared with other
+                                  parsers. Defaults to a new table.
+        : memoryBudget - int - If given, the parsed entries are kept in a SegmentStore that holds at most this
+                               many bytes of them in memory, spilling the rest to disk. Call close to remove
+                               the spilled entries.
+        : specialize - boolean - False to parse every header line with the general regexes, rather than with
+                                 regexes specialized to the format of the file's first entry (see TopFormat)
+        : threadFolder - ThreadFolder - If given, the thread rows of top -H output are folded into one job per
+                                        process as each entry is parsed, before it is stored or yielded
+        : bulk - boolean - False to parse each job line with the layout's regex, rather than parsing the job lines
+                           of each entry together (see JobLayout.parseLines)
         """
         self.fileName = fileName
-        self.entries = []
+        self.specialize = specialize
+        self.bulk = bulk
+        self.threadFolder = threadFolder
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        if memoryBudget is not None:
+            # Imported here, since it loads pickle and tempfile which most runs don't need
+            from segment_store import SegmentStore
+            self.entries = SegmentStore(memoryBudget)
+        else:
+            self.entries = []
 
     def parse(self):
         logger.debug("Parsing file {0}".format(self.fileName))
 
+        for topEntry in self.iterEntries():
+            self.entries.append(topEntry)
+
+        logger.info("Parsed {0} entries from {1}".format(len(self.entries), self.fileName))
+
+    def close(self):
+        """Release the parsed entries, removing any that were spilled to disk"""
+        if not isinstance(self.entries, list):
+            self.entries.close()
+        self.entries = []
+
+    def iterEntries(self):
+        """
+        Parse the file, yielding each TopEntry as soon as it has been read, without storing it in self.entries.
+        This allows output to be streamed to a sink, or entries to be consumed from a live feed on stdin.
+        """
+        f = self.openFile()
 
         hasDate = None
+        layout = None
+        topFormat = TopFormat(self.specialize)
 
         # Parse the file
         # Pass output sequence from top to TopParser
-        with open(self.fileName, 'r') as f:
+        try:
             while True:
                 firstLine = f.readline()
                 if not firstLine:
@@ -40,17 +100,31 @@ class TopParser(object):
                 if not firstLine:
                     # Skip blank lines between entries (if any)
                     continue
-                logger.debug('read line: "{0}"'.format(firstLine))
-                topEntry = TopEntry(hasDate).parse(firstLine, f)
-                self.entries.append(topEntry)
+                logger.debug('read line: "%s"', firstLine)
+                topEntry = TopEntry(hasDate, layout, self.symbols, topFormat, self.bulk).parse(firstLine, f)
                 hasDate = topEntry.hasDate
+                layout = topEntry.layout
+                if self.threadFolder is not None:
+                    self.threadFolder.fold(topEntry)
+                yield topEntry
+        finally:
+            if f is not sys.stdin:
+                f.close()
 
-                
-        logger.info("Parsed {0} entries from {1}".format(len(self.entries), self.fileName))
+    def openFile(self):
+        """
+        :return: the file to parse, stdin if the file name is '-'
+        """
+        if self.fileName == '-':
+            return sys.stdin
+        return open(self.fileName, 'r')
 
 
 
 def main(argv):
+    if argv and argv[0] in SUBCOMMANDS:
+        return importlib.import_module(SUBCOMMANDS[argv[0]]).main(argv[1:])
+
     examples = """
     Examples:
     # Parse top data from the specified output file, generated via "top -b":
@@ -62,11 +136,82 @@ def main(argv):
     #  top -b -n1 -H >> topWithDate.log
         %prog topWithDate.log
 
+    # Parse top data into an SQLite database, JSON Lines or CSV (the format is picked from the extension):
+        %prog topOutput.log --output top.db
+        %prog topOutput.log --output top.jsonl
+        top -b -d 1 | %prog - --output top.csv
+
+    # Parse several captures into one database, storing commands, users and statuses as ids from a symbol
+    # table that is kept across runs:
+        %prog host1.log host2.log --output top.db --symbols top.symbols
+
+    # Fold the thread rows of "top -H" output into one job per process, using a map of thread ids to processes
+    # captured alongside it if there is one, e.g. with "ps -eLo lwp=,pid= > topWithDate.tgids":
+        %prog topWithDate.log --fold-threads
+        %prog topWithDate.log --tgids topWithDate.tgids --output top.db
+
+    # Parse a capture that is larger than memory, holding at most 512 MB of it in memory at once:
+        %prog bigCapture.log --memory-budget 512
+
+    # Show where parse time goes, or profile it with cProfile:
+        %prog topOutput.log --profile
+        %prog topOutput.log --profile-output parse.pstats
+
+    # Query parsed top data, see "%prog query --help":
+        %prog query topOutput.log --group-by hour --agg "max:1 minute load"
+
+    # Report load, cpu and memory spikes and the processes that caused them:
+        %prog spikes topOutput.log
+
+    # Report processes whose memory grows steadily, and when the host would run out of memory at that rate:
+        %prog leaks day1.log day2.log day3.log
+
+    # Chart load, cpu, memory and the busiest processes over time:
+        %prog plot topOutput.log -o top.html
+
+    # Compare cpu, memory and load across the captures of many hosts, see "%prog fleet --help":
+        %prog fleet captures/*.log
+
+    # Compare the load, cpu and memory of two captures, and of each command and user, e.g. before and after a deploy:
+        %prog diff before.log after.log
+
+    # Estimate load, cpu, memory and the busiest commands of a huge capture from a sample of its snapshots:
+        %prog preview hugeCapture.log --samples 200
+
+    # Keep parsed files in memory for repeated analysis, which query and ask use while it is running:
+        %prog serve &
+        %prog ask header topOutput.log --fields "1 minute load"
+
+    # Serve the metrics of a live feed to Prometheus on http://localhost:9105/metrics:
+        top -b -d 15 | %prog export -
+
+    # Sample what top would show directly from /proc, without running top:
+        %prog sample --interval 1 --count 60 -o top.db
+
     """
     parser = argparse.ArgumentParser(description="""This tool is used to parse output from the top command""",
                                      epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
 
-    parser.add_argument("fileName", type=str, default=None, help="File to parse")
+    parser.add_argument("fileNames", type=str, nargs='+', help="Files to parse, or - to read from stdin")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="File to write the parsed data to, as SQLite, JSON Lines or CSV")
+    parser.add_argument("--format", type=str, default=None, choices=OutputSink.FORMATS,
+                        help="Format of the output file, defaults to a format based on its extension")
+    parser.add_argument("--symbols", type=str, default=None,
+                        help="File to load the symbol table from and save it to, so the ids written to the "
+                             "output are the same across runs")
+    parser.add_argument("--memory-budget", type=int, default=None,
+                        help="Megabytes of parsed entries to keep in memory, spilling the rest to disk")
+    parser.add_argument("--fold-threads", action='store_true',
+                        help="Fold the thread rows of top -H output into one job per process")
+    parser.add_argument("--tgids", type=str, default=None,
+                        help="File mapping thread ids to their process ids, for --fold-threads, as written by "
+                             "\"ps -eLo lwp=,pid=\". Implies --fold-threads")
+    parser.add_argument("--profile", action='store_true',
+                        help="Print the time spent in each stage of parsing, and the number of lines, bytes, "
+                             "snapshots and jobs parsed")
+    parser.add_argument("--profile-output", type=str, default=None,
+                        help="Run under cProfile and write the stats to this file, for use with pstats")
     parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
     options = parser.parse_args(argv)
 
@@ -79,8 +224,45 @@ def main(argv):
 
     logger.debug("Got options: {0}".format(options))
 
-    topParser = TopParser(options.fileName)
-    topParser.parse()
+    symbols = SymbolTable.load(options.symbols) if options.symbols else SymbolTable()
+    memoryBudget = options.memory_budget * 1024 * 1024 if options.memory_budget else None
+    threadFolder = None
+    if options.fold_threads or options.tgids:
+        from thread_fold import ThreadFolder, loadTgids
+        threadFolder = ThreadFolder(loadTgids(options.tgids) if options.tgids else None)
+    topParsers = [TopParser(fileName, symbols, memoryBudget, threadFolder=threadFolder)
+                  for fileName in options.fileNames]
+    if options.profile_output:
+        import instrumentation
+        instrumentation.runWithCProfile(run, options.profile_output, topParsers, options)
+    elif options.profile:
+        import instrumentation
+        with instrumentation.ParseProfile(*topParsers) as profile:
+            run(topParsers, options)
+        sys.stderr.write(profile.report())
+    else:
+        run(topParsers, options)
+
+    if threadFolder is not None:
+        logger.info("Folded {0} threads into {1} processes".format(threadFolder.numThreads,
+                                                                   threadFolder.numProcesses))
+    if options.symbols:
+        symbols.save(options.symbols)
+
+
+def run(topParsers, options):
+    """
+    Parse the files, writing them to the output sink if there is one. The parsers share a symbol table,
+    which the sink uses to write ids in place of the strings it holds when a symbol file was given.
+    """
+    if options.output:
+        symbols = topParsers[0].symbols if options.symbols else None
+        with OutputSink.create(options.output, options.format, symbols=symbols) as sink:
+            sink.writeAll(itertools.chain.from_iterable(topParser.iterEntries() for topParser in topParsers))
+    else:
+        for topParser in topParsers:
+            topParser.parse()
+            topParser.close()
 
 
 if __name__ == "__main__":
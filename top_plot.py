@@ -0,0 +1,412 @@
+#!/usr/bin/python
+"""
+This module draws timeline charts of parsed top output, as standalone SVG or HTML files that need no network
+access to view. Each series is downsampled to about one point per pixel before it is drawn, so the time taken
+to render a chart depends on its width rather than on the length of the capture.
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import sys
+
+from job import Job
+from top_entry import TopEntry
+from top_parser import TopParser
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class Downsampler(object):
+    """
+    Reduces a series of (x, y) points, sorted by x, to a given number of points while keeping its visual shape.
+    """
+
+    LTTB = 'lttb'
+    MIN_MAX = 'minmax'
+    METHODS = (LTTB, MIN_MAX)
+
+    @classmethod
+    def downsample(cls, points, numPoints, method=LTTB):
+        """
+        :return: list of about numPoints points chosen from points using method, or points if it is short enough
+        """
+        if len(points) <= numPoints or numPoints < 3:
+            return points
+        if method == cls.MIN_MAX:
+            return cls.minMax(points, numPoints)
+        return cls.lttb(points, numPoints)
+
+    @classmethod
+    def lttb(cls, points, numPoints):
+        """
+        Largest-Triangle-Three-Buckets: keep the first and last points, and from each of numPoints - 2 buckets
+        in between, the point forming the largest triangle with the point kept from the previous bucket and
+        the average of the next bucket.
+        """
+        sampled = [points[0]]
+        bucketSize = float(len(points) - 2) / (numPoints - 2)
+        previous = points[0]
+
+        for bucket in range(numPoints - 2):
+            start = int(bucket * bucketSize) + 1
+            end = int((bucket + 1) * bucketSize) + 1
+
+            # The average of the next bucket, or the last point for the last bucket
+            nextStart = end
+            nextEnd = min(int((bucket + 2) * bucketSize) + 1, len(points))
+            if nextStart >= nextEnd:
+                averageX, averageY = points[-1]
+            else:
+                count = float(nextEnd - nextStart)
+                averageX = sum(point[0] for point in points[nextStart:nextEnd]) / count
+                averageY = sum(point[1] for point in points[nextStart:nextEnd]) / count
+
+            previousX, previousY = previous
+            largestArea = -1
+            for point in points[start:end]:
+                area = abs((previousX - averageX) * (point[1] - previousY) -
+                           (previousX - point[0]) * (averageY - previousY))
+                if area > largestArea:
+                    largestArea = area
+                    previous = point
+            sampled.append(previous)
+
+        sampled.append(points[-1])
+        return sampled
+
+    @classmethod
+    def minMax(cls, points, numPoints):
+        """
+        Split the points into numPoints / 2 buckets and keep the minimum and maximum of each, in x order,
+        so that every peak and trough survives.
+        """
+        numBuckets = max(numPoints // 2, 1)
+        bucketSize = float(len(points)) / numBuckets
+        sampled = []
+        for bucket in range(numBuckets):
+            bucketPoints = points[int(bucket * bucketSize):int((bucket + 1) * bucketSize)]
+            if not bucketPoints:
+                continue
+            low = min(bucketPoints, key=lambda point: point[1])
+            high = max(bucketPoints, key=lambda point: point[1])
+            if low is high:
+                sampled.append(low)
+            elif low[0] <= high[0]:
+                sampled.extend((low, high))
+            else:
+                sampled.extend((high, low))
+        return sampled
+
+
+class TimelineChart(object):
+    """
+    A line chart of one or more series against time, rendered as SVG.
+    """
+
+    COLORS = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f',
+              '#bcbd22', '#17becf')
+    MARGIN_LEFT = 70
+    MARGIN_RIGHT = 20
+    MARGIN_TOP = 30
+    MARGIN_BOTTOM = 40
+    LEGEND_LINE_HEIGHT = 16
+    NUM_TICKS = 5
+
+    def __init__(self, title, width=1000, height=300, method=Downsampler.LTTB):
+        """
+        : title - string - The chart title
+        : width, height - int - The size of the chart in pixels
+        : method - string - The Downsampler method used to reduce each series to the plot width
+        """
+        self.title = title
+        self.width = width
+        self.height = height
+        self.method = method
+        # list of (label, points), where points is a list of (seconds, value)
+        self.series = []
+
+    def addSeries(self, label, points):
+        """
+        Add a series to the chart, downsampling it to the width of the plot area.
+        : points - list of (datetime.datetime, value), sorted by time
+        """
+        points = [(self.toSeconds(time), value) for time, value in points if value is not None]
+        plotWidth = self.width - self.MARGIN_LEFT - self.MARGIN_RIGHT
+        sampled = Downsampler.downsample(points, plotWidth, self.method)
+        logger.debug("Downsampled {0} from {1} to {2} points".format(label, len(points), len(sampled)))
+        self.series.append((label, sampled))
+
+    def toSeconds(self, time):
+        return (time - datetime.datetime(1970, 1, 1)).total_seconds()
+
+    @staticmethod
+    def escape(text):
+        """:return: string - text escaped for use in SVG or HTML text and attribute values"""
+        return str(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+    def toSvg(self):
+        """:return: string - the chart as an SVG document"""
+        legendHeight = self.LEGEND_LINE_HEIGHT * len(self.series)
+        height = self.height + legendHeight
+        plotWidth = self.width - self.MARGIN_LEFT - self.MARGIN_RIGHT
+        plotHeight = self.height - self.MARGIN_TOP - self.MARGIN_BOTTOM
+
+        allPoints = [point for label, points in self.series for point in points]
+        if allPoints:
+            minX = min(point[0] for point in allPoints)
+            maxX = max(point[0] for point in allPoints)
+            minY = min(0, min(point[1] for point in allPoints))
+            maxY = max(point[1] for point in allPoints)
+        else:
+            minX = maxX = minY = maxY = 0
+        spanX = float(maxX - minX) or 1.0
+        spanY = float(maxY - minY) or 1.0
+
+        def scaleX(x):
+            return self.MARGIN_LEFT + (x - minX) * plotWidth / spanX
+
+        def scaleY(y):
+            return self.MARGIN_TOP + plotHeight - (y - minY) * plotHeight / spanY
+
+        parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" font-family="sans-serif" '
+                 'font-size="11">'.format(self.width, height),
+                 '<rect width="100%" height="100%" fill="white"/>',
+                 '<text x="{0}" y="18" font-size="14">{1}</text>'.format(self.MARGIN_LEFT, self.escape(self.title)),
+                 '<rect x="{0}" y="{1}" width="{2}" height="{3}" fill="none" stroke="#999"/>'.format(
+                     self.MARGIN_LEFT, self.MARGIN_TOP, plotWidth, plotHeight)]
+
+        for tick in range(self.NUM_TICKS + 1):
+            fraction = float(tick) / self.NUM_TICKS
+            y = self.MARGIN_TOP + plotHeight * (1 - fraction)
+            x = self.MARGIN_LEFT + plotWidth * fraction
+            time = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=minX + spanX * fraction)
+            parts.append('<text x="{0}" y="{1:.1f}" text-anchor="end">{2:.6g}</text>'.format(
+                self.MARGIN_LEFT - 4, y + 4, minY + spanY * fraction))
+            parts.append('<text x="{0:.1f}" y="{1}" text-anchor="middle">{2}</text>'.format(
+                x, self.MARGIN_TOP + plotHeight + 15, time.strftime('%m/%d %H:%M:%S')))
+
+        for index, (label, points) in enumerate(self.series):
+            color = self.COLORS[index % len(self.COLORS)]
+            coordinates = ' '.join('{0:.1f},{1:.1f}'.format(scaleX(x), scaleY(y)) for x, y in points)
+            parts.append('<polyline fill="none" stroke="{0}" stroke-width="1.2" points="{1}"/>'.format(
+                color, coordinates))
+            legendY = self.height + index * self.LEGEND_LINE_HEIGHT
+            parts.append('<rect x="{0}" y="{1}" width="12" height="3" fill="{2}"/>'.format(
+                self.MARGIN_LEFT, legendY - 4, color))
+            parts.append('<text x="{0}" y="{1}">{2}</text>'.format(self.MARGIN_LEFT + 18, legendY, self.escape(label)))
+
+        parts.append('</svg>')
+        return '\n'.join(parts)
+
+
+class TopPlotter(object):
+    """
+    Builds timeline charts of header fields and of per-process job fields from a sequence of entries.
+    """
+
+    DEFAULT_HEADER_FIELDS = (TopEntry.LOAD_1_MINUTE, TopEntry.CPU_UNNICED, TopEntry.CPU_SYSTEM, TopEntry.CPU_WAIT,
+                             TopEntry.MEM_FREE, TopEntry.SWAP_USED)
+
+    def __init__(self, headerFields=DEFAULT_HEADER_FIELDS, jobFields=(Job.JOB_CPU, Job.JOB_RES), numJobs=5,
+                 pids=None):
+        """
+        : headerFields - list of TopEntry fields to chart, each in its own chart
+        : jobFields - list of Job fields to chart, each in its own chart with one series per process
+        : numJobs - int - The number of processes to chart, those with the highest average of each job field
+        : pids - list of string - If given, chart these pids rather than the busiest processes
+        """
+        self.headerFields = headerFields
+        self.jobFields = jobFields
+        self.numJobs = numJobs
+        self.pids = pids and set(pids)
+
+        self.headerSeries = dict((field, []) for field in headerFields)
+        # job field -> (pid, command) -> list of (time, value)
+        self.jobSeries = dict((field, {}) for field in jobFields)
+        # job field -> the (pid, command) keys to collect points for, or None to collect every process's
+        self.chosen = None
+
+    def rankJobs(self, entries):
+        """
+        Choose the processes to chart, those with the highest average of each job field, from a first pass over
+        an iterable of TopEntry. Only a running sum and count are kept for each process, so that addEntries
+        need only keep the points of the chosen processes rather than of every process in the capture.
+        """
+        # job field -> (pid, command) -> [sum, count]
+        totals = dict((field, {}) for field in self.jobFields)
+        for topEntry in entries:
+            for job in topEntry.jobs.values():
+                info = job.info
+                key = (info[Job.JOB_PID], info[Job.JOB_COMMAND])
+                for field, fieldTotals in totals.items():
+                    value = info.get(field)
+                    if value is None:
+                        continue
+                    total = fieldTotals.get(key)
+                    if total is None:
+                        fieldTotals[key] = [value, 1]
+                    else:
+                        total[0] += value
+                        total[1] += 1
+
+        self.chosen = {}
+        for field, fieldTotals in totals.items():
+            ranked = sorted(fieldTotals.items(), key=lambda item: -float(item[1][0]) / item[1][1])
+            self.chosen[field] = set(key for key, total in ranked[:self.numJobs])
+
+    def addEntries(self, entries):
+        """
+        Collect the series from an iterable of TopEntry. Unless pids were given, call rankJobs with the same
+        entries first, otherwise the points of every process are kept until getCharts picks the busiest.
+        """
+        chosen = self.chosen if not self.pids else None
+        for topEntry in entries:
+            time = topEntry.getDateTime()
+            header = topEntry.header
+            for field, points in self.headerSeries.items():
+                points.append((time, header.get(field)))
+            for job in topEntry.jobs.values():
+                info = job.info
+                if self.pids and info[Job.JOB_PID] not in self.pids:
+                    continue
+                key = (info[Job.JOB_PID], info[Job.JOB_COMMAND])
+                for field, series in self.jobSeries.items():
+                    if chosen is None or key in chosen[field]:
+                        series.setdefault(key, []).append((time, info.get(field)))
+
+    def getCharts(self, width=1000, height=300, method=Downsampler.LTTB):
+        """:return: list of TimelineChart, one per header field and one per job field"""
+        charts = []
+        for field in self.headerFields:
+            chart = TimelineChart(field, width, height, method)
+            chart.addSeries(field, self.headerSeries[field])
+            charts.append(chart)
+
+        for field in self.jobFields:
+            series = self.jobSeries[field]
+            ranked = sorted(series.items(), key=lambda item: -self.average(item[1]))
+            chart = TimelineChart("{0} by process".format(field), width, height, method)
+            for (pid, command), points in ranked[:self.numJobs]:
+                chart.addSeries("{0} {1}".format(pid, command), points)
+            charts.append(chart)
+        return charts
+
+    def average(self, points):
+        values = [value for time, value in points if value is not None]
+        return float(sum(values)) / len(values) if values else 0
+
+    def writeHtml(self, fileName, title, charts):
+        """Write the charts to a standalone HTML file"""
+        with open(fileName, 'w') as f:
+            f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{0}</title></head><body>\n'.format(
+                TimelineChart.escape(title)))
+            for chart in charts:
+                f.write('<div>{0}</div>\n'.format(chart.toSvg()))
+            f.write('</body></html>\n')
+
+    def writeSvg(self, fileName, charts):
+        """Write the charts to SVG files, the first to fileName and the rest to fileName-1.svg, fileName-2.svg..."""
+        root = fileName[:-4] if fileName.endswith('.svg') else fileName
+        for index, chart in enumerate(charts):
+            name = fileName if index == 0 else "{0}-{1}.svg".format(root, index)
+            with open(name, 'w') as f:
+                f.write(chart.toSvg())
+
+    def writePng(self, fileName, charts, dpi=100):
+        """
+        Write the charts to a PNG image with matplotlib, which must be installed.
+        The series are already downsampled, so matplotlib only draws about one point per pixel.
+        """
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as pyplot
+
+        width = charts[0].width if charts else 1000
+        height = sum(chart.height for chart in charts) or 300
+        figure, axes = pyplot.subplots(max(len(charts), 1), 1, figsize=(float(width) / dpi, float(height) / dpi),
+                                       squeeze=False)
+        epoch = datetime.datetime(1970, 1, 1)
+        for chart, (axis,) in zip(charts, axes):
+            axis.set_title(chart.title)
+            for label, points in chart.series:
+                axis.plot([epoch + datetime.timedelta(seconds=x) for x, y in points], [y for x, y in points],
+                          label=label, linewidth=1)
+            axis.legend(loc='upper left', fontsize='small')
+        figure.tight_layout()
+        figure.savefig(fileName, dpi=dpi)
+        pyplot.close(figure)
+
+
+def main(argv):
+    examples = """
+    Examples:
+    # Chart the load, cpu and memory, and the 5 busiest processes, to an HTML file:
+        %prog plot topOutput.log -o top.html
+
+    # Chart the resident memory of two processes, keeping every peak:
+        %prog plot topOutput.log -o res.svg --fields --job-fields memResident --pids 1453 662 --method minmax
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to chart output from the top command""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("fileName", type=str, help="File to parse, or - to read from stdin")
+    parser.add_argument("-o", "--output", type=str, required=True,
+                        help="File to write, as .html, .svg, or .png (which requires matplotlib)")
+    parser.add_argument("--fields", nargs='*', default=list(TopPlotter.DEFAULT_HEADER_FIELDS),
+                        help="Header fields to chart")
+    parser.add_argument("--job-fields", nargs='*', default=[Job.JOB_CPU, Job.JOB_RES],
+                        help="Job fields to chart per process")
+    parser.add_argument("--top", type=int, default=5, help="Number of processes to chart")
+    parser.add_argument("--pids", nargs='+', default=None, help="Pids to chart, instead of the busiest processes")
+    parser.add_argument("--width", type=int, default=1000, help="Chart width in pixels")
+    parser.add_argument("--height", type=int, default=300, help="Chart height in pixels")
+    parser.add_argument("--method", choices=Downsampler.METHODS, default=Downsampler.LTTB,
+                        help="How to downsample each series to the chart width")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    options = parser.parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.INFO
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    fileName = options.fileName
+    spool = None
+    if fileName == '-' and not options.pids:
+        # Copy stdin to a temporary file, so it can be read once to rank the processes and again to chart them
+        import shutil
+        import tempfile
+        spool = tempfile.NamedTemporaryFile('w', suffix='.log', delete=False)
+        with spool:
+            shutil.copyfileobj(sys.stdin, spool)
+        fileName = spool.name
+
+    plotter = TopPlotter(options.fields, options.job_fields, options.top, options.pids)
+    try:
+        if not options.pids:
+            plotter.rankJobs(TopParser(fileName).iterEntries())
+        plotter.addEntries(TopParser(fileName).iterEntries())
+    finally:
+        if spool is not None:
+            os.remove(spool.name)
+    charts = plotter.getCharts(options.width, options.height, options.method)
+
+    if options.output.endswith('.png'):
+        plotter.writePng(options.output, charts)
+    elif options.output.endswith('.svg'):
+        plotter.writeSvg(options.output, charts)
+    else:
+        plotter.writeHtml(options.output, options.fileName, charts)
+    logger.info("Wrote {0} charts to {1}".format(len(charts), options.output))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,451 @@
+#!/usr/bin/python
+"""
+This module runs queries over parsed top output: filter, group by, aggregate, order by and limit, using the
+TopEntry and Job field names as column names. Queries stream over the entries, so a capture never has to be
+held in memory to be queried.
+"""
+
+import argparse
+import heapq
+import logging
+import operator
+import os
+import re
+import sys
+
+from job import Job
+from output_sink import JsonLinesSink
+from top_entry import TopEntry
+from top_parser import TopParser
+
+__author__ = 'Dave Pinkney'
+
+logger = logging.getLogger(__name__)
+
+class TopQuery(object):
+    """
+    A query over a sequence of TopEntry objects, built up by chaining calls, e.g. the 10 pids with the
+    highest average resident memory between 02:00 and 03:00:
+
+        TopQuery().between('02:00', '03:00').groupBy(Job.JOB_PID, Job.JOB_COMMAND) \\
+                  .aggregate(TopQuery.AVG, Job.JOB_RES).orderBy('avg(memResident)', True).limit(10).run(entries)
+
+    If the query refers to any job field it produces one row per job per entry, otherwise one row per entry.
+    Filters on header fields and the time range are applied to an entry before any of its jobs are looked at.
+    """
+
+    # Pseudo columns, computed from the entry's date and time
+    TIMESTAMP = 'timestamp'                 # string - 'YYYY-MM-DD HH:MM:SS'
+    HOUR = 'hour'                           # string - 'YYYY-MM-DD HH'
+    DAY = 'day'                             # string - 'YYYY-MM-DD'
+    PSEUDO_COLUMNS = (TIMESTAMP, HOUR, DAY)
+
+    # Aggregate functions
+    COUNT = 'count'
+    SUM = 'sum'
+    AVG = 'avg'
+    MIN = 'min'
+    MAX = 'max'
+    AGGREGATES = (COUNT, SUM, AVG, MIN, MAX)
+
+    OPERATORS = {
+        '=': operator.eq,
+        '!=': operator.ne,
+        '<': operator.lt,
+        '<=': operator.le,
+        '>': operator.gt,
+        '>=': operator.ge,
+        '~': lambda value, regex: regex.search(str(value) if isinstance(value, (int, float)) else value) is not None,
+    }
+
+    # Columns holding strings, values compared to any other column are converted to numbers
+    STRING_COLUMNS = frozenset((TopEntry.TIME_OF_DAY, Job.JOB_PID, Job.JOB_USER, Job.JOB_PR, Job.JOB_STATUS,
+                                Job.JOB_TIME, Job.JOB_COMMAND, Job.JOB_PPID, Job.JOB_TGID, Job.JOB_GROUP,
+                                Job.JOB_TTY) + PSEUDO_COLUMNS)
+
+    RE_TIME_OF_DAY = re.compile(r'^\d\d?:\d\d(:\d\d)?$')
+
+    def __init__(self):
+        self.headerFilters = []
+        self.jobFilters = []
+        # Filters on pseudo columns, which are applied once the pseudo columns of an entry are computed
+        self.pseudoFilters = []
+        self.startTime = None
+        self.endTime = None
+        self.timeOfDayRange = False
+        self.selectColumns = []
+        self.groupColumns = []
+        self.aggregates = []
+        self.orderColumns = []
+        self.maxRows = None
+
+    def isJobColumn(self, column):
+        """:return: True if column is a Job field rather than a header or pseudo column"""
+        return column not in TopEntry.HEADER_FIELDS and column not in self.PSEUDO_COLUMNS
+
+    def where(self, column, op, value):
+        """
+        Only include rows where 'column op value' is true.
+        : op - string - One of OPERATORS. '~' matches value as a regex anywhere in the column, or in the
+                        column's number as a string, e.g. '^1' for memResident values starting with 1.
+        : value - The value to compare to, converted to a number unless column is in STRING_COLUMNS
+        """
+        compare = self.OPERATORS[op]
+        if op == '~':
+            value = re.compile(value)
+        elif column not in self.STRING_COLUMNS:
+            value = float(value)
+
+        if self.isJobColumn(column):
+            self.jobFilters.append((column, compare, value))
+        elif column in self.PSEUDO_COLUMNS:
+            self.pseudoFilters.append((column, compare, value))
+        else:
+            self.headerFilters.append((column, compare, value))
+        return self
+
+    def between(self, start, end):
+        """
+        Only include entries captured in [start, end).
+        Both are either times of day, 'HH:MM[:SS]', which match on any date, or timestamps 'YYYY-MM-DD HH:MM[:SS]'
+        :throws: Exception if start and end are of different forms, or end is not after start. A range of times of
+                 day can't cross midnight, give it as two queries instead.
+        """
+        self.timeOfDayRange = bool(self.RE_TIME_OF_DAY.match(start))
+        if self.timeOfDayRange != bool(self.RE_TIME_OF_DAY.match(end)):
+            raise Exception("The start and end of a time range must both be times of day or both be timestamps: "
+                            "{0} {1}".format(start, end))
+        self.startTime = self.padTime(start)
+        self.endTime = self.padTime(end)
+        if not self.startTime < self.endTime:
+            raise Exception("The time range ends before it starts, a range can't cross midnight: {0} {1}".format(
+                self.startTime, self.endTime))
+        return self
+
+    def padTime(self, time):
+        """:return: time with seconds, so it can be compared with TIME_OF_DAY or TIMESTAMP strings"""
+        if time.count(':') == 1:
+            time += ':00'
+        if self.timeOfDayRange and len(time) == 7:
+            time = '0' + time
+        return time
+
+    def select(self, *columns):
+        """The columns to output, for queries without aggregates"""
+        self.selectColumns.extend(columns)
+        return self
+
+    def groupBy(self, *columns):
+        self.groupColumns.extend(columns)
+        return self
+
+    def aggregate(self, function, column=None):
+        """
+        Add an aggregate column, named 'function(column)'.
+        : function - string - One of AGGREGATES
+        : column - string - The column to aggregate, may be None for COUNT
+        """
+        if function not in self.AGGREGATES:
+            raise Exception("Unknown aggregate: {0}".format(function))
+        self.aggregates.append((function, column))
+        return self
+
+    def orderBy(self, column, descending=False):
+        """
+        Order the result by column, which is a selected or grouped column, or an aggregate named 'function(column)'
+        """
+        self.orderColumns.append((column, descending))
+        return self
+
+    def limit(self, maxRows):
+        self.maxRows = maxRows
+        return self
+
+    def getColumns(self):
+        """:return: list of the names of the columns in the result"""
+        if self.aggregates or self.groupColumns:
+            return self.groupColumns + ['{0}({1})'.format(function, column or '*')
+                                        for function, column in self.aggregates]
+        return list(self.selectColumns)
+
+    def getInputColumns(self):
+        """:return: set of the columns read from each row"""
+        columns = set(self.selectColumns + self.groupColumns)
+        columns.update(column for function, column in self.aggregates if column)
+        columns.update(column for column, compare, value in self.jobFilters)
+        return columns
+
+    def run(self, entries):
+        """
+        Run the query over entries.
+        : entries - iterable of TopEntry
+        :return: list of tuples, one per result row, with values in the order of getColumns()
+        """
+        inputColumns = self.getInputColumns()
+        perJob = any(self.isJobColumn(column) for column in inputColumns)
+        rowColumns = sorted(inputColumns)
+        timestampRange = self.startTime is not None and not self.timeOfDayRange
+        needsTimestamp = timestampRange or bool(self.pseudoFilters) or \
+                         any(column in self.PSEUDO_COLUMNS for column in rowColumns)
+
+        if self.aggregates or self.groupColumns:
+            result = Aggregation(self.groupColumns, self.aggregates)
+        else:
+            result = Selection(self.selectColumns)
+
+        numEntries = 0
+        for topEntry in entries:
+            header = topEntry.header
+            if not self.acceptHeader(header):
+                continue
+
+            values = {}
+            if needsTimestamp:
+                timestamp = topEntry.getDateTime().strftime('%Y-%m-%d %H:%M:%S')
+                if timestampRange and not self.inRange(timestamp):
+                    continue
+                values[self.TIMESTAMP] = timestamp
+                values[self.HOUR] = timestamp[:13]
+                values[self.DAY] = timestamp[:10]
+                if not self.acceptFilters(values, self.pseudoFilters):
+                    continue
+            numEntries += 1
+
+            for column in rowColumns:
+                if column in header:
+                    values[column] = header[column]
+
+            if not perJob:
+                result.add(values)
+                continue
+
+            for job in topEntry.jobs.values():
+                info = job.info
+                if not self.acceptFilters(info, self.jobFilters):
+                    continue
+                row = values.copy()
+                for column in rowColumns:
+                    if column in info:
+                        row[column] = info[column]
+                result.add(row)
+
+        logger.debug("Queried {0} entries".format(numEntries))
+        return self.sortRows(result.getRows())
+
+    def acceptHeader(self, header):
+        """:return: True if an entry with this header passes the time of day range and header filters"""
+        if self.timeOfDayRange and not self.inRange(header[TopEntry.TIME_OF_DAY].zfill(8)):
+            return False
+        return self.acceptFilters(header, self.headerFilters)
+
+    def acceptFilters(self, values, filters):
+        for column, compare, value in filters:
+            actual = values.get(column)
+            if actual is None or not compare(actual, value):
+                return False
+        return True
+
+    def inRange(self, time):
+        return self.startTime <= time < self.endTime
+
+    def sortRows(self, rows):
+        """Apply the order by and limit clauses to rows"""
+        columns = self.getColumns()
+        for column, descending in reversed(self.orderColumns):
+            if column not in columns:
+                raise Exception("Can't order by {0}, it is not one of the result columns: {1}".format(column, columns))
+            index = columns.index(column)
+            key = lambda row: (row[index] is not None, row[index])
+            if self.maxRows is not None and len(self.orderColumns) == 1:
+                # Avoid sorting the whole result when only the top rows are wanted
+                if descending:
+                    return heapq.nlargest(self.maxRows, rows, key)
+                return heapq.nsmallest(self.maxRows, rows, key)
+            rows.sort(key=key, reverse=descending)
+
+        if self.maxRows is not None:
+            rows = rows[:self.maxRows]
+        return rows
+
+
+class Selection(object):
+    """Collects the selected columns of each row, for queries without aggregates."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.rows = []
+
+    def add(self, values):
+        self.rows.append(tuple(values.get(column) for column in self.columns))
+
+    def getRows(self):
+        return self.rows
+
+
+class Aggregation(object):
+    """Accumulates aggregates for each group of rows, without keeping the rows themselves."""
+
+    def __init__(self, groupColumns, aggregates):
+        self.groupColumns = groupColumns
+        self.aggregates = aggregates
+        # group key -> list of accumulators, one per aggregate
+        self.groups = {}
+
+    def add(self, values):
+        key = tuple(values.get(column) for column in self.groupColumns)
+        accumulators = self.groups.get(key)
+        if accumulators is None:
+            accumulators = [[0, 0, None, None] for aggregate in self.aggregates]
+            self.groups[key] = accumulators
+
+        # Each accumulator is [count, sum, min, max]
+        for accumulator, (function, column) in zip(accumulators, self.aggregates):
+            if column is None:
+                accumulator[0] += 1
+                continue
+            value = values.get(column)
+            if value is None:
+                continue
+            accumulator[0] += 1
+            if function == TopQuery.SUM or function == TopQuery.AVG:
+                accumulator[1] += value
+            elif function == TopQuery.MIN:
+                if accumulator[2] is None or value < accumulator[2]:
+                    accumulator[2] = value
+            elif function == TopQuery.MAX:
+                if accumulator[3] is None or value > accumulator[3]:
+                    accumulator[3] = value
+
+    def getRows(self):
+        rows = []
+        for key, accumulators in self.groups.items():
+            row = list(key)
+            for (count, total, minimum, maximum), (function, column) in zip(accumulators, self.aggregates):
+                if function == TopQuery.COUNT:
+                    row.append(count)
+                elif function == TopQuery.SUM:
+                    row.append(total)
+                elif function == TopQuery.AVG:
+                    row.append(float(total) / count if count else None)
+                elif function == TopQuery.MIN:
+                    row.append(minimum)
+                else:
+                    row.append(maximum)
+            rows.append(tuple(row))
+        return rows
+
+
+def getEntries(fileName, query):
+    """
+    :return: an iterable of the entries in fileName, which is either top output or JSON Lines written by
+             a JsonLinesSink. Header filters are passed down to the JSON Lines reader, so the jobs of
+             rejected entries are never built.
+    """
+    if fileName.endswith('.jsonl') or fileName.endswith('.json'):
+        return JsonLinesSink.readEntries(fileName, query.acceptHeader)
+    return TopParser(fileName).iterEntries()
+
+
+def getArgumentParser():
+    """:return: argparse.ArgumentParser - the parser of the query subcommand's options"""
+    examples = """
+    Examples:
+    # The 10 pids with the highest average resident memory between 02:00 and 03:00:
+        %prog query topOutput.log --between 02:00 03:00 --group-by pid command --agg avg:memResident \\
+            --order-by avg:memResident:desc --limit 10
+
+    # The maximum 1 minute load average per hour:
+        %prog query topOutput.log --group-by hour --agg "max:1 minute load" --order-by hour
+
+    # Every sample of a process's cpu, from a JSON Lines file written with --output:
+        %prog query top.jsonl --where "command=java" --select timestamp pid cpuPercent
+
+    """
+    parser = argparse.ArgumentParser(description="""This tool is used to query parsed output from the top command""",
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("fileName", type=str, help="File of top output or JSON Lines to query, or - for stdin")
+    parser.add_argument("--where", action='append', default=[],
+                        help="A filter such as 'memResident>=1000', 'user=root' or 'command~^java', may be repeated")
+    parser.add_argument("--between", nargs=2, metavar=('START', 'END'),
+                        help="Only include entries from START until END, as HH:MM[:SS] or 'YYYY-MM-DD HH:MM[:SS]'")
+    parser.add_argument("--select", nargs='+', default=[], help="Columns to output, for queries without aggregates")
+    parser.add_argument("--group-by", nargs='+', default=[], help="Columns to group by")
+    parser.add_argument("--agg", action='append', default=[],
+                        help="An aggregate such as 'avg:memResident' or 'count', may be repeated")
+    parser.add_argument("--order-by", action='append', default=[],
+                        help="A result column to order by, such as 'hour' or 'avg:memResident:desc', may be repeated")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of rows to output")
+    parser.add_argument("-v", "--verbose", action='store_true', help="True to enable verbose logging mode")
+    return parser
+
+
+def main(argv):
+    options = getArgumentParser().parse_args(argv)
+
+    if options.verbose:
+        logLevel = logging.DEBUG
+    else:
+        logLevel = logging.INFO
+
+    logging.basicConfig(level=logLevel)
+
+    logger.debug("Got options: {0}".format(options))
+
+    # Use the parse service if it's running, which has the file parsed already if it was used recently
+    client = None
+    if options.fileName != '-':
+        from parse_client import ParseClient
+        client = ParseClient.connect()
+
+    if client is not None:
+        try:
+            result = client.request('query', file=os.path.abspath(options.fileName), args=argv)
+        finally:
+            client.close()
+        columns, rows = result['columns'], result['rows']
+    else:
+        query = buildQuery(options)
+        columns, rows = query.getColumns(), query.run(getEntries(options.fileName, query))
+
+    sys.stdout.write('\t'.join(columns) + '\n')
+    for row in rows:
+        sys.stdout.write('\t'.join(str(value) for value in row) + '\n')
+
+
+RE_WHERE = re.compile(r'^(.+?)\s*(<=|>=|!=|=|<|>|~)\s*(.*)$')
+
+def buildQuery(options):
+    """Build a TopQuery from the command line options"""
+    query = TopQuery()
+    for where in options.where:
+        match = RE_WHERE.match(where)
+        if not match:
+            raise Exception("Could not parse filter: {0}".format(where))
+        query.where(*match.groups())
+
+    if options.between:
+        query.between(*options.between)
+    query.select(*options.select)
+    query.groupBy(*options.group_by)
+
+    for aggregate in options.agg:
+        function, _, column = aggregate.partition(':')
+        query.aggregate(function, column or None)
+
+    for orderBy in options.order_by:
+        descending = False
+        if orderBy.endswith(':desc') or orderBy.endswith(':asc'):
+            orderBy, direction = orderBy.rsplit(':', 1)
+            descending = direction == 'desc'
+        function, _, column = orderBy.partition(':')
+        if function in TopQuery.AGGREGATES and column:
+            orderBy = '{0}({1})'.format(function, column)
+        query.orderBy(orderBy, descending)
+
+    query.limit(options.limit)
+    return query
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])